@@ -2,17 +2,38 @@
 # CArray Namespace
 #------------------------------------------------------------------------
 
+# The minimum version of Numexpr required for the 'numexpr' vm
+min_numexpr_version = '1.4.1'
+
+# Check for numexpr
+numexpr_here = False
+try:
+    import numexpr
+except ImportError:
+    pass
+else:
+    if numexpr.__version__ >= min_numexpr_version:
+        numexpr_here = True
+
 # Print array functions (imported from NumPy)
 from arrayprint import (
     array2string, set_printoptions, get_printoptions)
 from carrayExtension import (
     carray,
     chunk,
+    _blosc_set_nthreads as blosc_set_nthreads,
     # _cparams as cparams,
-    # blosc_version, _blosc_set_nthreads as blosc_set_nthreads
+    # blosc_version,
     )
-from toplevel import cparams, open, zeros, ones, fromiter
+from toplevel import (
+    cparams, open, zeros, ones, fromiter, arange, eval,
+    detect_number_of_cores, set_nthreads)
+from defaults import defaults
+from ctable import ctable
+from views import ctableview
+from categorical import categorical
+from distinct import hll, count_distinct, unique
 from version import __version__
 
-# doesn't work for reasons I don't understand
-#from ctable import ctable
+# The number of cores in this system
+ncores = detect_number_of_cores()
@@ -0,0 +1,75 @@
+# Benchmark for the ingestion of wide ctables
+#
+# Reports the time for compressing every column on its own and for
+# building/appending the whole table (which compresses the columns
+# concurrently).
+#
+# Usage: python ctable-ingest.py [NROWS [NCOLS [ROOTDIR]]]
+#
+# If ROOTDIR is given, the tables are persisted there.
+#
+# Columns are compressed by a pool of ca.ncores threads, each calling the
+# re-entrant Blosc routines concurrently, so with N cores the whole table
+# should be built close to N times faster than the columns one by one
+# (the run warns if the speedup is below half of that).  On a single core
+# both timings are the same.
+
+import sys
+from time import time
+
+import numpy as np
+import blaze.carray as ca
+
+NROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000*1000
+NCOLS = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+ROOTDIR = sys.argv[3] if len(sys.argv) > 3 else None
+
+print "Ingesting %d rows x %d columns (%d cores)..." % (NROWS, NCOLS,
+                                                        ca.ncores)
+columns = {}
+for i in xrange(NCOLS):
+    if i % 3 == 0:
+        columns['i%d' % i] = np.arange(NROWS, dtype='i8') * i
+    elif i % 3 == 1:
+        columns['f%d' % i] = np.linspace(0, i, NROWS)
+    else:
+        columns['s%d' % i] = np.random.randint(0, 100, NROWS).astype('i4')
+nbytes = sum(col.nbytes for col in columns.itervalues())
+
+# Per-column timings
+print "** per-column compression"
+tserial = 0
+for name in sorted(columns):
+    t0 = time()
+    col = ca.carray(columns[name])
+    t = time() - t0
+    tserial += t
+    print "   %-5s: %.3f s (ratio: %.1fx)" % (name, t,
+                                              col.nbytes / float(col.cbytes))
+print "   total: %.3f s (%.1f MB/s)" % (tserial, nbytes / (tserial * 2**20))
+
+def check_speedup(t):
+    expected = min(ca.ncores, NCOLS) / 2.
+    if tserial / t < expected:
+        print "   WARNING: expected a speedup of at least %.1fx" % expected
+
+# Whole table
+print "** ctable from a dict of arrays"
+t0 = time()
+t = ca.ctable(columns, rootdir=ROOTDIR, mode='w')
+t.flush()
+t = time() - t0
+print "   %.3f s (%.1f MB/s, %.1fx vs serial)" % (
+    t, nbytes / (t * 2**20), tserial / t)
+check_speedup(t)
+
+print "** ctable.append() of a dict of arrays"
+table = ca.ctable(dict((name, col[:0]) for name, col in columns.iteritems()),
+                  expectedlen=NROWS, rootdir=ROOTDIR, mode='w')
+t0 = time()
+table.append(columns)
+table.flush()
+t = time() - t0
+print "   %.3f s (%.1f MB/s, %.1fx vs serial)" % (
+    t, nbytes / (t * 2**20), tserial / t)
+check_speedup(t)
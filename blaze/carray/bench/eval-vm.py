@@ -0,0 +1,42 @@
+# Benchmark for comparing the virtual machines of carray.eval()
+#
+# Usage: python eval-vm.py [N]
+
+import sys
+from time import time
+
+import numpy as np
+import blaze.carray as ca
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 10*1000*1000
+NREPS = 3
+
+expressions = [
+    "a + b",
+    "2*a + 3*b - 1",
+    "sin(a) * cos(b) + sqrt(abs(a - b))",
+    "(a > 10) & (b < 1000)",
+    "sum(a * b)",
+    ]
+
+vms = ["python", "ufunc"]
+if ca.numexpr_here:
+    vms.append("numexpr")
+
+a = ca.carray(np.linspace(0, 1, N))
+b = ca.carray(np.arange(N, dtype='f8'))
+print "Evaluating with N=%d (best of %d)..." % (N, NREPS)
+
+for expr in expressions:
+    print "** expression: '%s'" % expr
+    for vm in vms:
+        if vm == "python" and "sin(" in expr:
+            # The 'python' vm does not know about math functions
+            continue
+        best = 1e300
+        for i in xrange(NREPS):
+            t0 = time()
+            ca.eval(expr, vm=vm)
+            best = min(best, time() - t0)
+        print "   %-8s: %.3f s (%.1f MB/s)" % (
+            vm, best, 2 * N * 8 / (best * 2**20))
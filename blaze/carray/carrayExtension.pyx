@@ -16,6 +16,8 @@ import struct
 import shutil
 import tempfile
 import json
+import thread
+import threading
 import cython
 
 
@@ -44,6 +46,16 @@ SizeType = np.int64
 # The native int type for this platform
 IntType = np.dtype(np.int_)
 
+# Blosc keeps the parameters of blosc_compress() and blosc_decompress()
+# (and its own pool of threads) in global state, so only the thread that
+# imported this module calls them.  Other threads (e.g. the ones building
+# ctable columns) call the re-entrant *_ctx() versions, which compress in
+# the calling thread, concurrently and without locking.  Each of these
+# threads has its own context (see `_thread_context()`), so that the
+# temporaries are not allocated on every call.
+_blosc_owner = thread.get_ident()
+_contexts = threading.local()
+
 #-----------------------------------------------------------------
 
 # numpy functions & objects
@@ -72,7 +84,18 @@ cdef extern from "blosc.h":
                      size_t nbytes, void *src, void *dest,
                      size_t destsize) nogil
   int blosc_decompress(void *src, void *dest, size_t destsize) nogil
+  cdef struct blosc_context:
+    pass
+  blosc_context *blosc_create_context()
+  void blosc_free_context(blosc_context *ctx)
+  int blosc_compress_ctx(blosc_context *ctx, int clevel, int doshuffle,
+                         size_t typesize, size_t nbytes, void *src,
+                         void *dest, size_t destsize) nogil
+  int blosc_decompress_ctx(blosc_context *ctx, void *src, void *dest,
+                           size_t destsize) nogil
   int blosc_getitem(void *src, int start, int nitems, void *dest) nogil
+  int blosc_getitem_ctx(blosc_context *ctx, void *src, int start,
+                        int nitems, void *dest) nogil
   void blosc_free_resources()
   void blosc_cbuffer_sizes(void *cbuffer, size_t *nbytes,
                            size_t *cbytes, size_t *blocksize)
@@ -92,6 +115,28 @@ import_array()
 #-------------------------------------------------------------
 
 # Some utilities
+cdef class _context:
+  """The Blosc context of a thread (freed when the thread ends)."""
+  cdef blosc_context *ctx
+
+  def __cinit__(self):
+    self.ctx = blosc_create_context()
+
+  def __dealloc__(self):
+    blosc_free_context(self.ctx)
+
+cdef blosc_context *_thread_context() except? NULL:
+  """Return the Blosc context of the calling thread, or NULL for the
+  thread owning the Blosc global state."""
+  cdef _context context
+
+  if thread.get_ident() == _blosc_owner:
+    return NULL
+  context = getattr(_contexts, 'context', None)
+  if context is None:
+    context = _contexts.context = _context()
+  return context.ctx
+
 def _blosc_set_nthreads(nthreads):
   """
   blosc_set_nthreads(nthreads)
@@ -254,6 +299,7 @@ cdef class chunk:
     """Compress data in `array` and put it in ``self.data``"""
     cdef size_t nbytes, cbytes, blocksize, itemsize, footprint
     cdef int clevel, shuffle
+    cdef blosc_context *ctx
     cdef char *dest
 
     # Compute the total number of bytes in this array
@@ -299,9 +345,15 @@ cdef class chunk:
       dest = <char *>malloc(nbytes+BLOSC_MAX_OVERHEAD)
       clevel = cparams.clevel
       shuffle = cparams.shuffle
+      ctx = _thread_context()
       with nogil:
-        cbytes = blosc_compress(clevel, shuffle, itemsize, nbytes,
-                                array.data, dest, nbytes+BLOSC_MAX_OVERHEAD)
+        if ctx != NULL:
+          cbytes = blosc_compress_ctx(ctx, clevel, shuffle, itemsize, nbytes,
+                                      array.data, dest,
+                                      nbytes+BLOSC_MAX_OVERHEAD)
+        else:
+          cbytes = blosc_compress(clevel, shuffle, itemsize, nbytes,
+                                  array.data, dest, nbytes+BLOSC_MAX_OVERHEAD)
       if cbytes <= 0:
         raise RuntimeError, "fatal error during Blosc compression: %d" % cbytes
       # Free the unused data
@@ -323,6 +375,7 @@ cdef class chunk:
   cdef void _getitem(self, int start, int stop, char *dest):
     """Read data from `start` to `stop` and return it as a numpy array."""
     cdef int ret, bsize, blen, nitems, nstart
+    cdef blosc_context *ctx
     cdef ndarray constants
 
     blen = stop - start
@@ -338,11 +391,17 @@ cdef class chunk:
       return
 
     # Fill dest with uncompressed data
+    ctx = _thread_context()
     with nogil:
-      if bsize == self.nbytes:
-        ret = blosc_decompress(self.data, dest, bsize)
+      if bsize != self.nbytes:
+        if ctx != NULL:
+          ret = blosc_getitem_ctx(ctx, self.data, nstart, nitems, dest)
+        else:
+          ret = blosc_getitem(self.data, nstart, nitems, dest)
+      elif ctx != NULL:
+        ret = blosc_decompress_ctx(ctx, self.data, dest, bsize)
       else:
-        ret = blosc_getitem(self.data, nstart, nitems, dest)
+        ret = blosc_decompress(self.data, dest, bsize)
     if ret < 0:
       raise RuntimeError, "fatal error during Blosc decompression: %d" % ret
 
@@ -551,6 +610,7 @@ cdef class chunks(object):
     cdef size_t chunksize
     cdef object scomp
     cdef int ret
+    cdef blosc_context *ctx
     cdef int itemsize, atomsize
 
     self._rootdir = rootdir
@@ -569,8 +629,12 @@ cdef class chunks(object):
         # Fill lastchunk with data on disk
         scomp = self.read_chunk(self.nchunks)
         compressed = PyString_AsString(scomp)
+        ctx = _thread_context()
         with nogil:
-          ret = blosc_decompress(compressed, lastchunk, chunksize)
+          if ctx != NULL:
+            ret = blosc_decompress_ctx(ctx, compressed, lastchunk, chunksize)
+          else:
+            ret = blosc_decompress(compressed, lastchunk, chunksize)
         if ret < 0:
           raise RuntimeError(
             "error decompressing the last chunk (error code: %d)" % ret)
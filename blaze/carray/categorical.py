@@ -0,0 +1,359 @@
+"""Dictionary-encoded (categorical) columns.
+
+A categorical column stores every distinct value (category) only once,
+in a dictionary, and an integer code per row in a carray.  This saves a
+lot of space for low-cardinality string columns, whose values would
+otherwise be padded to the longest one, and lets equality predicates
+and group-bys work on the integer codes.
+"""
+
+import sys
+import ast
+import shutil
+import tokenize
+import itertools as it
+from cStringIO import StringIO
+import os, os.path
+
+import numpy as np
+
+import utils
+
+# See the note in toplevel.py about importing the package here
+ca = sys.modules['blaze.carray']
+
+CODESDIR = 'codes'
+CATEGORIESFILE = '__categories__.npy'
+
+# The type of the codes.  The unused high bytes of small codes are almost
+# free once shuffled and compressed.
+CODETYPE = np.dtype(np.int32)
+
+
+class categorical(object):
+    """
+    categorical(values=None, categories=None, rootdir=None, mode='a',
+                **kwargs)
+
+    A dictionary-encoded column.
+
+    Parameters
+    ----------
+    values : sequence or NumPy array
+        The values of the column.  If None, the categorical is opened from
+        `rootdir`.
+    categories : sequence or NumPy array, optional
+        The initial categories.  Values not found here are added as new
+        categories.  The default is the sorted distinct `values`.
+    rootdir : string
+        The directory where the codes and categories are stored.
+    mode : string
+        The mode in which the object is created/opened ('r', 'w' or 'a').
+    kwargs : list of parameters or dictionary
+        Any parameter supported by the carray constructor, which is used
+        for the carray of codes.
+
+    """
+
+    @property
+    def cbytes(self):
+        "The compressed size of this object (in bytes)."
+        return self.codes.cbytes + self.categories.nbytes
+
+    @property
+    def chunklen(self):
+        "The chunklen of the codes."
+        return self.codes.chunklen
+
+    @property
+    def cparams(self):
+        "The compression parameters of the codes."
+        return self.codes.cparams
+
+    @property
+    def dflt(self):
+        "The default value (the first category)."
+        if len(self.categories) == 0:
+            return self.categories.dtype.type()
+        return self.categories[0]
+
+    @property
+    def dtype(self):
+        "The data type of the values (numpy dtype)."
+        return self.categories.dtype
+
+    @property
+    def nbytes(self):
+        "The original (uncompressed) size of this object (in bytes)."
+        return len(self) * self.dtype.itemsize
+
+    @property
+    def ndim(self):
+        "The number of dimensions of this object."
+        return 1
+
+    @property
+    def shape(self):
+        "The shape of this object."
+        return (len(self),)
+
+    def __init__(self, values=None, categories=None, rootdir=None, mode='a',
+                 **kwargs):
+        self.rootdir = rootdir
+        "The directory where this object is saved."
+        self.mode = mode
+        if values is None:
+            self._open()
+            return
+        if self.rootdir:
+            self._mkdir_rootdir()
+            kwargs['rootdir'] = os.path.join(self.rootdir, CODESDIR)
+        values = np.asarray(values)
+        if categories is None:
+            self.categories, codes = np.unique(values, return_inverse=True)
+            self._lookup = dict((v, i) for i, v in
+                                enumerate(self.categories.tolist()))
+        else:
+            self.categories = np.asarray(categories)
+            self._lookup = dict((v, i) for i, v in
+                                enumerate(self.categories.tolist()))
+            codes = self.encode(values)
+        self.codes = ca.carray(codes.astype(CODETYPE), **kwargs)
+        "The carray with the codes."
+        self._write_categories()
+
+    def _mkdir_rootdir(self):
+        if os.path.exists(self.rootdir):
+            if self.mode != "w":
+                raise RuntimeError(
+                    "specified rootdir path '%s' already exists "
+                    "and creation mode is '%s'" % (self.rootdir, self.mode))
+            shutil.rmtree(self.rootdir)
+        os.mkdir(self.rootdir)
+
+    def _open(self):
+        if not self.rootdir:
+            raise ValueError(
+                "you need to pass either `values` or a `rootdir` param")
+        catfile = os.path.join(self.rootdir, CATEGORIESFILE)
+        if not os.path.isfile(catfile):
+            raise IOError("no categorical found in '%s'" % self.rootdir)
+        self.categories = np.load(catfile)
+        self._lookup = dict((v, i) for i, v in
+                            enumerate(self.categories.tolist()))
+        self.codes = ca.carray(rootdir=os.path.join(self.rootdir, CODESDIR),
+                               mode=self.mode)
+
+    def _write_categories(self):
+        if not self.rootdir:
+            return
+        with open(os.path.join(self.rootdir, CATEGORIESFILE), 'wb') as cfile:
+            np.save(cfile, self.categories)
+
+    def lookup(self, values):
+        """
+        lookup(values)
+
+        Return the codes of `values` (a scalar or a sequence), with -1 for
+        the values that are not categories.
+
+        """
+        if np.isscalar(values):
+            return self._lookup.get(values, -1)
+        return np.array([self._lookup.get(v, -1)
+                         for v in np.asarray(values).tolist()],
+                        dtype=CODETYPE)
+
+    def encode(self, values):
+        """
+        encode(values)
+
+        Return the codes for `values`, adding the new categories.
+
+        """
+        values = np.asarray(values)
+        uniq, inverse = np.unique(values, return_inverse=True)
+        ucodes = self.lookup(uniq)
+        new = ucodes < 0
+        if new.any():
+            if self.rootdir and self.mode == 'r':
+                raise IOError(
+                    "Cannot add categories when in 'r'ead-only mode")
+            ncats = len(self.categories)
+            ucodes[new] = np.arange(ncats, ncats + new.sum())
+            self._lookup.update(zip(uniq[new].tolist(),
+                                    range(ncats, ncats + new.sum())))
+            dtype = np.promote_types(self.categories.dtype, uniq.dtype)
+            self.categories = np.concatenate(
+                (self.categories.astype(dtype), uniq[new].astype(dtype)))
+            self._write_categories()
+        if values.ndim == 0:
+            return ucodes[inverse[0]]
+        return ucodes[inverse].reshape(values.shape)
+
+    def decode(self, codes):
+        """
+        decode(codes)
+
+        Return the values for `codes`.
+
+        """
+        return self.categories[codes]
+
+    def append(self, values):
+        """
+        append(values)
+
+        Append `values` to this object.
+
+        """
+        if isinstance(values, categorical):
+            values = values[:]
+        self.codes.append(self.encode(values))
+
+    def trim(self, nitems):
+        """
+        trim(nitems)
+
+        Remove the trailing `nitems` from this instance.
+
+        """
+        self.codes.trim(nitems)
+
+    def resize(self, nitems):
+        """
+        resize(nitems)
+
+        Resize the instance to have `nitems` (new items get the `dflt`).
+
+        """
+        self.codes.resize(nitems)
+
+    def copy(self, **kwargs):
+        """
+        copy(**kwargs)
+
+        Return a copy of this object.
+
+        """
+        rootdir = kwargs.pop('rootdir', None)
+        mode = kwargs.pop('mode', 'a')
+        ccopy = categorical(np.empty(0, self.dtype), self.categories,
+                            rootdir=rootdir, mode=mode, **kwargs)
+        ccopy.codes.append(self.codes)
+        ccopy.codes.flush()
+        return ccopy
+
+    def flush(self):
+        """Flush data in internal buffers to disk."""
+        self.codes.flush()
+        self._write_categories()
+
+    def iter(self, start=0, stop=None, step=1, limit=None, skip=0):
+        """
+        iter(start=0, stop=None, step=1, limit=None, skip=0)
+
+        Iterator with `start`, `stop` and `step` bounds.
+
+        """
+        return it.imap(self.categories.__getitem__,
+                       self.codes.iter(start, stop, step, limit, skip))
+
+    def where(self, boolarr, limit=None, skip=0):
+        """
+        where(boolarr, limit=None, skip=0)
+
+        Iterator that returns values where `boolarr` is true.
+
+        """
+        return it.imap(self.categories.__getitem__,
+                       self.codes.where(boolarr, limit, skip))
+
+    def _getrange(self, start, blen, out):
+        out[:] = self.decode(self.codes[start:start+blen])
+
+    def __iter__(self):
+        return self.iter()
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, key):
+        return self.categories[self.codes[key]]
+
+    def __setitem__(self, key, value):
+        self.codes[key] = self.encode(value)
+
+    def __str__(self):
+        return str(self[:])
+
+    def __repr__(self):
+        snbytes = utils.human_readable_size(self.nbytes)
+        scbytes = utils.human_readable_size(self.cbytes)
+        header = "categorical(%s, %s)\n" % (self.shape, self.dtype)
+        header += "  nbytes: %s; cbytes: %s; ncategories: %d\n" % (
+            snbytes, scbytes, len(self.categories))
+        if self.rootdir:
+            header += "  rootdir := '%s'\n" % self.rootdir
+        return header + str(self)
+
+
+def is_categorical(rootdir):
+    """Tell whether `rootdir` hosts a categorical object."""
+    return os.path.isfile(os.path.join(rootdir, CATEGORIESFILE))
+
+
+def rewrite(expression, cols):
+    """
+    rewrite(expression, cols)
+
+    Rewrite the comparisons of categorical columns in `expression`.
+
+    ``col == 'value'`` and ``col != 'value'`` (with the literal on any
+    side) are rewritten into comparisons of codes.  Returns the new
+    expression and a dictionary mapping the names of the categorical
+    columns to their codes.  Columns that also appear in other
+    operations (e.g. ``col > 'value'``) are not rewritten and are mapped
+    to themselves, so that their values are decoded during evaluation.
+
+    """
+    tokens = [tok[:2] for tok in
+              tokenize.generate_tokens(StringIO(expression).readline)]
+    names = set(name for toktype, name in tokens
+                if toktype == tokenize.NAME and name in cols and
+                isinstance(cols[name], categorical))
+    if not names:
+        return expression, {}
+    # The positions of the literals compared for (in)equality with every
+    # occurrence of the columns
+    literals = {}
+    decoded = set()
+    for i, (toktype, tokstr) in enumerate(tokens):
+        if toktype != tokenize.NAME or tokstr not in names:
+            continue
+        if (i+2 < len(tokens) and tokens[i+1][1] in ('==', '!=') and
+            tokens[i+2][0] == tokenize.STRING):
+            literals[i+2] = tokstr
+        elif (i >= 2 and tokens[i-1][1] in ('==', '!=') and
+              tokens[i-2][0] == tokenize.STRING):
+            literals[i-2] = tokstr
+        else:
+            decoded.add(tokstr)
+    out = []
+    for i, (toktype, tokstr) in enumerate(tokens):
+        if i in literals and literals[i] not in decoded:
+            code = cols[literals[i]].lookup(ast.literal_eval(tokstr))
+            out.append((tokenize.NUMBER, str(code)))
+        else:
+            out.append((toktype, tokstr))
+    return (tokenize.untokenize(out).strip(),
+            dict((name, cols[name] if name in decoded else cols[name].codes)
+                 for name in names))
+
+
+## Local Variables:
+## mode: python
+## py-indent-offset: 4
+## tab-width: 4
+## fill-column: 78
+## End:
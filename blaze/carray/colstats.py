@@ -0,0 +1,290 @@
+"""Statistics of ctable columns.
+
+For every column, the catalog keeps the number of rows, the minimum and
+maximum values, the number of nulls (NaN or NaT), an estimate of the
+number of distinct values (a HyperLogLog sketch) and, for numerical
+columns, an equi-width histogram.  All of them can be updated with new
+rows without looking at the old ones, so appends only cost the scan of
+the appended rows.  The histogram keeps a fixed number of buckets:
+when new values fall out of its range, the width of the buckets is
+doubled by merging pairs of them.
+
+The statistics are meant for estimating the selectivity of predicates
+(see `colstats.selectivity()`) without scanning any data.
+"""
+
+import json
+import base64
+import os, os.path
+
+import numpy as np
+
+import distinct
+
+STATSFILE = '__stats__'
+
+# The number of buckets of the histograms
+NBINS = 64
+
+# The precision of the distinct sketches (3% of error, 1 KB per column)
+PRECISION = 10
+
+# The selectivity of range predicates on columns without histograms
+_DEFAULT_RANGE = 1. / 3
+
+
+def _numeric(dtype):
+    return dtype.kind in 'biufmM'
+
+
+def _encode(value, dtype):
+    """Return `value` of `dtype` as a JSON-serializable object."""
+    if value is None:
+        return None
+    if dtype.kind in 'mM':
+        return int(np.asarray(value, dtype=dtype).view(np.int64))
+    return np.asarray(value, dtype=dtype).tolist()
+
+
+def _decode(value, dtype):
+    """The reverse of `_encode()`."""
+    if value is None:
+        return None
+    if dtype.kind in 'mM':
+        return np.array(value, dtype=np.int64).view(dtype)[()]
+    return np.array(value, dtype=dtype)[()]
+
+
+class colstats(object):
+    """
+    colstats(dtype)
+
+    The statistics of a column of `dtype` values.
+
+    """
+
+    @property
+    def ndv(self):
+        "The estimated number of distinct (non-null) values."
+        return min(self.sketch.estimate(), self.rows - self.nulls)
+
+    @property
+    def histogram(self):
+        "The (counts, edges) of the histogram (None if not numerical)."
+        if self.counts is None:
+            return None
+        edges = self.lo + self.width * np.arange(NBINS + 1)
+        return self.counts, edges
+
+    def __init__(self, dtype):
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        "The number of rows."
+        self.nulls = 0
+        "The number of nulls (NaN or NaT values)."
+        self.min = None
+        "The minimum value (None if there are no values)."
+        self.max = None
+        "The maximum value (None if there are no values)."
+        self.sketch = distinct.hll(PRECISION)
+        self.counts, self.lo, self.width = None, None, None
+
+    def update(self, values):
+        """
+        update(values)
+
+        Take the new rows in the `values` array into account.
+
+        """
+        values = np.asarray(values)
+        self.rows += len(values)
+        if self.dtype.kind == 'f':
+            nulls = np.isnan(values)
+        elif self.dtype.kind in 'mM':
+            nulls = np.isnat(values)
+        else:
+            nulls = None
+        if nulls is not None and nulls.any():
+            self.nulls += int(nulls.sum())
+            values = values[~nulls]
+        if len(values) == 0:
+            return
+        self.sketch.add(values)
+        if _numeric(self.dtype):
+            vmin, vmax = values.min(), values.max()
+            self._add_to_histogram(values)
+        else:
+            uniq = np.unique(values)
+            vmin, vmax = uniq[0], uniq[-1]
+        if self.min is None or vmin < self.min:
+            self.min = vmin
+        if self.max is None or vmax > self.max:
+            self.max = vmax
+
+    def _floats(self, values):
+        if self.dtype.kind in 'mM':
+            values = values.view(np.int64)
+        return values.astype(np.float64)
+
+    def _add_to_histogram(self, values):
+        x = self._floats(values)
+        lo, hi = x.min(), x.max()
+        if self.counts is None:
+            self.counts = np.zeros(NBINS, dtype=np.int64)
+            self.lo = lo
+            # Make room for `hi` in the last bucket
+            self.width = (hi - lo) * (1 + 1e-9) / NBINS if hi > lo else 1.
+        while lo < self.lo:
+            # Double the width of the buckets, extending the range down
+            pairs = self.counts.reshape(-1, 2).sum(axis=1)
+            self.counts = np.concatenate((np.zeros_like(pairs), pairs))
+            self.lo -= self.width * NBINS
+            self.width *= 2
+        while hi >= self.lo + self.width * NBINS:
+            # Double the width of the buckets, extending the range up
+            pairs = self.counts.reshape(-1, 2).sum(axis=1)
+            self.counts = np.concatenate((pairs, np.zeros_like(pairs)))
+            self.width *= 2
+        bins = ((x - self.lo) / self.width).astype(np.intp)
+        np.clip(bins, 0, NBINS - 1, out=bins)
+        self.counts += np.bincount(bins, minlength=NBINS)
+
+    def _fraction(self, lo, hi):
+        """The fraction of non-null values in the [lo, hi] interval."""
+        if self.counts is None:
+            return _DEFAULT_RANGE
+        total = float(self.counts.sum())
+        def below(v):
+            # The number of values under `v`, interpolating linearly
+            # within its bucket
+            pos = np.clip((v - self.lo) / self.width, 0, NBINS)
+            nbin = int(pos)
+            count = self.counts[:nbin].sum()
+            if nbin < NBINS:
+                count += self.counts[nbin] * (pos - nbin)
+            return count
+        clo = 0. if lo is None else below(lo)
+        chi = total if hi is None else below(hi)
+        return max(chi - clo, 0.) / total
+
+    def selectivity(self, pred):
+        """
+        selectivity(pred)
+
+        Estimate the fraction of rows satisfying the predicate `pred`.
+
+        Parameters
+        ----------
+        pred : tuple
+            Either ``('in', values)`` or ``('range', lo, loincl, hi,
+            hiincl)``, where `lo` or `hi` can be None for open ranges.
+
+        Returns
+        -------
+        out : float
+            A number between 0 and 1.
+
+        """
+        if self.rows == 0:
+            return 0.
+        nonnull = (self.rows - self.nulls) / float(self.rows)
+        if self.min is None:
+            return 0.
+        if pred[0] == 'in':
+            values = [v for v in np.atleast_1d(pred[1]).tolist()
+                      if self._within(v, v)]
+            return min(nonnull * len(values) / max(self.ndv, 1), nonnull)
+        lo, loincl, hi, hiincl = pred[1:]
+        if not self._within(lo, hi):
+            return 0.
+        if not _numeric(self.dtype):
+            return nonnull * _DEFAULT_RANGE
+        if self.dtype.kind in 'mM':
+            lo = None if lo is None else float(
+                np.asarray(lo, dtype=self.dtype).view(np.int64))
+            hi = None if hi is None else float(
+                np.asarray(hi, dtype=self.dtype).view(np.int64))
+        if lo is not None and lo == hi:
+            # Closed ranges on a single value are equalities
+            return nonnull / max(self.ndv, 1)
+        if self.dtype.kind != 'f':
+            # Integral values: make the bounds cover whole units
+            if lo is not None and not loincl:
+                lo = np.floor(lo) + 1
+            if hi is not None and hiincl:
+                hi = np.floor(hi) + 1
+        return nonnull * self._fraction(lo, hi)
+
+    def _within(self, lo, hi):
+        """Tell whether [lo, hi] overlaps with [min, max]."""
+        try:
+            return ((lo is None or lo <= self.max) and
+                    (hi is None or hi >= self.min))
+        except TypeError:
+            return True
+
+    def todict(self):
+        """Return the statistics as a JSON-serializable dictionary."""
+        data = {'dtype': self.dtype.str, 'rows': self.rows,
+                'nulls': self.nulls,
+                'min': _encode(self.min, self.dtype),
+                'max': _encode(self.max, self.dtype),
+                'sketch': base64.b64encode(self.sketch.registers.tostring())}
+        if self.counts is not None:
+            data.update(counts=self.counts.tolist(), lo=self.lo,
+                        width=self.width)
+        return data
+
+    @classmethod
+    def fromdict(cls, data):
+        """Return the statistics in the `data` dictionary."""
+        self = cls(str(data['dtype']))
+        self.rows, self.nulls = data['rows'], data['nulls']
+        self.min = _decode(data['min'], self.dtype)
+        self.max = _decode(data['max'], self.dtype)
+        registers = np.fromstring(base64.b64decode(data['sketch']),
+                                  dtype=np.uint8)
+        self.sketch = distinct.hll(PRECISION, registers)
+        if 'counts' in data:
+            self.counts = np.array(data['counts'], dtype=np.int64)
+            self.lo, self.width = data['lo'], data['width']
+        return self
+
+    def __repr__(self):
+        return "colstats(rows=%d, min=%r, max=%r, nulls=%d, ndv=%d)" % (
+            self.rows, self.min, self.max, self.nulls, self.ndv)
+
+
+def read_stats(rootdir):
+    """Return the dictionary of statistics persisted in `rootdir`."""
+    if not rootdir:
+        return {}
+    statsfile = os.path.join(rootdir, STATSFILE)
+    if not os.path.isfile(statsfile):
+        return {}
+    with open(statsfile, 'rb') as sfile:
+        data = json.loads(sfile.read())
+    return dict((str(name), colstats.fromdict(value))
+                for name, value in data.items())
+
+
+def write_stats(rootdir, stats):
+    """Persist the dictionary of `stats` in `rootdir`."""
+    data = dict((name, value.todict()) for name, value in stats.items())
+    with open(os.path.join(rootdir, STATSFILE), 'wb') as sfile:
+        sfile.write(json.dumps(data))
+        sfile.write("\n")
+
+
+def remove_stats(rootdir):
+    """Remove the statistics persisted in `rootdir`."""
+    if rootdir and os.path.isfile(os.path.join(rootdir, STATSFILE)):
+        os.remove(os.path.join(rootdir, STATSFILE))
+
+
+## Local Variables:
+## mode: python
+## py-indent-offset: 4
+## tab-width: 4
+## fill-column: 78
+## End:
@@ -9,26 +9,97 @@
 import sys, math
 
 import numpy as np
-import blaze.carray as ca
 import itertools as it
 from collections import namedtuple
 import json
 import os, os.path
 import shutil
+from multiprocessing.pool import ThreadPool
 
 # carray utilities
-import utils, attrs, arrayprint
+import utils, attrs, arrayprint, indexes, groupby, join, categorical
+import zonemaps, topk, distinct, colstats
+
+# See the note in toplevel.py about importing the package here
+ca = sys.modules['blaze.carray']
 
 ROOTDIRS = '__rootdirs__'
 
+# Columns are compressed by a pool of threads when more than this number
+# of bytes are added to a table with several columns
+PARALLEL_NBYTES = 2**20
+
+_pool = None
+
+def _map_columns(func, args, nbytes):
+    """Return ``map(func, args)``, computed in threads if worth it."""
+    global _pool
+    if len(args) < 2 or ca.ncores < 2 or nbytes < PARALLEL_NBYTES:
+        return map(func, args)
+    if _pool is None:
+        _pool = ThreadPool(ca.ncores)
+    return _pool.map(func, args)
+
+def _nbytes(obj):
+    """The (uncompressed) number of bytes in `obj`."""
+    return getattr(obj, 'nbytes', 0)
+
+def _rowid_blocks(selection, blen, skip=0, limit=None):
+    """Iterate over blocks of (about) `blen` sorted row ids.
+
+    `selection` is either a boolean array/carray or a sorted array of
+    row ids.  The row ids of a boolean carray are computed chunk by
+    chunk, so they never have to fit in memory.
+    """
+    if limit is not None and limit <= 0:
+        return
+    if selection.dtype.kind != 'b':
+        stop = None if limit is None else skip + limit
+        selection = selection[skip:stop]
+        for i in xrange(0, len(selection), blen):
+            yield selection[i:i + blen]
+        return
+    pending, npending = [], 0
+    bsize = getattr(selection, 'chunklen', blen)
+    for i in xrange(0, len(selection), bsize):
+        rowids = np.flatnonzero(selection[i:i + bsize]) + i
+        if skip:
+            if len(rowids) <= skip:
+                skip -= len(rowids)
+                continue
+            rowids, skip = rowids[skip:], 0
+        if limit is not None:
+            rowids = rowids[:limit]
+            limit -= len(rowids)
+        pending.append(rowids)
+        npending += len(rowids)
+        if npending >= blen or limit == 0:
+            yield np.concatenate(pending)
+            pending, npending = [], 0
+            if limit == 0:
+                return
+    if npending:
+        yield np.concatenate(pending)
+
 class cols(object):
-    """Class for accessing the columns on the ctable object."""
+    """Class for accessing the columns on the ctable object.
+
+    The columns of a ctable on-disk are opened lazily, the first time
+    they are accessed.  The names, kinds and dtypes of the columns, as
+    well as the length of the table, are kept in a single meta file so
+    that opening a table with many columns is cheap.
+    """
 
     def __init__(self, rootdir, mode):
         self.rootdir = rootdir
         self.mode = mode
         self.names = []
+        self.len = None
+        "The length recorded in the meta file (None if unknown)."
         self._cols = {}
+        self._dirs = {}
+        self._kinds = {}
+        self._dtypes = {}
 
     def read_meta_and_open(self):
         """Read the meta-information and initialize structures."""
@@ -38,31 +109,87 @@ class cols(object):
             data = json.loads(rfile.read())
         # JSON returns unicode (?)
         self.names = [str(name) for name in data['names']]
-        # Initialize the cols by instatiating the carrays
-        for name, dir_ in data['dirs'].items():
-            self._cols[str(name)] = ca.carray(rootdir=dir_, mode=self.mode)
+        self._dirs = dict((str(name), str(dir_))
+                          for name, dir_ in data['dirs'].items())
+        # Older meta files only have the names and the directories
+        self._kinds = dict((str(name), str(kind))
+                           for name, kind in data.get('kinds', {}).items())
+        self._dtypes = dict((str(name), np.dtype(str(dtype)))
+                            for name, dtype in data.get('dtypes', {}).items())
+        self.len = data.get('len')
+
+    def _open(self, name):
+        """Open the column `name` on-disk."""
+        dir_ = self._dirs[name]
+        kind = self._kinds.get(name)
+        if kind is None:
+            kind = 'categorical' if categorical.is_categorical(dir_) \
+                   else 'carray'
+        if kind == 'categorical':
+            col = ca.categorical(rootdir=dir_, mode=self.mode)
+        else:
+            col = ca.carray(rootdir=dir_, mode=self.mode)
+        self._cols[name] = col
+        return col
 
-    def update_meta(self):
+    def update_meta(self, length=None):
         """Update metainfo about directories on-disk."""
-        if not self.rootdir:
+        if length is not None:
+            self.len = length
+        if not self.rootdir or self.mode == 'r':
             return
-        dirs = dict((n, o.rootdir) for n,o in self._cols.items())
-        data = {'names': self.names, 'dirs': dirs}
+        data = {'names': self.names, 'dirs': self._dirs,
+                'kinds': dict((n, self.kind(n)) for n in self.names),
+                'dtypes': dict((n, self.dtype(n).str) for n in self.names)}
+        if self.len is not None:
+            data['len'] = self.len
         rootsfile = os.path.join(self.rootdir, ROOTDIRS)
         with open(rootsfile, 'wb') as rfile:
             rfile.write(json.dumps(data))
             rfile.write("\n")
 
+    def kind(self, name):
+        """The kind ('carray' or 'categorical') of the column `name`."""
+        if name not in self._cols and name in self._kinds:
+            return self._kinds[name]
+        if type(self[name]) is ca.categorical:
+            return 'categorical'
+        return 'carray'
+
+    def dtype(self, name):
+        """The dtype of the column `name` (without opening it if possible)."""
+        if name in self._cols:
+            return self._cols[name].dtype
+        if name in self._dtypes:
+            return self._dtypes[name]
+        return self[name].dtype
+
+    def opened(self):
+        """Return the columns that have been opened, in order."""
+        return [self._cols[name] for name in self.names if name in self._cols]
+
     def __getitem__(self, name):
-        return self._cols[name]
+        try:
+            return self._cols[name]
+        except KeyError:
+            if name not in self._dirs:
+                raise
+            return self._open(name)
 
     def __setitem__(self, name, carray):
         self.names.append(name)
-        self._cols[name] = carray
+        self._set(name, carray)
         self.update_meta()
 
+    def _set(self, name, carray):
+        self._cols[name] = carray
+        self._dirs[name] = carray.rootdir
+
+    def __contains__(self, name):
+        return name in self.names
+
     def __iter__(self):
-        return iter(self._cols)
+        return iter(self.names)
 
     def __len__(self):
         return len(self.names)
@@ -70,27 +197,30 @@ class cols(object):
     def insert(self, name, pos, carray):
         """Insert carray in the specified pos and name."""
         self.names.insert(pos, name)
-        self._cols[name] = carray
+        self._set(name, carray)
         self.update_meta()
 
     def pop(self, name):
         """Return the named column and remove it."""
         pos = self.names.index(name)
         name = self.names.pop(pos)
-        col = self._cols[name]
+        col = self[name]
+        del self._cols[name], self._dirs[name]
+        self._kinds.pop(name, None)
+        self._dtypes.pop(name, None)
         self.update_meta()
         return col
 
     def __str__(self):
         fullrepr = ""
         for name in self.names:
-            fullrepr += "%s : %s" % (name, str(self._cols[name]))
+            fullrepr += "%s : %s" % (name, str(self[name]))
         return fullrepr
 
     def __repr__(self):
         fullrepr = ""
         for name in self.names:
-            fullrepr += "%s : %s\n" % (name, repr(self._cols[name]))
+            fullrepr += "%s : %s\n" % (name, repr(self[name]))
         return fullrepr
 
 
@@ -107,7 +237,8 @@ class ctable(object):
     columns : tuple or list of column objects
         The list of column data to build the ctable object.  This can also be
         a pure NumPy structured array.  A list of lists or tuples is valid
-        too, as long as they can be converted into carray objects.
+        too, as long as they can be converted into carray objects.  Columns
+        can be `categorical` objects too (see `categorical`).
     names : list of strings or string
         The list of names for the columns.  The names in this list must be
         valid Python identifiers, must not start with an underscore, and has
@@ -143,7 +274,7 @@ class ctable(object):
     def dtype(self):
         "The data type of this object (numpy dtype)."
         names, cols = self.names, self.cols
-        l = [(name, cols[name].dtype) for name in names]
+        l = [(name, cols.dtype(name)) for name in names]
         return np.dtype(l)
 
     @property
@@ -171,6 +302,16 @@ class ctable(object):
         "The size of this object."
         return np.prod(self.shape)
 
+    @property
+    def stats(self):
+        """The statistics of the columns (a dictionary of `colstats`).
+
+        The statistics are built the first time that they are asked for.
+        From then on, they are updated by `append()` with the appended
+        rows, and persisted in the rootdir (if any) by `flush()`.
+        """
+        return dict(self._load_stats())
+
 
     def __init__(self, columns=None, names=None, **kwargs):
 
@@ -188,6 +329,20 @@ class ctable(object):
         # The length counter of this array
         self.len = 0
 
+        # The secondary indexes of the columns
+        self.indexes = {}
+        "The indexes of the columns (a dictionary)."
+
+        # The zone maps and distinct sketches of the columns (opened
+        # lazily)
+        self._zonemaps = {}
+        self._sketches = {}
+
+        # The statistics of the columns (read lazily), and whether they
+        # have to be persisted
+        self._stats = None
+        self._stats_dirty = False
+
         # Create a new ctable or open it from disk
         if columns is not None:
             self.create_ctable(columns, names, **kwargs)
@@ -209,6 +364,12 @@ class ctable(object):
         if self.rootdir:
             self.mkdir_rootdir(self.rootdir, self.mode)
 
+        # Column-oriented input
+        if isinstance(columns, dict):
+            if names is None:
+                names = sorted(columns.keys())
+            columns = [columns[name] for name in names]
+
         # Get the names of the columns
         if names is None:
             if isinstance(columns, np.ndarray):  # ratype case
@@ -234,7 +395,8 @@ class ctable(object):
         # Guess the kind of columns input
         calist, nalist, ratype = False, False, False
         if type(columns) in (tuple, list):
-            calist = [type(v) for v in columns] == [ca.carray for v in columns]
+            calist = all(type(v) in (ca.carray, ca.categorical)
+                         for v in columns)
             nalist = [type(v) for v in columns] == [np.ndarray for v in columns]
         elif isinstance(columns, np.ndarray):
             ratype = hasattr(columns.dtype, "names")
@@ -246,36 +408,50 @@ class ctable(object):
         if not (calist or nalist or ratype):
             # Try to convert the elements to carrays
             try:
-                columns = [ca.carray(col) for col in columns]
+                columns = [col if type(col) is ca.categorical else
+                           ca.carray(col) for col in columns]
                 calist = True
             except:
                 raise ValueError, "`columns` input is not supported"
 
-        # Populate the columns
-        clen = -1
-        for i, name in enumerate(names):
+        # Build the columns (concurrently if they are large)
+        def build(i):
+            name, ckwargs = names[i], kwargs.copy()
             if self.rootdir:
                 # Put every carray under each own `name` subdirectory
-                kwargs['rootdir'] = os.path.join(self.rootdir, name)
+                ckwargs['rootdir'] = os.path.join(self.rootdir, name)
             if calist:
                 column = columns[i]
                 if self.rootdir:
                     # Store this in destination
-                    column = column.copy(**kwargs)
+                    column = column.copy(**ckwargs)
             elif nalist:
                 column = columns[i]
                 if column.dtype == np.void:
                     raise ValueError,(
                         "`columns` elements cannot be of type void")
-                column = ca.carray(column, **kwargs)
+                column = ca.carray(column, **ckwargs)
             elif ratype:
-                column = ca.carray(columns[name], **kwargs)
+                column = ca.carray(columns[name], **ckwargs)
+            return column
+        if ratype:
+            nbytes = columns.nbytes
+        elif nalist or self.rootdir:
+            nbytes = sum(_nbytes(column) for column in columns)
+        else:
+            nbytes = 0
+        built = _map_columns(build, range(len(names)), nbytes)
+
+        # Populate the columns
+        clen = -1
+        for name, column in zip(names, built):
             self.cols[name] = column
             if clen >= 0 and clen != len(column):
                 raise ValueError, "all `columns` must have the same length"
             clen = len(column)
 
         self.len = clen
+        self.cols.update_meta(self.len)
 
     def open_ctable(self):
         """Open an existing ctable on-disk."""
@@ -284,11 +460,18 @@ class ctable(object):
             raise ValueError(
                 "you need to pass either a `columns` or a `rootdir` param")
 
-        # Open the ctable by reading the metadata
+        # Open the ctable by reading the metadata (columns are opened
+        # lazily)
         self.cols.read_meta_and_open()
 
-        # Get the length out of the first column
-        self.len = len(self.cols[self.names[0]])
+        # Get the length out of the meta, or else out of the first column
+        if self.cols.len is not None:
+            self.len = self.cols.len
+        else:
+            self.len = len(self.cols[self.names[0]])
+
+        # Open the indexes
+        self.indexes = indexes.open_indexes(self.rootdir, self.mode)
 
     def mkdir_rootdir(self, rootdir, mode):
         """Create the `self.rootdir` directory safely."""
@@ -312,15 +495,26 @@ class ctable(object):
         Parameters
         ----------
         rows : list/tuple of scalar values, NumPy arrays or carrays
-            It also can be a NumPy record, a NumPy recarray, or
-            another ctable.
+            It also can be a NumPy record, a NumPy recarray, a dictionary
+            mapping column names to values, or another ctable.
+
+        Notes
+        -----
+        Large appends to tables with several columns are compressed
+        concurrently by a pool of threads (one task per column).
 
         """
 
+        # Column-oriented input
+        if isinstance(rows, dict):
+            if set(rows) != set(self.names):
+                raise ValueError, "`rows` keys must be the column names"
+            rows = [rows[name] for name in self.names]
+
         # Guess the kind of rows input
         calist, nalist, sclist, ratype = False, False, False, False
         if type(rows) in (tuple, list):
-            calist = [type(v) for v in rows] == [ca.carray for v in rows]
+            calist = all(type(v) in (ca.carray, ca.categorical) for v in rows)
             nalist = [type(v) for v in rows] == [np.ndarray for v in rows]
             if not (calist or nalist):
                 # Try with a scalar list
@@ -336,8 +530,8 @@ class ctable(object):
         if not (calist or nalist or sclist or ratype):
             raise ValueError, "`rows` input is not supported"
 
-        # Populate the columns
-        clen = -1
+        # Get the values for every column
+        clen, columns = -1, []
         for i, name in enumerate(self.names):
             if calist or sclist:
                 column = rows[i]
@@ -348,8 +542,9 @@ class ctable(object):
                 column = column
             elif ratype:
                 column = rows[name]
-            # Append the values to column
-            self.cols[name].append(column)
+            if (type(column) is ca.categorical and
+                type(self.cols[name]) is not ca.categorical):
+                column = column[:]
             if sclist:
                 clen2 = 1
             else:
@@ -357,7 +552,25 @@ class ctable(object):
             if clen >= 0 and clen != clen2:
                 raise ValueError, "all cols in `rows` must have the same length"
             clen = clen2
+            columns.append(column)
+
+        # Append the values to columns (concurrently if they are large)
+        if self._stats is None:
+            self._stats = colstats.read_stats(self.rootdir)
+        def append(i):
+            name = self.names[i]
+            self.cols[name].append(columns[i])
+            self._add_stats(name, columns[i], self.len)
+        nbytes = rows.nbytes if ratype else sum(map(_nbytes, columns))
+        _map_columns(append, range(len(columns)), nbytes)
         self.len += clen
+        if self._has_categoricals():
+            # New categories may have widened the dtype
+            self._arr1 = np.empty(shape=(1,), dtype=self.dtype)
+
+        # Let the indexes know about the new rows
+        for name, index in self.indexes.iteritems():
+            index.update(self.cols[name])
 
     def trim(self, nitems):
         """
@@ -375,6 +588,9 @@ class ctable(object):
         for name in self.names:
             self.cols[name].trim(nitems)
         self.len -= nitems
+        self.cols.update_meta(self.len)
+        self._rebuild_indexes()
+        self._truncate_summaries()
 
     def resize(self, nitems):
         """
@@ -394,6 +610,9 @@ class ctable(object):
         for name in self.names:
             self.cols[name].resize(nitems)
         self.len = nitems
+        self.cols.update_meta(self.len)
+        self._rebuild_indexes()
+        self._truncate_summaries()
 
     def addcol(self, newcol, name=None, pos=None, **kwargs):
         """
@@ -403,8 +622,9 @@ class ctable(object):
 
         Parameters
         ----------
-        newcol : carray, ndarray, list or tuple
-            If a carray is passed, no conversion will be carried out.
+        newcol : carray, categorical, ndarray, list or tuple
+            If a carray or categorical is passed, no conversion will be
+            carried out.
             If conversion to a carray has to be done, `kwargs` will
             apply.
         name : string, optional
@@ -445,6 +665,10 @@ class ctable(object):
         if len(newcol) != self.len:
             raise ValueError, "`newcol` must have the same length than ctable"
 
+        if self.rootdir:
+            # Persist the new column under its own `name` subdirectory
+            kwargs['rootdir'] = os.path.join(self.rootdir, name)
+            kwargs['mode'] = 'w'
         if isinstance(newcol, np.ndarray):
             if 'cparams' not in kwargs:
                 kwargs['cparams'] = self.cparams
@@ -453,9 +677,11 @@ class ctable(object):
             if 'cparams' not in kwargs:
                 kwargs['cparams'] = self.cparams
             newcol = ca.carray(newcol, **kwargs)
-        elif type(newcol) != ca.carray:
+        elif type(newcol) not in (ca.carray, ca.categorical):
             raise ValueError(
                 """`newcol` type not supported""")
+        elif self.rootdir and newcol.rootdir != kwargs['rootdir']:
+            newcol = newcol.copy(**kwargs)
 
         # Insert the column
         self.cols.insert(name, pos, newcol)
@@ -504,8 +730,11 @@ class ctable(object):
                 raise ValueError, "`pos` must be >= 0 and <= len(self.cols)"
             name = self.names[pos]
 
-        # Remove the column
+        # Remove the column and its index
         self.cols.pop(name)
+        if name in self.indexes:
+            self.drop_index(name)
+        self._drop_summaries(name)
         # Update _arr1
         self._arr1 = np.empty(shape=(1,), dtype=self.dtype)
 
@@ -545,6 +774,125 @@ class ctable(object):
         ccopy = ctable(cols, names, **kwargs)
         return ccopy
 
+    def view(self, cols=None, start=0, stop=None):
+        """
+        view(cols=None, start=0, stop=None)
+
+        Return a view of some columns and rows of this ctable.
+
+        The view shares the columns of this ctable, so no data is copied
+        nor decompressed.  It supports the same read operations as a
+        ctable (`where()`, `eval()`, `iter()`, indexing...), and it only
+        makes private copies of the columns when it is modified.
+
+        Parameters
+        ----------
+        cols : list of strings or string
+            The names of the columns in the view.  Alternatively, it can
+            be specified as a string such as 'f0 f1' or 'f0, f1'.  If
+            None, all the columns are in the view.
+        start, stop : int
+            The range of rows in the view (all of them by default).
+
+        Returns
+        -------
+        out : ctableview object
+            The view.
+
+        See Also
+        --------
+        copy
+
+        """
+        return ca.ctableview(self, cols, start, stop)
+
+    def create_index(self, colname, kind='sorted'):
+        """
+        create_index(colname, kind='sorted')
+
+        Create an index for the `colname` column.
+
+        Parameters
+        ----------
+        colname : string
+            The name of the column to be indexed.
+        kind : string
+            The kind of index.  It can be 'sorted' or 'hash'.  'sorted'
+            indexes speed up equality (``col == v``), membership (``col in
+            (v1, v2)``) and range (``lo <= col < hi``) predicates, while
+            'hash' indexes only speed up equality and membership ones.
+
+        Notes
+        -----
+        Indexes are used automatically by `where()` and `__getitem__()`
+        for expressions made of the above predicates.  They are kept up
+        to date when rows are appended, and are persisted in the rootdir
+        of the ctable (if any).
+
+        See Also
+        --------
+        drop_index
+
+        """
+
+        if colname not in self.names:
+            raise ValueError, "`colname` not found in columns"
+        if kind not in indexes.kinds:
+            raise ValueError, "`kind` must be either 'sorted' or 'hash'"
+        if self.rootdir and self.mode == 'r':
+            raise IOError("Cannot create an index when in 'r'ead-only mode")
+        if colname in self.indexes:
+            self.drop_index(colname)
+
+        idxdir = None
+        if self.rootdir:
+            idxdir = os.path.join(self.rootdir, indexes.INDEXESDIR, colname)
+        index = indexes.kinds[kind](idxdir, self.mode)
+        index.build(self.cols[colname])
+        self.indexes[colname] = index
+
+    def drop_index(self, colname):
+        """
+        drop_index(colname)
+
+        Remove the index of the `colname` column.
+
+        See Also
+        --------
+        create_index
+
+        """
+
+        if colname not in self.indexes:
+            raise ValueError, "column `colname` has no index"
+        if self.rootdir and self.mode == 'r':
+            raise IOError("Cannot remove an index when in 'r'ead-only mode")
+        del self.indexes[colname]
+        if self.rootdir:
+            indexes.remove_index(self.rootdir, colname)
+
+    def _has_categoricals(self):
+        """Tell whether some column is categorical."""
+        return any(self.cols.kind(name) == 'categorical'
+                   for name in self.names)
+
+    def _rebuild_indexes(self):
+        """Rebuild the indexes after values have been modified."""
+        for name, index in self.indexes.iteritems():
+            index.build(self.cols[name])
+
+    def _index_lookup(self, expression, user_dict):
+        """Return the row ids where `expression` is true.
+
+        None is returned if `expression` cannot be resolved via indexes.
+        """
+
+        tree = indexes.parse_predicate(expression, self.names, user_dict)
+        if tree is None or not (indexes.uses_index(tree, self.indexes) or
+                                indexes.has_membership(expression)):
+            return None
+        return indexes.resolve(tree, self.cols, self.indexes)
+
     def __len__(self):
         return self.len
 
@@ -579,6 +927,12 @@ class ctable(object):
             This iterable returns rows as NumPy structured types (i.e. they
             support being mapped either by position or by name).
 
+        Notes
+        -----
+        If `expression` is made of simple predicates on indexed columns,
+        the indexes are used instead of evaluating it (see
+        `create_index()`).
+
         See Also
         --------
         iter
@@ -586,38 +940,425 @@ class ctable(object):
         """
 
         # Check input
+        selection = self._selection(expression)
+        outcols = self._check_outcols(outcols)
+
+        # Rows are gathered in blocks, and served one by one
+        namedt = namedtuple('row', outcols)
+        blocks = self._gather_blocks(
+            _rowid_blocks(selection, self._blen(selection), skip, limit),
+            outcols)
+        return it.chain.from_iterable(
+            it.starmap(namedt, block.tolist()) for block in blocks)
+
+    def whereblocks(self, expression, blen=None, outcols=None, limit=None,
+                    skip=0):
+        """
+        whereblocks(expression, blen=None, outcols=None, limit=None, skip=0)
+
+        Iterate over blocks of rows where `expression` is true.
+
+        Parameters
+        ----------
+        expression : string or carray
+            A boolean Numexpr expression or a boolean carray.
+        blen : int
+            The (approximate) number of rows in every block.  The default
+            is the chunklen of the boolean carray for `expression`.
+        outcols : list of strings or string
+            The list of column names that you want to get back in results.
+            Alternatively, it can be specified as a string such as 'f0 f1' or
+            'f0, f1'.  If None, all the columns are returned.  If the special
+            name 'nrow__' is present, the number of row will be included in
+            output.
+        limit : int
+            A maximum number of elements to return.  The default is return
+            everything.
+        skip : int
+            An initial number of elements to skip.  The default is 0.
+
+        Returns
+        -------
+        out : iterable
+            This iterable returns blocks of rows as NumPy structured
+            arrays.
+
+        See Also
+        --------
+        where
+
+        """
+
+        selection = self._selection(expression)
+        outcols = self._check_outcols(outcols)
+        if blen is None:
+            blen = self._blen(selection)
+        return self._gather_blocks(
+            _rowid_blocks(selection, blen, skip, limit), outcols)
+
+    def _selection(self, expression, depth=2):
+        """Return the rows where `expression` is true.
+
+        They come as a sorted array of row ids if `expression` can be
+        resolved with indexes, and as a boolean carray otherwise.
+        `depth` is the depth of the frame of the user, for getting the
+        variables in `expression`.
+        """
         if type(expression) is str:
-            # That must be an expression
-            boolarr = self.eval(expression)
+            # That must be an expression, try with indexes first
+            frame = sys._getframe(depth)
+            rowids = self._index_lookup(
+                expression, dict(frame.f_globals, **frame.f_locals))
+            if rowids is not None:
+                return rowids
+            return self.eval(expression, depth=depth + 3)
         elif hasattr(expression, "dtype") and expression.dtype.kind == 'b':
-            boolarr = expression
-        else:
-            raise ValueError, "only boolean expressions or arrays are supported"
+            return expression
+        raise ValueError, "only boolean expressions or arrays are supported"
 
-        # Check outcols
+    def _blen(self, selection):
+        """The default length of the blocks of rows for `selection`."""
+        return max(getattr(selection, 'chunklen', 0), 1024)
+
+    def _gather_blocks(self, rowid_blocks, outcols):
+        """Turn blocks of row ids into blocks of rows with `outcols`.
+
+        Only the chunks of the columns holding some of the rows are
+        decompressed.
+        """
+        dtype = np.dtype([(name, np.int_ if name == 'nrow__' else
+                           self.cols.dtype(name)) for name in outcols])
+        for rowids in rowid_blocks:
+            block = np.empty(len(rowids), dtype=dtype)
+            for name in outcols:
+                if name == 'nrow__':
+                    block[name] = rowids
+                else:
+                    block[name] = indexes.gather(self.cols[name], rowids)
+            yield block
+
+    def _check_outcols(self, outcols):
+        """Return the list of `outcols` names after checking them."""
         if outcols is None:
-            outcols = self.names
-        else:
-            if type(outcols) not in (list, tuple, str):
-                raise ValueError, "only list/str is supported for outcols"
-            # Check name validity
-            nt = namedtuple('_nt', outcols, verbose=False)
-            outcols = list(nt._fields)
-            if set(outcols) - set(self.names+['nrow__']) != set():
-                raise ValueError, "not all outcols are real column names"
+            return self.names
+        if type(outcols) not in (list, tuple, str):
+            raise ValueError, "only list/str is supported for outcols"
+        # Check name validity
+        nt = namedtuple('_nt', outcols, verbose=False)
+        outcols = list(nt._fields)
+        if set(outcols) - set(self.names+['nrow__']) != set():
+            raise ValueError, "not all outcols are real column names"
+        return outcols
+
+    def topk(self, col, k, outcols=None, where=None, largest=True):
+        """
+        topk(col, k, outcols=None, where=None, largest=True)
 
-        # Get iterators for selected columns
-        icols, dtypes = [], []
+        Return the rows with the `k` largest (or smallest) values of `col`.
+
+        Parameters
+        ----------
+        col : string
+            The name of the column to rank rows by.
+        k : int
+            The maximum number of rows to return.
+        outcols : list of strings or string
+            The list of column names that you want to get back in results.
+            Alternatively, it can be specified as a string such as 'f0 f1' or
+            'f0, f1'.  If None, all the columns are returned.  If the special
+            name 'nrow__' is present, the number of row will be included in
+            output.
+        where : string or carray, optional
+            A boolean expression (or a boolean carray) that the rows have to
+            satisfy.  Indexes are used for it as in `where()`.
+        largest : bool
+            Whether the rows with the largest or the smallest values are
+            returned.
+
+        Returns
+        -------
+        out : a NumPy structured array
+            The selected rows, best first.  Rows with equal values come in
+            row order.
+
+        Notes
+        -----
+        This is the equivalent of ``ORDER BY col DESC LIMIT k``, but the
+        column is never sorted: chunks are scanned keeping the k best
+        values found so far, and only the values of `outcols` in the
+        selected rows are gathered.  The minimum and maximum values of the
+        chunks that are scanned are kept in a zone map (persisted in the
+        rootdir, if any), so that later calls can skip the chunks that
+        cannot hold any of the k best values.
+
+        """
+
+        if col not in self.names:
+            raise ValueError, "`col` not found in columns"
+        outcols = self._check_outcols(outcols)
+        column = self.cols[col]
+
+        # Resolve the `where` condition
+        rowids, mask = None, None
+        if where is not None:
+            mask = self._selection(where)
+            if mask.dtype.kind != 'b':
+                rowids, mask = mask, None
+
+        if rowids is not None:
+            # Rows come from an index lookup: select among them
+            values, rowids = topk._select(indexes.gather(column, rowids),
+                                          rowids, k, largest)
+        else:
+            zonemap = self._zonemap(col)
+            values, rowids = topk.topk(column, k, largest, mask, zonemap)
+            zonemap.flush()
+
+        # Gather the output columns, decompressing rows in order
+        dtypes = [(name, np.int_ if name == 'nrow__' else
+                   self.cols.dtype(name)) for name in outcols]
+        out = np.empty(len(rowids), dtype=dtypes)
+        order = np.argsort(rowids, kind='mergesort')
         for name in outcols:
-            if name == "nrow__":
-                icols.append(boolarr.wheretrue(limit=limit, skip=skip))
-                dtypes.append((name, np.int_))
+            if name == 'nrow__':
+                out[name] = rowids
+            elif name == col:
+                out[name] = values
             else:
-                col = self.cols[name]
-                icols.append(col.where(boolarr, limit=limit, skip=skip))
-                dtypes.append((name, col.dtype))
-        dtype = np.dtype(dtypes)
-        return self._iter(icols, dtype)
+                out[name][order] = indexes.gather(self.cols[name],
+                                                  rowids[order])
+        return out
+
+    def _zonemap(self, name):
+        """Return the zone map of the `name` column."""
+        if name not in self._zonemaps:
+            self._zonemaps[name] = zonemaps.zonemap(
+                zonemaps.filename(self.rootdir, name), self.mode)
+        return self._zonemaps[name]
+
+    def _sketch(self, name):
+        """Return the distinct sketches of the `name` column."""
+        if name not in self._sketches:
+            sketchesdir = None
+            if self.rootdir:
+                sketchesdir = os.path.join(
+                    self.rootdir, distinct.SKETCHESDIR, name)
+            self._sketches[name] = distinct.chunksketches(
+                sketchesdir, mode=self.mode)
+        return self._sketches[name]
+
+    def _truncate_summaries(self):
+        """Forget about the zones and sketches of chunks that are not full
+        anymore, and about the statistics (they cannot be decremented)."""
+        for name in self.names:
+            nchunks = self.len // self.cols[name].chunklen
+            for summary in (self._zonemap(name), self._sketch(name)):
+                summary.truncate(nchunks)
+                summary.flush()
+        self._stats = {}
+        colstats.remove_stats(self.rootdir)
+
+    def _drop_summaries(self, name=None):
+        """Remove the zone maps, sketches and statistics of `name` (or all
+        of them)."""
+        if name is None:
+            self._zonemaps.clear()
+            self._sketches.clear()
+            self._stats = {}
+            colstats.remove_stats(self.rootdir)
+        else:
+            self._zonemaps.pop(name, None)
+            self._sketches.pop(name, None)
+            if self._stats is None:
+                self._stats = colstats.read_stats(self.rootdir)
+            if (self._stats.pop(name, None) is not None and self.rootdir
+                and self.mode != 'r'):
+                colstats.write_stats(self.rootdir, self._stats)
+        zonemaps.remove_zonemaps(self.rootdir, name)
+        distinct.remove_sketches(self.rootdir, name)
+
+    def _add_stats(self, name, values, nrows):
+        """Take the `values` added after the first `nrows` rows of column
+        `name` into its statistics (if they exist and are up to date)."""
+        cstats = self._stats.get(name)
+        if cstats is None or cstats.rows != nrows:
+            # They will be rebuilt when they are needed
+            return
+        # Categorical columns may have widened their dtype
+        cstats.dtype = dtype = self.cols.dtype(name)
+        if isinstance(values, np.ndarray):
+            cstats.update(values)
+        elif hasattr(values, 'chunklen'):
+            for i in xrange(0, len(values), values.chunklen):
+                cstats.update(values[i:i + values.chunklen])
+        else:
+            cstats.update(np.atleast_1d(np.asarray(values, dtype=dtype)))
+        self._stats_dirty = True
+
+    def _load_stats(self):
+        """Return the statistics, building the ones that are missing or
+        out of date (e.g. after `trim()` or `addcol()`)."""
+        if self._stats is None:
+            self._stats = colstats.read_stats(self.rootdir)
+        stats = self._stats
+        for name in stats.keys():
+            if name not in self.names:
+                del stats[name]
+                self._stats_dirty = True
+        for name in self.names:
+            cstats = stats.get(name)
+            if cstats is None or cstats.rows != self.len:
+                stats[name] = colstats.colstats(self.cols.dtype(name))
+                self._add_stats(name, self.cols[name], 0)
+        return stats
+
+    def count_distinct(self, col, start=0, stop=None, approx=False):
+        """
+        count_distinct(col, start=0, stop=None, approx=False)
+
+        Return the number of distinct values of `col`.
+
+        Parameters
+        ----------
+        col : string
+            The name of the column.
+        start, stop : int
+            The range of rows to look into (all of them by default).
+        approx : bool
+            Whether the count is estimated with HyperLogLog sketches
+            instead of being exact.  The relative error is about 1.6%.
+
+        Returns
+        -------
+        out : int
+            The (estimated) number of distinct values.
+
+        Notes
+        -----
+        Approximate counts keep the sketch of every full chunk (persisted
+        in the rootdir, if any), so that later counts over any range of
+        rows only have to merge sketches.  Exact counts spill the
+        distinct values to disk if they do not fit in 256 MB.
+
+        See Also
+        --------
+        unique
+
+        """
+        if col not in self.names:
+            raise ValueError, "`col` not found in columns"
+        sketches = self._sketch(col) if approx else None
+        count = distinct.count_distinct(self.cols[col], start, stop,
+                                        approx=approx, sketches=sketches)
+        if sketches is not None:
+            sketches.flush()
+        return count
+
+    def unique(self, col, **kwargs):
+        """
+        unique(col, **kwargs)
+
+        Return the distinct values of `col`.
+
+        Parameters
+        ----------
+        col : string
+            The name of the column.
+        kwargs : list of parameters or dictionary
+            `start` and `stop` set the range of rows to look into and
+            `membudget` the number of bytes for the distinct values before
+            spilling them to disk (256 MB by default).  Any other parameter
+            supported by the carray constructor is used for the result.
+
+        Returns
+        -------
+        out : carray object
+            The distinct values.  They are sorted unless they had to be
+            spilled to disk.
+
+        See Also
+        --------
+        count_distinct
+
+        """
+        if col not in self.names:
+            raise ValueError, "`col` not found in columns"
+        return distinct.unique(self.cols[col], **kwargs)
+
+    def groupby(self, keys, aggs, **kwargs):
+        """
+        groupby(keys, aggs, **kwargs)
+
+        Group rows by the values of `keys` and aggregate them.
+
+        Parameters
+        ----------
+        keys : list of strings or string
+            The names of the columns to group by.  Alternatively, it can
+            be specified as a string such as 'f0 f1' or 'f0, f1'.
+        aggs : dictionary
+            Maps the names of the output columns to ``(colname, func)``
+            pairs, where `func` can be 'sum', 'mean', 'count', 'min' or
+            'max'.  A list of ``(name, (colname, func))`` pairs can be
+            passed too for choosing the order of the output columns (they
+            are sorted by name otherwise).
+        kwargs : list of parameters or dictionary
+            `membudget` is the number of bytes that the partial
+            aggregations can use before being spilled to disk (256 MB by
+            default) and `nthreads` is the number of threads reducing the
+            blocks (`ncores` by default).  Any other parameter supported
+            by the ctable constructor is used for the result.
+
+        Returns
+        -------
+        out : ctable object
+            A table with the `keys` columns followed by the `aggs` ones,
+            having a row per distinct key.  Rows are sorted by key (by
+            code for categorical keys) unless the aggregation had to be
+            spilled to disk.
+
+        """
+        return groupby.groupby(self, keys, aggs, **kwargs)
+
+    def join(self, other, on, how='inner', outcols=None, **kwargs):
+        """
+        join(other, on, how='inner', outcols=None, **kwargs)
+
+        Join this ctable with `other` on the values of the `on` columns.
+
+        Parameters
+        ----------
+        other : ctable object
+            The right side of the join.
+        on : list of strings or string
+            The names of the key columns, which must exist in both tables.
+            Alternatively, it can be specified as a string such as 'f0 f1'
+            or 'f0, f1'.
+        how : string
+            'inner' returns the pairs of rows with equal keys.  'left'
+            also returns the rows of this table without a match, with the
+            columns of `other` filled with their default value (`dflt`).
+        outcols : list of strings or string
+            The names of the output columns.  These are the columns of this
+            table followed by the non-key columns of `other`, which get an
+            `rsuffix` ('_r' by default) appended when their names clash.
+            If None, all the columns are returned.  Only these columns are
+            decompressed for building the result.
+        kwargs : list of parameters or dictionary
+            `membudget` is the number of bytes that the keys of `other`
+            can use in memory before both sides are partitioned on disk
+            (256 MB by default) and `nthreads` is the number of threads
+            doing the matching (`ncores` by default).  Any other parameter
+            supported by the ctable constructor is used for the result.
+
+        Returns
+        -------
+        out : ctable object
+            The joined table.  Its rows follow the order of this table
+            unless the join had to be partitioned on disk.
+
+        """
+        return join.join(self, other, on, how, outcols, **kwargs)
 
     def __iter__(self):
         return self.iter(0, self.len, 1)
@@ -661,16 +1402,7 @@ class ctable(object):
         """
 
         # Check outcols
-        if outcols is None:
-            outcols = self.names
-        else:
-            if type(outcols) not in (list, tuple, str):
-                raise ValueError, "only list/str is supported for outcols"
-            # Check name validity
-            nt = namedtuple('_nt', outcols, verbose=False)
-            outcols = list(nt._fields)
-            if set(outcols) - set(self.names+['nrow__']) != set():
-                raise ValueError, "not all outcols are real column names"
+        outcols = self._check_outcols(outcols)
 
         # Check limits
         if step <= 0:
@@ -706,12 +1438,18 @@ class ctable(object):
         """Return rows where `boolarr` is true as an structured array.
 
         This is called internally only, so we can assum that `boolarr`
-        is a boolean array.
+        is a boolean array (or a sorted array of row ids).
         """
 
         if colnames is None:
             colnames = self.names
-        cols = [self.cols[name][boolarr] for name in colnames]
+        if boolarr.dtype.kind == 'b':
+            # Compute the row ids once, instead of once per column
+            blocks = list(_rowid_blocks(boolarr, self._blen(boolarr)))
+            boolarr = np.concatenate(
+                [np.empty(0, dtype=np.int64)] + blocks)
+        cols = [indexes.gather(self.cols[name], boolarr)
+                for name in colnames]
         dtype = np.dtype([(name, self.cols[name].dtype) for name in colnames])
         result = np.rec.fromarrays(cols, dtype=dtype).view(np.ndarray)
 
@@ -764,8 +1502,7 @@ class ctable(object):
             strlist = [type(v) for v in key] == [str for v in key]
             # Range of column names
             if strlist:
-                cols = [self.cols[name] for name in key]
-                return ctable(cols, key)
+                return self.view(key)
             # Try to convert to a integer array
             try:
                 key = np.array(key, dtype=np.int_)
@@ -787,7 +1524,13 @@ class ctable(object):
         # Column name or expression
         elif type(key) is str:
             if key not in self.names:
-                # key is not a column name, try to evaluate
+                # key is not a column name, try with indexes first
+                frame = sys._getframe(1)
+                rowids = self._index_lookup(
+                    key, dict(frame.f_globals, **frame.f_locals))
+                if rowids is not None:
+                    return self._where(rowids)
+                # then try to evaluate
                 arr = self.eval(key, depth=4)
                 if arr.dtype.type != np.bool_:
                     raise IndexError, \
@@ -851,10 +1594,14 @@ class ctable(object):
                     for name in self.names:
                         self.cols[name][nrow] = value[name][rowval]
                     rowval += 1
+            self._rebuild_indexes()
+            self._drop_summaries()
             return
         # Then, modify the rows
         for name in self.names:
             self.cols[name][key] = value[name]
+        self._rebuild_indexes()
+        self._drop_summaries()
         return
 
     def eval(self, expression, **kwargs):
@@ -888,8 +1635,17 @@ class ctable(object):
 
         # Get the desired frame depth
         depth = kwargs.pop('depth', 3)
+        # (In)equalities of categorical columns are done on their codes
+        user_dict = self.cols
+        if self._has_categoricals():
+            expression, codes = categorical.rewrite(expression, self.cols)
+            if codes:
+                # Only open the columns that may be in the expression
+                user_dict = dict((name, self.cols[name])
+                                 for name in self.names if name in expression)
+                user_dict.update(codes)
         # Call top-level eval with cols as user_dict
-        return ca.eval(expression, user_dict=self.cols, depth=depth, **kwargs)
+        return ca.eval(expression, user_dict=user_dict, depth=depth, **kwargs)
 
     def flush(self):
         """Flush data in internal buffers to disk.
@@ -899,8 +1655,15 @@ class ctable(object):
         you risk loosing part of your modifications.
 
         """
-        for name in self.names:
-            self.cols[name].flush()
+        # Columns that have not been opened have nothing to flush
+        cols = self.cols.opened()
+        # Flushing persistent columns writes files, so do it concurrently
+        nbytes = PARALLEL_NBYTES if self.rootdir else 0
+        _map_columns(lambda col: col.flush(), cols, nbytes)
+        self.cols.update_meta(self.len)
+        if self._stats_dirty and self.rootdir and self.mode != 'r':
+            colstats.write_stats(self.rootdir, self._stats)
+            self._stats_dirty = False
 
     def _get_stats(self):
         """
@@ -13,7 +13,10 @@ Feel free to change them for better adapting to your needs.
 
 """
 
-import blaze.carray as ca
+import sys
+
+# See the note in toplevel.py about importing the package here
+ca = sys.modules['blaze.carray']
 
 
 class Defaults(object):
@@ -24,11 +27,12 @@ class Defaults(object):
 
         # Choices setup
         self.choices['eval_out_flavor'] = ("carray", "numpy")
-        self.choices['eval_vm'] = ("numexpr", "python")
+        self.choices['eval_vm'] = ("numexpr", "python", "ufunc")
 
     def check_choices(self, name, value):
         if value not in self.choices[name]:
-            raiseValue, "value must be either 'numexpr' or 'python'"
+            raise ValueError, "value must be one of %s" % (
+                self.choices[name],)
 
     #
     # Properties start here...
@@ -72,7 +76,7 @@ The flavor for the output object in `eval()`.  It can be 'carray' or
 defaults.eval_vm = "python"
 """
 The virtual machine to be used in computations (via `eval`).  It can
-be 'numexpr' or 'python'.  Default is 'numexpr', if installed.  If
+be 'numexpr', 'python' or 'ufunc'.  Default is 'numexpr', if installed.  If
 not, then the default is 'python'.
 
 """
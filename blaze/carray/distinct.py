@@ -0,0 +1,396 @@
+"""Distinct values of carray columns.
+
+`count_distinct()` and `unique()` find the distinct values of a column
+exactly, block by block: every block is reduced with `np.unique()` and
+the results are merged into a sorted set.  When this set grows over a
+memory budget, it is hash-partitioned to temporary carrays on disk, and
+every partition is deduplicated on its own.
+
+`count_distinct()` can also estimate the count with a HyperLogLog
+sketch (`hll`), using a small and fixed amount of memory.  The sketches
+of the full chunks of a column can be kept (see `chunksketches`), so
+that estimating the count for any range of rows only has to merge
+sketches, plus hashing the rows at the edges of the range.
+"""
+
+import sys
+import math
+import os, os.path
+import shutil
+import tempfile
+
+import numpy as np
+
+import indexes, groupby
+
+# See the note in toplevel.py about importing the package here
+ca = sys.modules['blaze.carray']
+
+SKETCHESDIR = '__sketches__'
+
+# The constants of the finalizer of MurmurHash3, for mixing the low bits
+# of `indexes.hashes()` too
+_C1 = np.uint64(0xff51afd7ed558ccd)
+_C2 = np.uint64(0xc4ceb9fe1a85ec53)
+_S33 = np.uint64(33)
+
+
+def _mix(h):
+    """Scramble all the bits of the uint64 hashes in `h`."""
+    with np.errstate(over='ignore'):
+        h = h ^ (h >> _S33)
+        h = h * _C1
+        h ^= h >> _S33
+        h *= _C2
+        h ^= h >> _S33
+    return h
+
+
+def _bitlength(w):
+    """The number of significant bits of every uint64 in `w`."""
+    # Halves of 32 bits are exactly represented by float64
+    hi = (w >> np.uint64(32)).astype(np.float64)
+    lo = (w & np.uint64(0xffffffff)).astype(np.float64)
+    with np.errstate(divide='ignore'):
+        return np.where(hi > 0, 33 + np.floor(np.log2(hi)),
+                        np.where(lo > 0, 1 + np.floor(np.log2(lo)), 0))
+
+
+class hll(object):
+    """
+    hll(precision=12, registers=None)
+
+    A HyperLogLog sketch for estimating the number of distinct values.
+
+    Parameters
+    ----------
+    precision : int
+        The log2 of the number of registers, between 4 and 18.  The
+        relative standard error of the estimates is about
+        ``1.04 / sqrt(2**precision)`` (1.6% for the default).
+    registers : NumPy array, optional
+        The (uint8) registers of an existing sketch.
+
+    """
+
+    def __init__(self, precision=12, registers=None):
+        if not 4 <= precision <= 18:
+            raise ValueError, "`precision` must be between 4 and 18"
+        self.precision = precision
+        if registers is None:
+            registers = np.zeros(1 << precision, dtype=np.uint8)
+        self.registers = registers
+        "The registers of the sketch."
+
+    def add(self, values):
+        """
+        add(values)
+
+        Add the values in the `values` array to the sketch.
+
+        """
+        values = np.asarray(values)
+        if len(values) == 0:
+            return
+        p = self.precision
+        h = _mix(indexes.hashes(values))
+        # The first `p` bits choose a register, which keeps the maximum
+        # position of the first 1 bit in the rest of the bits
+        buckets = (h >> np.uint64(64 - p)).astype(np.intp)
+        rest = h & np.uint64((1 << (64 - p)) - 1)
+        ranks = (65 - p - _bitlength(rest)).astype(np.uint8)
+        np.maximum.at(self.registers, buckets, ranks)
+
+    def update(self, other):
+        """
+        update(other)
+
+        Merge the `other` sketch into this one.
+
+        """
+        if other.precision != self.precision:
+            raise ValueError, "sketches must have the same precision"
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        """
+        estimate()
+
+        Return the estimated number of distinct values added.
+
+        """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        est = alpha * m * m / np.ldexp(1., -self.registers.astype(int)).sum()
+        zeros = m - np.count_nonzero(self.registers)
+        if est <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            est = m * math.log(float(m) / zeros)
+        return int(round(est))
+
+    def __repr__(self):
+        return "hll(precision=%d, estimate=%d)" % (
+            self.precision, self.estimate())
+
+
+class chunksketches(object):
+    """
+    chunksketches(rootdir=None, precision=12, mode='a')
+
+    The HyperLogLog sketches of the full chunks of a column.
+
+    Sketches are computed on demand, in chunk order, and kept in a carray
+    with a row of registers per chunk.
+
+    Parameters
+    ----------
+    rootdir : string
+        The directory where the sketches are persisted.  If it exists,
+        the sketches are read from it (and `precision` is ignored).
+    precision : int
+        The precision of the sketches (see `hll`).
+    mode : string
+        The mode in which the sketches are opened ('r' or 'a').
+
+    """
+
+    def __init__(self, rootdir=None, precision=12, mode='a'):
+        self.rootdir = rootdir
+        self.mode = mode
+        self.precision = precision
+        if rootdir and os.path.isdir(rootdir):
+            self.registers = ca.carray(rootdir=rootdir, mode=mode)
+            self.precision = int(np.log2(self.registers.shape[1]))
+        else:
+            self.registers = None
+        "The carray of registers (a row per chunk), if any."
+
+    def __len__(self):
+        return 0 if self.registers is None else len(self.registers)
+
+    def sketch(self, column, nchunk):
+        """
+        sketch(column, nchunk)
+
+        Return the sketch of the chunk `nchunk` of `column`.
+
+        The sketches of the previous chunks are computed too, if needed.
+
+        """
+        clen = column.chunklen
+        if nchunk >= len(column) // clen:
+            raise IndexError, "only full chunks have sketches"
+        if nchunk >= len(self):
+            if self.rootdir and self.mode == 'r':
+                raise IOError(
+                    "Cannot add sketches when in 'r'ead-only mode")
+            rows = []
+            for n in xrange(len(self), nchunk + 1):
+                sk = hll(self.precision)
+                sk.add(column[n * clen:(n + 1) * clen])
+                rows.append(sk.registers)
+            if self.registers is None:
+                if self.rootdir:
+                    dirname = os.path.dirname(self.rootdir)
+                    if not os.path.isdir(dirname):
+                        os.makedirs(dirname)
+                self.registers = ca.carray(
+                    np.array(rows), chunklen=16, rootdir=self.rootdir,
+                    mode='w')
+            else:
+                self.registers.append(np.array(rows))
+        return hll(self.precision, self.registers[nchunk])
+
+    def truncate(self, nchunks):
+        """
+        truncate(nchunks)
+
+        Forget about the sketches of the chunks after the first `nchunks`.
+
+        """
+        if len(self) > nchunks:
+            self.registers.trim(len(self) - nchunks)
+
+    def flush(self):
+        """Save the sketches to disk (if needed)."""
+        if self.registers is not None and self.mode != 'r':
+            self.registers.flush()
+
+
+def _distinct(column, start, stop, membudget):
+    """Iterate over disjoint arrays with the distinct values in `column`."""
+    bsize = column.chunklen
+    pending, nbytes = [], 0
+    tmpdir, parts, nparts = None, None, 0
+    try:
+        for i in xrange(start, stop, bsize):
+            block = np.unique(column[i:min(i + bsize, stop)])
+            pending.append(block)
+            nbytes += block.nbytes
+            if nbytes <= membudget // 2:
+                continue
+            merged = np.unique(np.concatenate(pending))
+            pending, nbytes = [], 0
+            if parts is None:
+                if merged.nbytes <= membudget // 4:
+                    pending, nbytes = [merged], merged.nbytes
+                    continue
+                # Switch to out-of-core mode with partitions that are
+                # expected to fit comfortably in the budget
+                nparts = 2 ** int(np.ceil(np.log2(
+                    max(16 * merged.nbytes // membudget, 2))))
+                tmpdir = tempfile.mkdtemp(prefix='distinct-')
+                parts = [None] * nparts
+            _spill(merged, parts, tmpdir)
+        if pending:
+            merged = np.unique(np.concatenate(pending))
+            if parts is None:
+                yield merged
+                return
+            _spill(merged, parts, tmpdir)
+        if parts is not None:
+            for part in parts:
+                if part is not None:
+                    part.flush()
+                    yield np.unique(part[:])
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+
+def _spill(values, parts, tmpdir):
+    """Hash-partition `values` into the `parts` carrays in `tmpdir`."""
+    nparts = len(parts)
+    partition = groupby._partition(values, nparts)
+    order = np.argsort(partition, kind='mergesort')
+    values = values[order]
+    bounds = np.searchsorted(partition[order], np.arange(nparts + 1))
+    for p in range(nparts):
+        chunk = values[bounds[p]:bounds[p+1]]
+        if len(chunk) == 0:
+            continue
+        if parts[p] is None:
+            parts[p] = ca.carray(chunk, rootdir=os.path.join(
+                tmpdir, "part%d" % p), mode='w')
+        else:
+            parts[p].append(chunk)
+
+
+def remove_sketches(rootdir, name=None):
+    """Remove the sketches of `name` (or all of them) from `rootdir`."""
+    if not rootdir:
+        return
+    sketchesdir = os.path.join(rootdir, SKETCHESDIR)
+    if name is not None:
+        sketchesdir = os.path.join(sketchesdir, name)
+    if os.path.isdir(sketchesdir):
+        shutil.rmtree(sketchesdir)
+
+
+def count_distinct(column, start=0, stop=None, approx=False, precision=12,
+                   sketches=None, membudget=2**28):
+    """
+    count_distinct(column, start=0, stop=None, approx=False, precision=12,
+                   sketches=None, membudget=2**28)
+
+    Return the number of distinct values in `column`.
+
+    Parameters
+    ----------
+    column : carray or categorical
+        The column to look into.
+    start, stop : int
+        The range of rows to look into (all of them by default).
+    approx : bool
+        Whether the count is estimated with a HyperLogLog sketch (see
+        `hll`) instead of being exact.
+    precision : int
+        The precision of the sketch if `approx` is true.
+    sketches : chunksketches, optional
+        The sketches of the chunks of `column`.  If passed (and `approx`
+        is true), the sketches of the full chunks in the range are merged
+        instead of hashing their values.  The missing sketches are added.
+    membudget : int
+        The number of bytes used for exact counts before spilling the
+        distinct values to disk.
+
+    Returns
+    -------
+    out : int
+        The (estimated) number of distinct values.
+
+    """
+    start, stop, _ = slice(start, stop).indices(len(column))
+    if type(column) is ca.categorical:
+        # Codes and values are in a one to one correspondence
+        column = column.codes
+    if not approx:
+        return sum(len(values) for values in
+                   _distinct(column, start, stop, membudget))
+    if sketches is None:
+        sketch = hll(precision)
+        bsize = column.chunklen
+        for i in xrange(start, stop, bsize):
+            sketch.add(column[i:min(i + bsize, stop)])
+        return sketch.estimate()
+    sketch = hll(sketches.precision)
+    clen = column.chunklen
+    # The full chunks inside the range, and the edges out of them
+    first = -(-start // clen)
+    last = max(stop // clen, first)
+    sketch.add(column[start:min(first * clen, stop)])
+    for nchunk in xrange(first, last):
+        sketch.update(sketches.sketch(column, nchunk))
+    sketch.add(column[max(last * clen, start):stop])
+    return sketch.estimate()
+
+
+def unique(column, start=0, stop=None, membudget=2**28, **kwargs):
+    """
+    unique(column, start=0, stop=None, membudget=2**28, **kwargs)
+
+    Return the distinct values in `column`.
+
+    Parameters
+    ----------
+    column : carray or categorical
+        The column to look into.
+    start, stop : int
+        The range of rows to look into (all of them by default).
+    membudget : int
+        The number of bytes used for the distinct values before spilling
+        them to disk.
+    kwargs : list of parameters or dictionary
+        Any parameter supported by the carray constructor.
+
+    Returns
+    -------
+    out : carray object
+        The distinct values.  They are sorted unless they had to be
+        spilled to disk.
+
+    """
+    start, stop, _ = slice(start, stop).indices(len(column))
+    dtype, decode = column.dtype, None
+    if type(column) is ca.categorical:
+        decode, column = column.decode, column.codes
+    out = None
+    for values in _distinct(column, start, stop, membudget):
+        if decode is not None:
+            values = decode(values)
+        if out is None:
+            out = ca.carray(values, **kwargs)
+        else:
+            out.append(values)
+    if out is None:
+        out = ca.carray(np.empty(0, dtype=dtype), **kwargs)
+    out.flush()
+    return out
+
+
+## Local Variables:
+## mode: python
+## py-indent-offset: 4
+## tab-width: 4
+## fill-column: 78
+## End:
@@ -0,0 +1,331 @@
+"""Hash group-by aggregations for ctable objects.
+
+The key and value columns are processed in blocks.  Every block is
+reduced into a partial table with one row per distinct key (the keys
+are found with vectorized sorts, not with a Python dictionary), and
+partial tables are merged the same way.  Blocks are reduced by a pool
+of threads while the main thread decompresses the next ones.
+
+When the merged table grows over a memory budget, partial tables are
+hash-partitioned by key and spilled to carrays on disk.  Each partition
+is then merged on its own, so only a partition has to fit in memory.
+"""
+
+import sys
+import os, os.path
+import shutil
+import tempfile
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+import indexes
+
+# See the note in toplevel.py about importing the package here
+ca = sys.modules['blaze.carray']
+
+# How a state of an aggregation is folded and which states are needed
+# by every aggregation
+_combine = {'sum': np.add, 'count': np.add,
+            'min': np.minimum, 'max': np.maximum}
+_states = {'sum': ('sum',), 'count': ('count',), 'mean': ('sum', 'count'),
+           'min': ('min',), 'max': ('max',)}
+
+# The multiplier for mixing the hashes of the fields in compound keys
+_PRIME = np.uint64(1099511628211)
+
+
+def _reduce(keys, states, ops):
+    """Reduce `states` (a list of arrays) for every distinct value in `keys`.
+
+    Returns the sorted distinct keys and the reduced states.
+    """
+    if len(keys) == 0:
+        return keys, states
+    order = np.argsort(keys, kind='mergesort')
+    keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    reduced = [ops[j].reduceat(state[order], starts)
+               for j, state in enumerate(states)]
+    return keys[starts], reduced
+
+
+def _merge(partials, ops):
+    """Merge a list of `partials` (keys, states) tables into one."""
+    if len(partials) == 1:
+        return partials[0]
+    keys = np.concatenate([p[0] for p in partials])
+    states = [np.concatenate([p[1][j] for p in partials])
+              for j in range(len(ops))]
+    return _reduce(keys, states, ops)
+
+
+def _nbytes(partial):
+    return partial[0].nbytes + sum(state.nbytes for state in partial[1])
+
+
+def _partition(keys, nparts):
+    """Return the partition number for every item in `keys`."""
+    if keys.dtype.names:
+        h = np.zeros(len(keys), dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            for name in keys.dtype.names:
+                h = (h * _PRIME) ^ indexes.hashes(keys[name])
+    else:
+        h = indexes.hashes(keys)
+    return ((h >> np.uint64(32)) % np.uint64(nparts)).astype(np.int64)
+
+
+class _spiller(object):
+    """Hash-partition partial tables into ctables in a temporary dir."""
+
+    def __init__(self, nparts, keynames, nstates):
+        self.nparts = nparts
+        self.keynames = keynames
+        self.names = keynames + ["state%d__" % j for j in range(nstates)]
+        self.tmpdir = tempfile.mkdtemp(prefix='groupby-')
+        self.parts = [None] * nparts
+
+    def spill(self, partial):
+        keys, states = partial
+        parts = _partition(keys, self.nparts)
+        order = np.argsort(parts, kind='mergesort')
+        bounds = np.searchsorted(parts[order], np.arange(self.nparts + 1))
+        for p in range(self.nparts):
+            idx = order[bounds[p]:bounds[p+1]]
+            if len(idx) == 0:
+                continue
+            columns = self._keycols(keys[idx]) + [s[idx] for s in states]
+            if self.parts[p] is None:
+                rootdir = os.path.join(self.tmpdir, "part%d" % p)
+                self.parts[p] = ca.ctable(columns, self.names,
+                                          rootdir=rootdir, mode='w')
+            else:
+                self.parts[p].append(columns)
+
+    def _keycols(self, keys):
+        if keys.dtype.names:
+            return [keys[name].copy() for name in keys.dtype.names]
+        return [keys]
+
+    def partitions(self):
+        """Return the (keys, states) tables in every partition."""
+        for part in self.parts:
+            if part is None:
+                continue
+            part.flush()
+            keys = _keys([part.cols[name] for name in self.keynames],
+                         self.keynames, 0, len(part))
+            states = [part.cols[name][:]
+                      for name in self.names[len(self.keynames):]]
+            yield keys, states
+
+    def close(self):
+        shutil.rmtree(self.tmpdir)
+
+
+def _keys(keycols, keynames, start, stop):
+    """Get the keys in the [start, stop) block of the `keycols` carrays."""
+    if len(keycols) == 1:
+        return keycols[0][start:stop]
+    dtype = [(name, col.dtype) for name, col in zip(keynames, keycols)]
+    keys = np.empty(stop - start, dtype=dtype)
+    for name, col in zip(keynames, keycols):
+        keys[name] = col[start:stop]
+    return keys
+
+
+def _block_partial(keys, values, ops):
+    """Reduce a block of `values` (None means counting) by `keys`."""
+    states = []
+    for op, value in zip(ops, values):
+        if value is None:
+            states.append(np.ones(len(keys), dtype=np.int64))
+        else:
+            states.append(value)
+    return _reduce(keys, states, ops)
+
+
+class _aggregator(object):
+    """Fold partial tables, spilling them to disk if they get too large."""
+
+    # The number of pending partial tables that triggers a merge
+    merge_every = 16
+
+    def __init__(self, keynames, ops, membudget):
+        self.keynames = keynames
+        self.ops = ops
+        self.membudget = membudget
+        self.pending = []
+        # The size of the pending partial tables
+        self.nbytes = 0
+        self.spiller = None
+
+    def _merge_pending(self):
+        """Merge the pending partial tables into one."""
+        merged = _merge(self.pending, self.ops)
+        self.pending[:] = [merged]
+        self.nbytes = _nbytes(merged)
+        return merged
+
+    def fold(self, partial):
+        self.pending.append(partial)
+        self.nbytes += _nbytes(partial)
+        if self.nbytes <= self.membudget // 2:
+            if len(self.pending) >= self.merge_every:
+                self._merge_pending()
+            return
+        merged = self._merge_pending()
+        if self.spiller is None:
+            if self.nbytes <= self.membudget // 4:
+                return
+            # Switch to out-of-core mode with partitions that are expected
+            # to fit comfortably in the budget
+            nparts = 2 ** int(np.ceil(np.log2(
+                max(16 * self.nbytes // self.membudget, 2))))
+            self.spiller = _spiller(nparts, self.keynames, len(self.ops))
+        self.spiller.spill(merged)
+        del self.pending[:]
+        self.nbytes = 0
+
+    def results(self):
+        """Return an iterator over the merged partial tables."""
+        if self.spiller is None:
+            return iter([_merge(self.pending, self.ops)])
+        if self.pending:
+            self.spiller.spill(_merge(self.pending, self.ops))
+            del self.pending[:]
+            self.nbytes = 0
+        return (_reduce(keys, states, self.ops)
+                for keys, states in self.spiller.partitions())
+
+    def close(self):
+        if self.spiller is not None:
+            self.spiller.close()
+
+
+def groupby(table, keys, aggs, membudget=2**28, nthreads=None, **kwargs):
+    """
+    groupby(table, keys, aggs, membudget=2**28, nthreads=None, **kwargs)
+
+    Group the rows of `table` by `keys` and compute aggregations.
+
+    See `ctable.groupby()` for the description of the parameters.
+
+    """
+
+    # Check params
+    if type(keys) is str:
+        keys = keys.replace(',', ' ').split()
+    keys = list(keys)
+    if not keys:
+        raise ValueError, "`keys` cannot be empty"
+    for name in keys:
+        if name not in table.names:
+            raise ValueError, "key '%s' is not a column" % name
+    if isinstance(aggs, dict):
+        aggs = sorted(aggs.items())
+    aggs = list(aggs)
+    for out, (colname, func) in aggs:
+        if func not in _states:
+            raise ValueError, "aggregation '%s' is not supported" % func
+        if colname not in table.names:
+            raise ValueError, "column '%s' not found" % colname
+        if out in keys:
+            raise ValueError, "output '%s' clashes with a key" % out
+    if nthreads is None:
+        nthreads = ca.ncores
+
+    # Every aggregation is computed from one or more states
+    states = []
+    for out, (colname, func) in aggs:
+        for state in _states[func]:
+            if (colname, state) not in states:
+                states.append((colname, state))
+    ops = [_combine[state] for colname, state in states]
+
+    # Categorical keys are grouped by their codes
+    keycols = []
+    for name in keys:
+        col = table.cols[name]
+        keycols.append(col.codes if type(col) is ca.categorical else col)
+
+    def blocks():
+        bsize = keycols[0].chunklen
+        # An empty table still produces an (empty) block
+        for i in xrange(0, max(len(table), 1), bsize):
+            stop = min(i + bsize, len(table))
+            values = []
+            for colname, state in states:
+                if state == 'count':
+                    values.append(None)
+                    continue
+                value = table.cols[colname][i:stop]
+                if state == 'sum':
+                    # Avoid overflows in the same way than np.sum()
+                    value = value.astype(np.add.reduce(value[:0]).dtype)
+                values.append(value)
+            yield _keys(keycols, keys, i, stop), values
+
+    aggregator = _aggregator(keys, ops, membudget)
+    pool = None
+    try:
+        if nthreads > 1:
+            # Reduce blocks in threads, keeping a bounded number in flight
+            pool = ThreadPool(nthreads)
+            inflight = deque()
+            for kblock, values in blocks():
+                inflight.append(pool.apply_async(
+                    _block_partial, (kblock, values, ops)))
+                if len(inflight) >= 2 * nthreads:
+                    aggregator.fold(inflight.popleft().get())
+            while inflight:
+                aggregator.fold(inflight.popleft().get())
+        else:
+            for kblock, values in blocks():
+                aggregator.fold(_block_partial(kblock, values, ops))
+
+        result = None
+        for partial in aggregator.results():
+            columns = _finish(partial, keys, aggs, states)
+            for i, name in enumerate(keys):
+                if type(table.cols[name]) is ca.categorical:
+                    columns[i] = table.cols[name].decode(columns[i])
+            if result is None:
+                result = ca.ctable(columns, keys + [out for out, _ in aggs],
+                                   **kwargs)
+            else:
+                result.append(columns)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        aggregator.close()
+    result.flush()
+    return result
+
+
+def _finish(partial, keys, aggs, states):
+    """Compute the output columns out of a merged `partial`."""
+    pkeys, pstates = partial
+    if len(keys) == 1:
+        columns = [pkeys]
+    else:
+        columns = [pkeys[name].copy() for name in keys]
+    for out, (colname, func) in aggs:
+        if func == 'mean':
+            sum_ = pstates[states.index((colname, 'sum'))]
+            count = pstates[states.index((colname, 'count'))]
+            columns.append(np.true_divide(sum_, count))
+        else:
+            columns.append(pstates[states.index((colname, func))])
+    return columns
+
+
+## Local Variables:
+## mode: python
+## py-indent-offset: 4
+## tab-width: 4
+## fill-column: 78
+## End:
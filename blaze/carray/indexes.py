@@ -0,0 +1,614 @@
+"""Secondary indexes for ctable columns.
+
+An index keeps a copy of the values of a column in a given order,
+together with the row ids where they come from.  Both are stored as
+(compressed and chunked) carrays, so that they can be persisted in the
+rootdir of the ctable.  There are two kinds of indexes:
+
+* 'sorted': values are sorted, so equality, membership and range
+  lookups are done by binary searches.
+
+* 'hash': values are grouped in hash buckets, so equality and
+  membership lookups only have to look into a few buckets.
+
+Rows appended after the last build of an index live in an unindexed
+tail that is scanned during lookups.  The index is rebuilt when this
+tail becomes large compared to the indexed part.
+
+Indexes are built with an external merge sort: the column is sorted in
+runs that fit in a memory budget, the runs are spilled to carrays on
+disk and then merged block by block, so columns larger than the memory
+can be indexed.
+"""
+
+import sys
+import ast
+import json
+import os, os.path
+import shutil
+import tempfile
+
+import numpy as np
+
+# See the note in toplevel.py about importing the package here
+ca = sys.modules['blaze.carray']
+
+INDEXESDIR = '__indexes__'
+METAFILE = '__meta__'
+
+# The multiplier for the Fibonacci hashing of numerical values
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+# The parameters of the FNV-1a hashing of other values
+_FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+_FNV_PRIME = np.uint64(0x100000001B3)
+
+
+def hashes(values):
+    """
+    hashes(values)
+
+    Return an array with the (uint64) hashes of every item in `values`.
+
+    Equal values get equal hashes, and the high bits of the hashes are
+    well distributed, so they can be used for choosing buckets.  The
+    hashes only depend on the bytes of the values, so they can be
+    persisted (unlike the ones of the `hash()` builtin, which change
+    with the interpreter and with PYTHONHASHSEED).
+
+    """
+    if values.dtype.kind in 'biuf' and values.dtype.itemsize <= 8:
+        if values.dtype.kind == 'f':
+            # Make -0.0 and 0.0 get the same hash
+            values = values + values.dtype.type(0)
+        bits = np.ascontiguousarray(values).view('u%d' % values.dtype.itemsize)
+        bits = bits.astype(np.uint64)
+    elif values.dtype.kind == 'O':
+        raise TypeError, "can only hash values of a fixed size"
+    else:
+        # FNV-1a over the bytes of every item
+        values = np.ascontiguousarray(values)
+        itemsize = values.dtype.itemsize
+        data = values.view(np.uint8).reshape(len(values), itemsize)
+        bits = np.empty(len(values), dtype=np.uint64)
+        bits.fill(_FNV_OFFSET)
+        with np.errstate(over='ignore'):
+            for i in xrange(itemsize):
+                bits ^= data[:, i]
+                bits *= _FNV_PRIME
+    with np.errstate(over='ignore'):
+        return bits * _GOLDEN
+
+
+def _hash(values, nbits):
+    """Return the bucket (an `nbits` integer) for every item in `values`."""
+    if nbits == 0:
+        return np.zeros(len(values), dtype=np.int64)
+    return (hashes(values) >> np.uint64(64 - nbits)).astype(np.int64)
+
+
+def scan(column, pred, start=0, stop=None):
+    """
+    scan(column, pred, start=0, stop=None)
+
+    Return the row ids in [`start`, `stop`) of `column` satisfying `pred`.
+
+    `pred` is a predicate in the form returned by `parse_predicate()`.
+
+    """
+    if stop is None:
+        stop = len(column)
+    if type(column) is ca.categorical and pred[0] == 'in':
+        # Compare the codes instead of the values
+        column, pred = column.codes, ('in', column.lookup(pred[1]))
+    rowids = [np.empty(0, dtype=np.int64)]
+    bsize = column.chunklen
+    for i in xrange(start, stop, bsize):
+        block = column[i:min(i+bsize, stop)]
+        rowids.append(np.flatnonzero(_mask(block, pred)) + i)
+    return np.concatenate(rowids)
+
+
+def _mask(values, pred):
+    """Return a boolean array telling where `values` satisfy `pred`."""
+    if pred[0] == 'in':
+        return np.in1d(values, pred[1])
+    lo, loincl, hi, hiincl = pred[1:]
+    mask = np.ones(len(values), dtype=np.bool_)
+    if lo is not None:
+        mask &= (values >= lo) if loincl else (values > lo)
+    if hi is not None:
+        mask &= (values <= hi) if hiincl else (values < hi)
+    return mask
+
+
+def _merge_runs(runs, key, bufsize):
+    """Merge the sorted `runs` (ctables with 'values' and 'rowids').
+
+    The runs are read in buffers of `bufsize` rows.  Yields sorted
+    ``(keys, values, rowids)`` blocks, with equal keys in the order of
+    the runs.
+    """
+    nruns = len(runs)
+    pos = [0] * nruns
+    bufs = [None] * nruns
+    while True:
+        for r, run in enumerate(runs):
+            empty = bufs[r] is None or len(bufs[r][0]) == 0
+            if empty and pos[r] < len(run):
+                values = run.cols['values'][pos[r]:pos[r]+bufsize]
+                rowids = run.cols['rowids'][pos[r]:pos[r]+bufsize]
+                bufs[r] = (key(values), values, rowids)
+                pos[r] += len(values)
+        live = [r for r in xrange(nruns)
+                if bufs[r] is not None and len(bufs[r][0]) > 0]
+        if not live:
+            return
+        # Only the keys up to the smallest of the last buffered keys of
+        # the runs that are not exhausted are known to come before the
+        # keys still on disk (np.sort() takes care of NaNs)
+        lasts = [bufs[r][0][-1:] for r in live if pos[r] < len(runs[r])]
+        limit = np.sort(np.concatenate(lasts))[0] if lasts else None
+        blocks = []
+        for r in live:
+            keys, values, rowids = bufs[r]
+            n = len(keys)
+            if limit is not None:
+                n = keys.searchsorted(limit, 'right')
+            blocks.append((keys[:n], values[:n], rowids[:n]))
+            bufs[r] = (keys[n:], values[n:], rowids[n:])
+        keys, values, rowids = [np.concatenate([b[j] for b in blocks])
+                                for j in range(3)]
+        order = np.argsort(keys, kind='mergesort')
+        yield keys[order], values[order], rowids[order]
+
+
+def gather(column, rowids):
+    """
+    gather(column, rowids)
+
+    Return the values of `column` for the sorted array of `rowids`.
+
+    Only the blocks of `column` containing some of the `rowids` are
+    decompressed.
+
+    """
+    out = np.empty(len(rowids), dtype=column.dtype)
+    bsize = column.chunklen
+    pos = 0
+    while pos < len(rowids):
+        start = rowids[pos] - rowids[pos] % bsize
+        end = pos + np.searchsorted(rowids[pos:], start + bsize)
+        block = column[start:min(start + bsize, len(column))]
+        out[pos:end] = block[rowids[pos:end] - start]
+        pos = end
+    return out
+
+
+class _index(object):
+    """Base class for indexes.  Subclasses must implement `_build()`,
+    `_open()` and `_lookup()`."""
+
+    kind = None
+
+    # The number of bytes for sorting the values (and their row ids) in
+    # memory while building the index
+    membudget = 2**28
+
+    def __init__(self, rootdir=None, mode='a', _new=True):
+        self.rootdir = rootdir
+        "The directory where this index is saved."
+        self.mode = mode
+        self.nindexed = 0
+        "The number of leading rows of the column that are in the index."
+        if rootdir and not _new:
+            with open(os.path.join(rootdir, METAFILE), 'rb') as mfile:
+                meta = json.loads(mfile.read())
+            self.nindexed = meta['nindexed']
+            self._open(meta)
+
+    def _carray(self, name, array=None, **kwargs):
+        """Create (or open if `array` is None) the `name` carray."""
+        rootdir = None
+        if self.rootdir:
+            rootdir = os.path.join(self.rootdir, name)
+        if array is None:
+            return ca.carray(rootdir=rootdir, mode=self.mode)
+        return ca.carray(array, rootdir=rootdir, mode='w', **kwargs)
+
+    def _update_meta(self, **meta):
+        """Update the meta-information on-disk."""
+        if not self.rootdir:
+            return
+        meta.update(kind=self.kind, nindexed=self.nindexed)
+        with open(os.path.join(self.rootdir, METAFILE), 'wb') as mfile:
+            mfile.write(json.dumps(meta))
+            mfile.write("\n")
+
+    def build(self, column):
+        """
+        build(column)
+
+        (Re-)build the index for all the rows in `column`.
+
+        """
+        if self.rootdir and not os.path.exists(self.rootdir):
+            os.makedirs(self.rootdir)
+        self.nindexed = len(column)
+        self._build(column)
+
+    def _sorted(self, column, key):
+        """Yield the values of `column` in blocks, sorted by `key`.
+
+        `key` maps an array of values to their sort keys.  Every block is
+        a ``(keys, values, rowids)`` tuple.  The sort is stable, so equal
+        keys come in the order of their row ids.
+        """
+        rowbytes = column.dtype.itemsize + 16
+        runlen = max(self.membudget // rowbytes, 1)
+        if len(column) <= runlen:
+            values = column[:]
+            keys = key(values)
+            order = np.argsort(keys, kind='mergesort')
+            yield keys[order], values[order], order.astype(np.int64)
+            return
+        tmpdir = tempfile.mkdtemp(prefix='index-')
+        try:
+            runs = []
+            for start in xrange(0, len(column), runlen):
+                values = column[start:start+runlen]
+                order = np.argsort(key(values), kind='mergesort')
+                rootdir = os.path.join(tmpdir, "run%d" % len(runs))
+                runs.append(ca.ctable([values[order],
+                                       order.astype(np.int64) + start],
+                                      ['values', 'rowids'],
+                                      rootdir=rootdir, mode='w'))
+            bufsize = max(runlen // (2 * len(runs)), 1024)
+            for block in _merge_runs(runs, key, bufsize):
+                yield block
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def update(self, column):
+        """
+        update(column)
+
+        Take into account the rows appended to `column`.
+
+        Appended rows are kept in a tail that is scanned during lookups,
+        and the index is rebuilt when the tail gets larger than a chunk
+        and than 1/8 of the indexed rows.
+
+        """
+        ntail = len(column) - self.nindexed
+        if ntail > max(column.chunklen, self.nindexed // 8):
+            self.build(column)
+
+    def lookup(self, column, pred):
+        """
+        lookup(column, pred)
+
+        Return the sorted row ids of `column` satisfying `pred`, or None
+        if this kind of index cannot resolve `pred`.
+
+        """
+        if self.nindexed > len(column):
+            # The column has been shrunk under our feet
+            self.build(column)
+        rowids = self._lookup(pred)
+        if rowids is None:
+            return None
+        rowids.sort()
+        tail = scan(column, pred, self.nindexed, len(column))
+        return np.concatenate((rowids, tail))
+
+    def __repr__(self):
+        return "%s(nindexed=%d)" % (self.kind, self.nindexed)
+
+
+class sortedindex(_index):
+    """An index keeping the values of a column sorted."""
+
+    kind = 'sorted'
+
+    def _build(self, column):
+        self.values = self._carray('values', np.empty(0, column.dtype),
+                                   expectedlen=len(column))
+        self.rowids = self._carray('rowids', np.empty(0, np.int64),
+                                   expectedlen=len(column))
+        for keys, values, rowids in self._sorted(column, lambda v: v):
+            self.values.append(values)
+            self.rowids.append(rowids)
+        self.values.flush()
+        self.rowids.flush()
+        self._set_bounds()
+        self._update_meta()
+
+    def _open(self, meta):
+        self.values = self._carray('values')
+        self.rowids = self._carray('rowids')
+        self._set_bounds()
+
+    def _set_bounds(self):
+        # The first value of every chunk is kept in memory so that binary
+        # searches only have to decompress a single chunk
+        self.bounds = self.values[::self.values.chunklen]
+
+    def _searchsorted(self, value, side):
+        clen = self.values.chunklen
+        nchunk = max(self.bounds.searchsorted(value, side) - 1, 0)
+        start = nchunk * clen
+        block = self.values[start:start + clen]
+        return start + block.searchsorted(value, side)
+
+    def _lookup(self, pred):
+        if pred[0] == 'in':
+            ranges = [(v, True, v, True) for v in np.unique(pred[1])]
+        else:
+            ranges = [pred[1:]]
+        rowids = [np.empty(0, dtype=np.int64)]
+        for lo, loincl, hi, hiincl in ranges:
+            start, stop = 0, self.nindexed
+            if lo is not None:
+                start = self._searchsorted(lo, 'left' if loincl else 'right')
+            if hi is not None:
+                stop = self._searchsorted(hi, 'right' if hiincl else 'left')
+            if start < stop:
+                rowids.append(self.rowids[start:stop])
+        return np.concatenate(rowids)
+
+
+class hashindex(_index):
+    """An index grouping the values of a column in hash buckets."""
+
+    kind = 'hash'
+
+    def _build(self, column):
+        # Aim at 8 values per bucket on average
+        self.nbits = nbits = int(np.log2(max(len(column) // 8, 1)))
+        nbuckets = 1 << nbits
+        self.values = self._carray('values', np.empty(0, column.dtype),
+                                   expectedlen=len(column))
+        self.rowids = self._carray('rowids', np.empty(0, np.int64),
+                                   expectedlen=len(column))
+        # The offsets of the buckets are appended as soon as the values
+        # of the buckets before them are known
+        self.offsets = offsets = self._carray(
+            'offsets', np.zeros(1, np.int64), expectedlen=nbuckets + 1)
+        nextbucket, ndone = 1, 0
+        for keys, values, rowids in self._sorted(
+            column, lambda v: _hash(v, nbits)):
+            if len(keys) == 0:
+                continue
+            self._add_offsets(keys, nextbucket, keys[-1] + 1, ndone)
+            nextbucket = keys[-1] + 1
+            self.values.append(values)
+            self.rowids.append(rowids)
+            ndone += len(keys)
+        self._add_offsets(np.empty(0, np.int64), nextbucket, nbuckets + 1,
+                          ndone)
+        for carray in (self.values, self.rowids, self.offsets):
+            carray.flush()
+        self._update_meta(nbits=self.nbits)
+
+    def _add_offsets(self, buckets, start, stop, ndone):
+        """Append the offsets of the buckets in [`start`, `stop`).
+
+        `buckets` are the sorted buckets of the values following the
+        `ndone` first ones, and no value after them is in a bucket
+        before `stop` - 1.
+        """
+        step = self.offsets.chunklen
+        for i in xrange(start, stop, step):
+            self.offsets.append(ndone + buckets.searchsorted(
+                np.arange(i, min(i + step, stop))))
+
+    def _open(self, meta):
+        self.nbits = meta['nbits']
+        self.values = self._carray('values')
+        self.rowids = self._carray('rowids')
+        self.offsets = self._carray('offsets')
+
+    def _lookup(self, pred):
+        if pred[0] != 'in':
+            return None
+        values = np.unique(pred[1])
+        # Values that cannot be represented in the column type will not
+        # match anyway, so they can be hashed after a lossy cast
+        with np.errstate(all='ignore'):
+            buckets = _hash(values.astype(self.values.dtype), self.nbits)
+        rowids = [np.empty(0, dtype=np.int64)]
+        for value, bucket in zip(values, buckets):
+            start, stop = self.offsets[bucket:bucket+2]
+            if start < stop:
+                mask = self.values[start:stop] == value
+                rowids.append(self.rowids[start:stop][mask])
+        return np.concatenate(rowids)
+
+
+kinds = {'sorted': sortedindex, 'hash': hashindex}
+"""The available kinds of indexes."""
+
+
+def open_indexes(rootdir, mode):
+    """Return a dictionary with the indexes persisted in `rootdir`."""
+    indexes = {}
+    indexesdir = os.path.join(rootdir, INDEXESDIR)
+    if os.path.isdir(indexesdir):
+        for name in os.listdir(indexesdir):
+            idxdir = os.path.join(indexesdir, name)
+            with open(os.path.join(idxdir, METAFILE), 'rb') as mfile:
+                kind = json.loads(mfile.read())['kind']
+            indexes[name] = kinds[kind](idxdir, mode, _new=False)
+    return indexes
+
+
+def remove_index(rootdir, name):
+    """Remove the index for the `name` column persisted in `rootdir`."""
+    idxdir = os.path.join(rootdir, INDEXESDIR, name)
+    if os.path.isdir(idxdir):
+        shutil.rmtree(idxdir)
+
+
+# Predicates
+# ``````````
+
+_cmpops = {ast.Eq: 'eq', ast.Lt: 'lt', ast.LtE: 'le', ast.Gt: 'gt',
+           ast.GtE: 'ge', ast.In: 'in'}
+_flipped = {'eq': 'eq', 'lt': 'gt', 'le': 'ge', 'gt': 'lt', 'ge': 'le'}
+
+
+class _NotSimple(Exception):
+    pass
+
+
+def parse_predicate(expression, names, user_dict):
+    """
+    parse_predicate(expression, names, user_dict)
+
+    Parse a boolean `expression` made of simple predicates on columns.
+
+    Simple predicates are ``col == value``, ``col in (v1, v2...)``,
+    comparisons like ``col < value`` and chained ranges like
+    ``lo <= col < hi``.  They can be combined with `and`, `or`, `&` and
+    `|`.  Values are literals or names looked up in `user_dict`.
+
+    Returns a tree of nested ``('and'|'or', [subtrees])`` tuples whose
+    leaves are ``(colname, pred)`` pairs, or None if `expression` is not
+    of this form.  A `pred` is either ``('in', values)`` or ``('range', lo,
+    loincl, hi, hiincl)`` where `lo` and `hi` can be None.
+
+    """
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+        return _parse(tree.body, names, user_dict)
+    except (SyntaxError, _NotSimple):
+        return None
+
+
+def _value(node, user_dict):
+    """Return the Python value of a literal `node`."""
+    if isinstance(node, ast.Num):
+        return node.n
+    elif isinstance(node, ast.Str):
+        return node.s
+    elif (isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub)
+          and isinstance(node.operand, ast.Num)):
+        return -node.operand.n
+    elif isinstance(node, (ast.Tuple, ast.List)):
+        return [_value(elt, user_dict) for elt in node.elts]
+    elif isinstance(node, ast.Name):
+        if node.id in ('True', 'False'):
+            return node.id == 'True'
+        if node.id in user_dict:
+            value = user_dict[node.id]
+            if np.isscalar(value) or isinstance(value, (list, tuple)):
+                return value
+    raise _NotSimple
+
+
+def _parse(node, names, user_dict):
+    if isinstance(node, ast.BoolOp) or (
+        isinstance(node, ast.BinOp) and
+        isinstance(node.op, (ast.BitAnd, ast.BitOr))):
+        if isinstance(node, ast.BoolOp):
+            op = 'and' if isinstance(node.op, ast.And) else 'or'
+            operands = node.values
+        else:
+            op = 'and' if isinstance(node.op, ast.BitAnd) else 'or'
+            operands = [node.left, node.right]
+        return (op, [_parse(operand, names, user_dict)
+                     for operand in operands])
+    if not isinstance(node, ast.Compare):
+        raise _NotSimple
+    if any(type(op) not in _cmpops for op in node.ops):
+        raise _NotSimple
+    ops = [_cmpops[type(op)] for op in node.ops]
+    operands = [node.left] + node.comparators
+    iscol = [isinstance(operand, ast.Name) and operand.id in names
+             for operand in operands]
+    if len(ops) == 1 and iscol == [True, False]:
+        # col <op> value
+        name, op = operands[0].id, ops[0]
+        value = _value(operands[1], user_dict)
+    elif len(ops) == 1 and iscol == [False, True] and ops[0] != 'in':
+        # value <op> col
+        name, op = operands[1].id, _flipped[ops[0]]
+        value = _value(operands[0], user_dict)
+    elif (len(ops) == 2 and iscol == [False, True, False] and
+          ops[0] in ('lt', 'le') and ops[1] in ('lt', 'le')):
+        # lo <op> col <op> hi
+        lo, hi = _value(operands[0], user_dict), _value(operands[2], user_dict)
+        return (operands[1].id,
+                ('range', lo, ops[0] == 'le', hi, ops[1] == 'le'))
+    else:
+        raise _NotSimple
+    if op == 'in':
+        if np.isscalar(value):
+            raise _NotSimple
+        return (name, ('in', np.asarray(value)))
+    if not np.isscalar(value):
+        raise _NotSimple
+    if op == 'eq':
+        return (name, ('in', np.asarray([value])))
+    if op in ('lt', 'le'):
+        return (name, ('range', None, False, value, op == 'le'))
+    return (name, ('range', value, op == 'ge', None, False))
+
+
+def uses_index(tree, indexes):
+    """Tell whether resolving `tree` would take advantage of `indexes`."""
+    if tree[0] in ('and', 'or'):
+        return any(uses_index(subtree, indexes) for subtree in tree[1])
+    name, pred = tree
+    return name in indexes and (indexes[name].kind == 'sorted' or
+                                pred[0] == 'in')
+
+
+def has_membership(expression):
+    """Tell whether `expression` has ``col in (...)`` tests, which can only
+    be resolved by lookups or scans (eval() does not support them)."""
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except SyntaxError:
+        return False
+    return any(isinstance(node, ast.Compare) and
+               any(isinstance(op, ast.In) for op in node.ops)
+               for node in ast.walk(tree))
+
+
+def resolve(tree, cols, indexes):
+    """
+    resolve(tree, cols, indexes)
+
+    Return the sorted row ids satisfying the predicate `tree` (as returned
+    by `parse_predicate()`) by using `indexes` when possible and by
+    scanning the columns in `cols` otherwise.
+
+    """
+    if tree[0] in ('and', 'or'):
+        rowids = None
+        for subtree in tree[1]:
+            subrowids = resolve(subtree, cols, indexes)
+            if rowids is None:
+                rowids = subrowids
+            elif tree[0] == 'and':
+                rowids = np.intersect1d(rowids, subrowids, assume_unique=True)
+            else:
+                rowids = np.union1d(rowids, subrowids)
+        return rowids
+    name, pred = tree
+    rowids = None
+    if name in indexes:
+        rowids = indexes[name].lookup(cols[name], pred)
+    if rowids is None:
+        rowids = scan(cols[name], pred)
+    return rowids
+
+
+## Local Variables:
+## mode: python
+## py-indent-offset: 4
+## tab-width: 4
+## fill-column: 78
+## End:
@@ -0,0 +1,257 @@
+"""Hash joins between ctable objects.
+
+The keys of the right table (the build side) are sorted together with
+their row ids, and blocks of keys of the left table (the probe side) are
+looked up with vectorized binary searches.  Only the (left, right) row
+id pairs are computed this way; the values of the output columns are
+gathered afterwards, decompressing just the chunks that are needed.
+
+When the keys of the right table do not fit in the memory budget, the
+keys and row ids of both tables are hash-partitioned into temporary
+ctables on disk, and every pair of partitions is joined on its own by a
+pool of threads.
+"""
+
+import sys
+import os, os.path
+import shutil
+import tempfile
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+import indexes, groupby
+
+# See the note in toplevel.py about importing the package here
+ca = sys.modules['blaze.carray']
+
+
+def _keys(table, names, dtype, start, stop):
+    """Get the keys in the [start, stop) block of `table` with `dtype`."""
+    if len(names) == 1:
+        return table.cols[names[0]][start:stop].astype(dtype, copy=False)
+    keys = np.empty(stop - start, dtype=dtype)
+    for name in names:
+        keys[name] = table.cols[name][start:stop]
+    return keys
+
+
+def _blocks(table, names, dtype):
+    """Iterate over the (keys, rowids) blocks of `table`."""
+    bsize = table.cols[names[0]].chunklen
+    for i in xrange(0, len(table), bsize):
+        stop = min(i + bsize, len(table))
+        yield (_keys(table, names, dtype, i, stop),
+               np.arange(i, stop, dtype=np.int64))
+
+
+def _sort(keys, rowids):
+    order = np.argsort(keys, kind='mergesort')
+    return keys[order], rowids[order]
+
+
+def _probe(lkeys, lrowids, rkeys, rrowids, how):
+    """Match `lkeys` against the sorted `rkeys`.
+
+    Returns the arrays of left and right row ids of the matches, sorted
+    by left row id.  Unmatched left rows get a right row id of -1 if
+    `how` is 'left'.
+    """
+    lo = np.searchsorted(rkeys, lkeys, 'left')
+    counts = np.searchsorted(rkeys, lkeys, 'right') - lo
+    lidx = np.repeat(lrowids, counts)
+    # The positions in `rkeys` of every match: lo, lo+1... for each row
+    ends = np.cumsum(counts)
+    pos = np.arange(ends[-1] if len(ends) else 0, dtype=np.int64)
+    pos += np.repeat(lo - (ends - counts), counts)
+    ridx = rrowids[pos]
+    if how == 'left':
+        unmatched = counts == 0
+        lidx = np.concatenate((lidx, lrowids[unmatched]))
+        ridx = np.concatenate(
+            (ridx, np.repeat(np.int64(-1), unmatched.sum())))
+    order = np.argsort(lidx, kind='mergesort')
+    return lidx[order], ridx[order]
+
+
+def _gather(column, rowids):
+    """Gather the values of `column` for unsorted `rowids` (-1 is dflt)."""
+    out = np.empty(len(rowids), dtype=column.dtype)
+    valid = rowids >= 0
+    out[~valid] = column.dflt
+    order = np.argsort(rowids[valid], kind='mergesort')
+    values = indexes.gather(column, rowids[valid][order])
+    valid_out = np.empty(len(order), dtype=column.dtype)
+    valid_out[order] = values
+    out[valid] = valid_out
+    return out
+
+
+def _imap(pool, func, iterable, nthreads):
+    """Like `pool.imap()` but with a bounded number of tasks in flight."""
+    if pool is None:
+        for args in iterable:
+            yield func(*args)
+        return
+    inflight = deque()
+    for args in iterable:
+        inflight.append(pool.apply_async(func, args))
+        if len(inflight) >= 2 * nthreads:
+            yield inflight.popleft().get()
+    while inflight:
+        yield inflight.popleft().get()
+
+
+class _partitioner(object):
+    """Hash-partition (keys, rowids) blocks into ctables in a directory."""
+
+    def __init__(self, tmpdir, nparts, names):
+        self.tmpdir = tmpdir
+        os.mkdir(tmpdir)
+        self.nparts = nparts
+        self.names = names + ['rowid__']
+        self.parts = [None] * nparts
+
+    def add(self, keys, rowids):
+        parts = groupby._partition(keys, self.nparts)
+        order = np.argsort(parts, kind='mergesort')
+        bounds = np.searchsorted(parts[order], np.arange(self.nparts + 1))
+        for p in range(self.nparts):
+            idx = order[bounds[p]:bounds[p+1]]
+            if len(idx) == 0:
+                continue
+            if keys.dtype.names:
+                columns = [keys[name][idx] for name in keys.dtype.names]
+            else:
+                columns = [keys[idx]]
+            columns.append(rowids[idx])
+            if self.parts[p] is None:
+                rootdir = os.path.join(self.tmpdir, "part%d" % p)
+                self.parts[p] = ca.ctable(columns, self.names,
+                                          rootdir=rootdir, mode='w')
+            else:
+                self.parts[p].append(columns)
+
+    def get(self, p, dtype):
+        """Return the (keys, rowids) in the partition `p`."""
+        part = self.parts[p]
+        if part is None:
+            return np.empty(0, dtype=dtype), np.empty(0, dtype=np.int64)
+        part.flush()
+        keys = _keys(part, self.names[:-1], dtype, 0, len(part))
+        return keys, part.cols['rowid__'][:]
+
+
+def join(left, right, on, how='inner', outcols=None, rsuffix='_r',
+         membudget=2**28, nthreads=None, **kwargs):
+    """
+    join(left, right, on, how='inner', outcols=None, rsuffix='_r',
+         membudget=2**28, nthreads=None, **kwargs)
+
+    Join the `left` and `right` ctables on the `on` columns.
+
+    See `ctable.join()` for the description of the parameters.
+
+    """
+
+    # Check params
+    if type(on) is str:
+        on = on.replace(',', ' ').split()
+    on = list(on)
+    if not on:
+        raise ValueError, "`on` cannot be empty"
+    for name in on:
+        if name not in left.names or name not in right.names:
+            raise ValueError, "'%s' is not a column of both tables" % name
+    if how not in ('inner', 'left'):
+        raise ValueError, "`how` must be either 'inner' or 'left'"
+    if nthreads is None:
+        nthreads = ca.ncores
+
+    # The output columns and where they come from
+    sources = [(name, left, name) for name in left.names]
+    for name in right.names:
+        if name not in on:
+            outname = name + rsuffix if name in left.names else name
+            sources.append((outname, right, name))
+    if outcols is not None:
+        if type(outcols) is str:
+            outcols = outcols.replace(',', ' ').split()
+        bynames = dict((source[0], source) for source in sources)
+        for name in outcols:
+            if name not in bynames:
+                raise ValueError, "'%s' is not an output column" % name
+        sources = [bynames[name] for name in outcols]
+
+    # Keys of both sides are compared with a common dtype
+    dtypes = [np.result_type(left.cols[name].dtype, right.cols[name].dtype)
+              for name in on]
+    if len(on) == 1:
+        dtype = dtypes[0]
+    else:
+        dtype = np.dtype(zip(on, dtypes))
+
+    result = ca.ctable([np.empty(0, dtype=src.cols[name].dtype)
+                        for outname, src, name in sources],
+                       [outname for outname, src, name in sources], **kwargs)
+
+    def emit(pairs):
+        lidx, ridx = pairs
+        if len(lidx) == 0:
+            return
+        columns = []
+        for outname, src, name in sources:
+            if src is left:
+                columns.append(indexes.gather(left.cols[name], lidx))
+            else:
+                columns.append(_gather(right.cols[name], ridx))
+        result.append(columns)
+
+    pool = ThreadPool(nthreads) if nthreads > 1 else None
+    tmpdir = None
+    try:
+        rbytes = len(right) * (dtype.itemsize + 8)
+        if rbytes <= membudget:
+            # The build side fits in memory: probe it with left blocks
+            rkeys = _keys(right, on, dtype, 0, len(right))
+            rkeys, rrowids = _sort(rkeys, np.arange(len(right),
+                                                    dtype=np.int64))
+            tasks = ((lkeys, lrowids, rkeys, rrowids, how)
+                     for lkeys, lrowids in _blocks(left, on, dtype))
+            for pairs in _imap(pool, _probe, tasks, nthreads):
+                emit(pairs)
+        else:
+            # Partition both sides so that every right partition fits
+            nparts = 2 ** int(np.ceil(np.log2(2 * rbytes // membudget)))
+            tmpdir = tempfile.mkdtemp(prefix='join-')
+            sides = []
+            for side, table in (('left', left), ('right', right)):
+                partitioner = _partitioner(
+                    os.path.join(tmpdir, side), nparts, on)
+                for keys, rowids in _blocks(table, on, dtype):
+                    partitioner.add(keys, rowids)
+                sides.append(partitioner)
+            def join_partition(p):
+                lkeys, lrowids = sides[0].get(p, dtype)
+                rkeys, rrowids = _sort(*sides[1].get(p, dtype))
+                return _probe(lkeys, lrowids, rkeys, rrowids, how)
+            for pairs in _imap(pool, join_partition,
+                               ((p,) for p in range(nparts)), nthreads):
+                emit(pairs)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+    result.flush()
+    return result
+
+
+## Local Variables:
+## mode: python
+## py-indent-offset: 4
+## tab-width: 4
+## fill-column: 78
+## End:
@@ -1,5 +1,6 @@
 import sys
 import struct
+import threading
 import unittest
 import os, os.path
 
@@ -43,3 +44,245 @@ class chunkTest(unittest.TestCase):
         b = chunk(a, atom=a.dtype, cparams=ca.cparams())
         #print "b[1:8000]->", `b[1:8000]`
         assert_array_equal(a[1:8000], b[1:8000], "Arrays are not equal")
+
+    def test05(self):
+        """Testing chunks compressed and read by several threads at once"""
+        arrays = [np.arange(1e5) * i for i in range(8)]
+        results = [None] * len(arrays)
+        def work(i):
+            a = arrays[i]
+            for j in range(10):
+                b = chunk(a, atom=a.dtype, cparams=ca.cparams(clevel=j % 9))
+                results[i] = (b[:], b[10:1000])
+        threads = [threading.Thread(target=work, args=(i,))
+                   for i in range(len(arrays))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for a, (b, c) in zip(arrays, results):
+            assert_array_equal(a, b, "Arrays are not equal")
+            assert_array_equal(a[10:1000], c, "Arrays are not equal")
+
+
+class evalReduceTest(unittest.TestCase):
+
+    vm = "python"
+    N = 100*1000 + 7
+
+    def setUp(self):
+        self.a = np.arange(self.N, dtype='f8')
+        self.b = np.arange(self.N, dtype='i4') % 7
+        self.ca = ca.carray(self.a)
+        self.cb = ca.carray(self.b)
+
+    def test00(self):
+        """Testing streaming reductions in `eval()`"""
+        ca_, cb, a, b = self.ca, self.cb, self.a, self.b
+        for fname in ('sum', 'min', 'max', 'mean'):
+            result = ca.eval("%s(ca_ - cb)" % fname, vm=self.vm)
+            expected = getattr(np, fname)(a - b)
+            assert_array_almost_equal(result, expected,
+                                      err_msg="%s() is not correct" % fname)
+        small = ca.carray(np.arange(1, 11, dtype='f8'), chunklen=4)
+        self.assertEqual(ca.eval("prod(small)", vm=self.vm), 3628800)
+
+    def test01(self):
+        """Testing boolean reductions in `eval()`"""
+        cb = self.cb
+        self.assert_(ca.eval("any(cb > 5)", vm=self.vm))
+        self.assert_(not ca.eval("any(cb > 6)", vm=self.vm))
+        self.assert_(ca.eval("all(cb < 7)", vm=self.vm))
+
+    def test02(self):
+        """Testing expressions mixing several reductions in `eval()`"""
+        ca_, cb, a, b = self.ca, self.cb, self.a, self.b
+        result = ca.eval("sum(ca_*cb) / sum(cb) + 1", vm=self.vm)
+        expected = (a*b).sum() / b.sum() + 1
+        self.assertAlmostEqual(result, expected)
+
+    def test03(self):
+        """Testing reductions over empty operands in `eval()`"""
+        user_dict = {'empty': ca.carray(np.empty(0, dtype='f8'))}
+        self.assertEqual(
+            ca.eval("sum(empty)", vm=self.vm, user_dict=user_dict), 0)
+        self.assertRaises(ValueError, ca.eval, "max(empty)", vm=self.vm,
+                          user_dict=user_dict)
+
+    def test04(self):
+        """Testing reductions over operands of different lengths"""
+        ca_, a = self.ca, self.a
+        short = ca.carray(self.b[:1000])
+        result = ca.eval("sum(ca_) + sum(short) * max(ca_ + 1)", vm=self.vm)
+        expected = a.sum() + self.b[:1000].sum() * (a + 1).max()
+        self.assertAlmostEqual(result, expected)
+        self.assertRaises(ValueError, ca.eval, "sum(ca_ + short)",
+                          vm=self.vm, user_dict={'ca_': ca_, 'short': short})
+
+
+class evalReduceNumexprTest(evalReduceTest):
+    vm = "numexpr"
+
+if not ca.numexpr_here:
+    del evalReduceNumexprTest
+
+class evalReduceUfuncTest(evalReduceTest):
+    vm = "ufunc"
+
+
+class countingcarray(ca.carray):
+    "A carray that counts the slices taken out of it."
+    nslices = 0
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            self.nslices += 1
+        return super(countingcarray, self).__getitem__(key)
+
+
+class evalConjunctionTest(unittest.TestCase):
+
+    vm = "python"
+    N = 100*1000 + 7
+
+    def setUp(self):
+        self.a = np.arange(self.N, dtype='f8')
+        self.b = np.arange(self.N, dtype='i4') % 7
+        self.ca = ca.carray(self.a)
+        self.cb = ca.carray(self.b)
+
+    def test00(self):
+        """Testing the splitting of conjunctions in `eval()`"""
+        split = ca.toplevel._split_conjuncts
+        self.assertEqual(split("(a > 5) & (b == 3) & (c < 1.0)"),
+                         ['(a > 5)', '(b == 3)', '(c < 1.0)'])
+        self.assertEqual(split("((a > 5) & ((b == 3) & c))"),
+                         ['(a > 5)', '(b == 3)', 'c'])
+        # `&` binds tighter than comparisons and looser than `|`
+        self.assertEqual(split("a > 5 & b"), ['a > 5 & b'])
+        self.assertEqual(split("(a > 5) | (b == 3) & c"),
+                         ['(a > 5) | (b == 3) & c'])
+        self.assertEqual(split("f(a & b)"), ['f(a & b)'])
+
+    def test01(self):
+        """Testing the evaluation of conjunctions in `eval()`"""
+        ca_, cb, a, b = self.ca, self.cb, self.a, self.b
+        result = ca.eval("(ca_ > 50000) & (cb == 3) & (ca_ % 2 == 0)",
+                         vm=self.vm)
+        assert_array_equal(result[:], (a > 50000) & (b == 3) & (a % 2 == 0))
+        result = ca.eval("(cb < 6) & (ca_ < 10)", vm=self.vm,
+                         out_flavor="numpy")
+        assert_array_equal(result, (b < 6) & (a < 10))
+        # Non boolean operands are not conjuncts
+        result = ca.eval("(cb + 1) & 6", vm="python")
+        assert_array_equal(result[:], (b + 1) & 6)
+        if self.vm != "numexpr":  # numexpr cannot mix booleans and ints
+            result = ca.eval("(ca_ > 5) & (cb + 1)", vm=self.vm)
+            assert_array_equal(result[:], (a > 5) & (b + 1))
+
+    def test02(self):
+        """Testing that conjunctions in `eval()` short-circuit"""
+        cb = self.cb
+        cc = countingcarray(self.a)
+        result = ca.eval("(cc > 0) & (cb > 7)", vm=self.vm)
+        self.assertEqual(result.sum(), 0)
+        # After the first block, the selective conjunct goes first and
+        # `cc` is not decompressed anymore
+        self.assertEqual(cc.nslices, 1)
+
+
+class evalConjunctionNumexprTest(evalConjunctionTest):
+    vm = "numexpr"
+
+if not ca.numexpr_here:
+    del evalConjunctionNumexprTest
+
+class evalConjunctionUfuncTest(evalConjunctionTest):
+    vm = "ufunc"
+
+
+class evalUfuncTest(unittest.TestCase):
+
+    N = 100*1000 + 7
+
+    def setUp(self):
+        self.a = np.arange(self.N, dtype='f8')
+        self.b = np.arange(self.N, dtype='i4') % 7
+        self.ca = ca.carray(self.a)
+        self.cb = ca.carray(self.b)
+
+    def test00(self):
+        """Testing elementwise expressions with the 'ufunc' vm"""
+        ca_, cb, a, b = self.ca, self.cb, self.a, self.b
+        result = ca.eval("2*ca_ + cb", vm="ufunc")
+        assert_array_almost_equal(result[:], 2*a + b)
+        result = ca.eval("sin(ca_) * cos(cb) - ca_ / (cb + 1)", vm="ufunc",
+                         out_flavor="numpy")
+        assert_array_almost_equal(result, np.sin(a) * np.cos(b) - a / (b + 1))
+        result = ca.eval("-ca_ ** 2 + abs(cb - 3)", vm="ufunc")
+        assert_array_almost_equal(result[:], -a ** 2 + abs(b - 3))
+        result = ca.eval("where(cb > 3, ca_, -ca_)", vm="ufunc")
+        assert_array_almost_equal(result[:], np.where(b > 3, a, -a))
+
+    def test01(self):
+        """Testing boolean expressions with the 'ufunc' vm"""
+        ca_, cb, a, b = self.ca, self.cb, self.a, self.b
+        result = ca.eval("(cb > 2) & (ca_ < 1000) | (cb == 0)", vm="ufunc")
+        assert_array_equal(result[:], (b > 2) & (a < 1000) | (b == 0))
+        result = ca.eval("1 < cb <= 4", vm="ufunc")
+        assert_array_equal(result[:], (1 < b) & (b <= 4))
+
+    def test02(self):
+        """Testing that the 'ufunc' vm rejects unsupported expressions"""
+        user_dict = {'ca_': self.ca}
+        self.assertRaises(NotImplementedError, ca.eval, "ca_[0] + 1",
+                          vm="ufunc", user_dict=user_dict)
+        self.assertRaises(NameError, ca.eval, "foo + 1", vm="ufunc",
+                          user_dict=user_dict)
+
+
+class distinctTest(unittest.TestCase):
+
+    N = 50*1000 + 3
+
+    def setUp(self):
+        rs = np.random.RandomState(3)
+        self.a = rs.randint(0, 20*1000, self.N)
+        self.ca = ca.carray(self.a, chunklen=1000)
+
+    def test00(self):
+        """Testing exact `count_distinct()` and `unique()`"""
+        a, c = self.a, self.ca
+        self.assertEqual(ca.count_distinct(c), len(np.unique(a)))
+        self.assertEqual(ca.count_distinct(c, 1234, 5678),
+                         len(np.unique(a[1234:5678])))
+        assert_array_equal(ca.unique(c)[:], np.unique(a))
+        assert_array_equal(ca.unique(c, 10, 10)[:], [])
+
+    def test01(self):
+        """Testing `count_distinct()` and `unique()` spilling to disk"""
+        a, c = self.a, self.ca
+        self.assertEqual(ca.count_distinct(c, membudget=2**14),
+                         len(np.unique(a)))
+        assert_array_equal(np.sort(ca.unique(c, membudget=2**14)[:]),
+                           np.unique(a))
+
+    def test02(self):
+        """Testing approximate `count_distinct()`"""
+        for n in (10, 1000, 100*1000):
+            sketch = ca.hll()
+            sketch.add(np.arange(n))
+            self.assertTrue(abs(sketch.estimate() - n) < 0.05 * n, n)
+        expected = len(np.unique(self.a))
+        estimate = ca.count_distinct(self.ca, approx=True)
+        self.assertTrue(abs(estimate - expected) < 0.05 * expected)
+
+    def test03(self):
+        """Testing `count_distinct()` merging chunk sketches"""
+        from blaze.carray.distinct import chunksketches
+        sketches = chunksketches()
+        for start, stop in ((0, None), (1500, 1600), (2500, 42000)):
+            expected = len(np.unique(self.a[start:stop]))
+            estimate = ca.count_distinct(self.ca, start, stop, approx=True,
+                                         sketches=sketches)
+            self.assertTrue(abs(estimate - expected) < 0.05 * expected)
+        self.assertEqual(len(sketches), self.N // 1000)
@@ -0,0 +1,697 @@
+import os
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+import blaze.carray as ca
+from blaze.carray import colstats
+
+from numpy.testing import assert_array_equal
+
+
+class createTest(unittest.TestCase):
+
+    N = 300*1000
+
+    def test00(self):
+        """Testing ctables built and appended from dicts of arrays"""
+        columns = {'a': np.arange(10), 'b': np.arange(10, dtype='f4')}
+        t = ca.ctable(columns)
+        self.assertEqual(t.names, ['a', 'b'])
+        t = ca.ctable(columns, names=['b', 'a'])
+        self.assertEqual(t.names, ['b', 'a'])
+        t.append({'a': [10], 'b': [10.]})
+        assert_array_equal(t['a'][:], np.arange(11))
+        self.assertRaises(ValueError, t.append, {'a': [11]})
+
+    def test01(self):
+        """Testing large ctables built and appended by several threads"""
+        N = self.N
+        ra = np.fromiter(((i, i*2., i % 7) for i in xrange(N)),
+                         dtype='i8,f8,i4', count=N)
+        rootdir = tempfile.mkdtemp(prefix='ctable-')
+        try:
+            t = ca.ctable(ra, rootdir=os.path.join(rootdir, 't'), mode='w')
+            t.append(ra)
+            t.append([ra['f0'], ra['f1'], ra['f2']])
+            t.flush()
+            t = ca.ctable(rootdir=os.path.join(rootdir, 't'))
+            assert_array_equal(t[:], np.concatenate([ra] * 3))
+        finally:
+            shutil.rmtree(rootdir)
+
+
+class lazyOpenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rootdir = tempfile.mkdtemp(prefix='ctable-')
+        self.ra = np.fromiter(((i, i*2., str(i % 5)) for i in xrange(1000)),
+                              dtype='i8,f8,S1', count=1000)
+        self.t = ca.ctable(self.ra, rootdir=os.path.join(self.rootdir, 't'),
+                           mode='w')
+
+    def tearDown(self):
+        shutil.rmtree(self.rootdir)
+
+    def reopen(self, mode='a'):
+        return ca.ctable(rootdir=os.path.join(self.rootdir, 't'), mode=mode)
+
+    def test00(self):
+        """Testing that len, names and dtype do not open any column"""
+        t = self.reopen()
+        self.assertEqual(len(t), 1000)
+        self.assertEqual(t.names, ['f0', 'f1', 'f2'])
+        self.assertEqual(t.dtype, self.ra.dtype)
+        self.assertEqual(t.cols.opened(), [])
+        assert_array_equal(t['f1'][:], self.ra['f1'])
+        self.assertEqual(len(t.cols.opened()), 1)
+
+    def test01(self):
+        """Testing that the meta follows appends, trims and new columns"""
+        self.t.append(self.ra)
+        self.t.addcol(np.arange(2000), 'f3')
+        self.t.flush()
+        t = self.reopen()
+        self.assertEqual(len(t), 2000)
+        self.assertEqual(t.names, ['f0', 'f1', 'f2', 'f3'])
+        self.assertEqual(t.cols.opened(), [])
+        t.trim(500)
+        t.delcol('f1')
+        t = self.reopen('r')
+        self.assertEqual(len(t), 1500)
+        self.assertEqual(t.names, ['f0', 'f2', 'f3'])
+        assert_array_equal(t['f3'][:], np.arange(1500))
+
+    def test02(self):
+        """Testing lazy opening of categorical columns"""
+        self.t.addcol(ca.categorical(self.ra['f2']), 'c')
+        self.t.flush()
+        t = self.reopen()
+        self.assertEqual(t.dtype['c'], np.dtype('S1'))
+        self.assertEqual(t.cols.opened(), [])
+        self.assertEqual(type(t.cols['c']), ca.categorical)
+        self.assertEqual(len([r for r in t.where("c == '3'")]), 200)
+
+
+class indexTest(unittest.TestCase):
+
+    kind = "sorted"
+    N = 10*1000 + 3
+
+    def setUp(self):
+        self.ra = np.fromiter(((i, (i*7) % 101, str(i % 13))
+                               for i in xrange(self.N)),
+                              dtype='i8,f8,S2', count=self.N)
+        self.ra.dtype.names = ('a', 'b', 'c')
+        self.rootdir = tempfile.mkdtemp(prefix='ctable-')
+        self.t = ca.ctable(self.ra, rootdir=self.rootdir, mode='w')
+
+    def tearDown(self):
+        shutil.rmtree(self.rootdir)
+
+    def check(self, expr, expected, t=None):
+        t = self.t if t is None else t
+        result = np.array([r.nrow__ for r in t.where(expr, 'nrow__')],
+                          dtype=np.int_)
+        assert_array_equal(result, np.flatnonzero(expected), expr)
+        assert_array_equal(t[expr], self.ra[expected], expr)
+
+    def test00(self):
+        """Testing equality and membership lookups with indexes"""
+        t, ra = self.t, self.ra
+        t.create_index('b', kind=self.kind)
+        t.create_index('c', kind=self.kind)
+        self.check("b == 33", ra['b'] == 33)
+        self.check("b == 33.5", ra['b'] == 33.5)
+        self.check("c == '7'", ra['c'] == '7')
+        self.check("b in (3, 5, 1000)", np.in1d(ra['b'], (3, 5, 1000)))
+        self.check("(b == 3) | (c == '1')", (ra['b'] == 3) | (ra['c'] == '1'))
+
+    def test01(self):
+        """Testing range lookups with indexes"""
+        t, ra = self.t, self.ra
+        t.create_index('b', kind=self.kind)
+        self.check("b < 10", ra['b'] < 10)
+        self.check("(3 <= b) & (b < 10)", (3 <= ra['b']) & (ra['b'] < 10))
+        if self.kind == "sorted":
+            self.check("3 <= b < 10", (3 <= ra['b']) & (ra['b'] < 10))
+        self.check("(b > 99) & (a < 5000)", (ra['b'] > 99) & (ra['a'] < 5000))
+
+    def test02(self):
+        """Testing that indexes are kept up to date on appends"""
+        t, ra = self.t, self.ra
+        t.create_index('b', kind=self.kind)
+        for i in xrange(3):
+            t.append(ra)
+        self.ra = ra = np.concatenate([ra] * 4)
+        self.check("b == 50", ra['b'] == 50)
+        self.check("b in (1, 2)", np.in1d(ra['b'], (1, 2)))
+        t.append(ra[:10])
+        self.ra = ra = np.concatenate([ra, ra[:10]])
+        self.check("b == 7", ra['b'] == 7)
+
+    def test03(self):
+        """Testing persistence of indexes"""
+        t, ra = self.t, self.ra
+        t.create_index('b', kind=self.kind)
+        t.flush()
+        t2 = ca.ctable(rootdir=self.rootdir)
+        self.assertEqual(t2.indexes.keys(), ['b'])
+        self.assertEqual(t2.indexes['b'].kind, self.kind)
+        self.check("b == 50", ra['b'] == 50, t2)
+        t2.drop_index('b')
+        t3 = ca.ctable(rootdir=self.rootdir)
+        self.assertEqual(t3.indexes, {})
+
+    def test04(self):
+        """Testing that indexes follow modifications"""
+        t, ra = self.t, self.ra
+        t.create_index('b', kind=self.kind)
+        t[10:20] = ra[:10]
+        ra[10:20] = ra[:10]
+        self.check("b == 0", ra['b'] == 0)
+        t.trim(100)
+        self.ra = ra = ra[:-100]
+        self.check("b == 1", ra['b'] == 1)
+
+    def test05(self):
+        """Testing that only indexed columns are looked up via indexes"""
+        t = self.t
+        tree = ca.indexes.parse_predicate("(b == 3) | (c == '1')", t.names,
+                                          {})
+        self.assertFalse(ca.indexes.uses_index(tree, t.indexes))
+        t.create_index('c', kind=self.kind)
+        self.assertTrue(ca.indexes.uses_index(tree, t.indexes))
+
+    def test06(self):
+        """Testing that hashes of strings are stable"""
+        def fnv1a(s):
+            h = 0xCBF29CE484222325
+            for c in s:
+                h = ((h ^ ord(c)) * 0x100000001B3) % 2**64
+            return (h * 0x9E3779B97F4A7C15) % 2**64
+        values = np.array(['', 'a', '7', 'blaze'], dtype='S5')
+        expected = [fnv1a(v.ljust(5, '\0')) for v in values]
+        self.assertEqual(ca.indexes.hashes(values).tolist(), expected)
+
+    def test07(self):
+        """Testing indexes built in runs merged from disk"""
+        t, ra = self.t, self.ra
+        t.create_index('b', kind=self.kind)
+        t.create_index('c', kind=self.kind)
+        for name in ('b', 'c'):
+            index = ca.indexes.kinds[self.kind]()
+            index.membudget = 2**14
+            index.build(t.cols[name])
+            assert_array_equal(index.values[:], t.indexes[name].values[:])
+            assert_array_equal(index.rowids[:], t.indexes[name].rowids[:])
+            if self.kind == "hash":
+                assert_array_equal(index.offsets[:],
+                                   t.indexes[name].offsets[:])
+            t.indexes[name] = index
+        self.check("b in (3, 5, 1000)", np.in1d(ra['b'], (3, 5, 1000)))
+        self.check("(b == 3) | (c == '1')", (ra['b'] == 3) | (ra['c'] == '1'))
+
+
+class hashIndexTest(indexTest):
+    kind = "hash"
+
+
+class groupbyTest(unittest.TestCase):
+
+    N = 10*1000 + 3
+
+    def setUp(self):
+        a = np.arange(self.N) % 17
+        b = np.arange(self.N) % 3
+        c = np.arange(self.N, dtype='f8')
+        self.t = ca.ctable([a, b, c], names=['a', 'b', 'c'], chunklen=1000)
+
+    def check(self, result, keys, **kwargs):
+        t = self.t
+        ra = t[:]
+        for row in result:
+            mask = np.ones(len(ra), dtype=np.bool_)
+            for key in keys:
+                mask &= ra[key] == getattr(row, key)
+            c = ra['c'][mask]
+            self.assertAlmostEqual(row.s, c.sum())
+            self.assertEqual(row.n, len(c))
+            self.assertAlmostEqual(row.m, c.mean())
+            self.assertEqual(row.lo, c.min())
+            self.assertEqual(row.hi, c.max())
+        ngroups = len(set(tuple(r) for r in ra[keys].tolist()))
+        self.assertEqual(len(result), ngroups)
+
+    aggs = {'s': ('c', 'sum'), 'n': ('c', 'count'), 'm': ('c', 'mean'),
+            'lo': ('c', 'min'), 'hi': ('c', 'max')}
+
+    def test00(self):
+        """Testing `groupby()` with a single key"""
+        result = self.t.groupby('a', self.aggs)
+        self.assertEqual(result.names, ['a', 'hi', 'lo', 'm', 'n', 's'])
+        assert_array_equal(result['a'][:], np.arange(17))
+        self.check(result, ['a'])
+
+    def test01(self):
+        """Testing `groupby()` with compound keys and threads"""
+        for nthreads in (1, 4):
+            result = self.t.groupby(['a', 'b'], self.aggs, nthreads=nthreads)
+            self.check(result, ['a', 'b'])
+
+    def test02(self):
+        """Testing `groupby()` spilling partitions to disk"""
+        t = self.t
+        t.addcol(np.arange(self.N) // 2, name='d')
+        result = t.groupby('d', self.aggs, membudget=2**14)
+        self.check(result, ['d'])
+
+    def test03(self):
+        """Testing `groupby()` on an empty table"""
+        t = ca.ctable([np.empty(0, 'i4'), np.empty(0, 'f4')], names=['a', 'c'])
+        result = t.groupby('a', self.aggs)
+        self.assertEqual(len(result), 0)
+        self.assertEqual(result.dtype['n'], np.int64)
+        self.assertEqual(result.dtype['lo'], np.float32)
+
+
+class joinTest(unittest.TestCase):
+
+    def setUp(self):
+        N = 10*1000
+        self.left = ca.ctable([np.arange(N) % 1000, np.arange(N, dtype='f8')],
+                              names=['k', 'v'], chunklen=1000)
+        rk = np.arange(0, 2000, 2, dtype='i4').repeat(2)
+        self.right = ca.ctable([rk, np.arange(len(rk)), rk * 10],
+                               names=['k', 'v', 'w'], chunklen=256)
+
+    def expected(self, how):
+        rows = []
+        right = self.right[:]
+        for k, v in self.left[:].tolist():
+            matches = right[right['k'] == k]
+            for m in matches:
+                rows.append((k, v, m['v'], m['w']))
+            if how == 'left' and len(matches) == 0:
+                rows.append((k, v, 0, 0))
+        return sorted(rows)
+
+    def check(self, result, how):
+        self.assertEqual(result.names, ['k', 'v', 'v_r', 'w'])
+        self.assertEqual(sorted(result[:].tolist()), self.expected(how))
+
+    def test00(self):
+        """Testing inner and left joins"""
+        for how in ('inner', 'left'):
+            result = self.left.join(self.right, 'k', how=how)
+            self.check(result, how)
+            # Rows follow the order of the left table
+            self.assert_(np.all(np.diff(result['v'][:]) >= 0))
+
+    def test01(self):
+        """Testing joins partitioned on disk"""
+        for how in ('inner', 'left'):
+            result = self.left.join(self.right, 'k', how=how,
+                                    membudget=2**10, nthreads=2)
+            self.check(result, how)
+
+    def test02(self):
+        """Testing joins with output columns"""
+        result = self.left.join(self.right, 'k', outcols='w, v')
+        self.assertEqual(result.names, ['w', 'v'])
+        assert_array_equal(result['w'][:], result['v'][:] % 1000 * 10)
+        self.assertRaises(ValueError, self.left.join, self.right, 'k',
+                          outcols=['x'])
+
+
+class categoricalTest(unittest.TestCase):
+
+    N = 10*1000
+
+    def setUp(self):
+        self.countries = np.array(['ES', 'US', 'FR', 'DE'])[
+            np.arange(self.N) % 4]
+        self.rootdir = tempfile.mkdtemp(prefix='ctable-')
+
+    def tearDown(self):
+        shutil.rmtree(self.rootdir)
+
+    def test00(self):
+        """Testing the encoding of categorical columns"""
+        c = ca.categorical(self.countries)
+        assert_array_equal(c.categories, ['DE', 'ES', 'FR', 'US'])
+        self.assertEqual(c.codes.dtype, np.int32)
+        assert_array_equal(c[:], self.countries)
+        self.assertEqual(c[5], 'US')
+        c.append(['IT', 'US'])
+        self.assertEqual(c.lookup('IT'), 4)
+        self.assertEqual(c.lookup('XX'), -1)
+        assert_array_equal(c[-2:], ['IT', 'US'])
+        c[0] = 'NL'
+        self.assertEqual(c[0], 'NL')
+
+    def test01(self):
+        """Testing categorical columns in ctables"""
+        t = ca.ctable([ca.categorical(self.countries), np.arange(self.N)],
+                      names=['country', 'n'], rootdir=self.rootdir, mode='w')
+        self.assertEqual(t.dtype['country'], np.dtype('S2'))
+        ra = t[:]
+        assert_array_equal(t['country == "US"'], ra[ra['country'] == 'US'])
+        assert_array_equal(t['"FR" != country'], ra[ra['country'] != 'FR'])
+        self.assertEqual(len(t['country == "XX"']), 0)
+        assert_array_equal(t['(country == "ES") & (n < 100)'],
+                           ra[(ra['country'] == 'ES') & (ra['n'] < 100)])
+        rows = [r.n for r in t.where("country in ('DE', 'US')", 'n')]
+        assert_array_equal(rows, np.flatnonzero(
+            np.in1d(ra['country'], ('DE', 'US'))))
+        # New (and longer) categories can be appended
+        t.append([['Spain'], [self.N]])
+        self.assertEqual(t[self.N]['country'], 'Spain')
+        t.flush()
+        t2 = ca.ctable(rootdir=self.rootdir)
+        self.assertEqual(type(t2.cols['country']), ca.categorical)
+        self.assertEqual(t2[self.N]['country'], 'Spain')
+        self.assertEqual(len(t2['country == "Spain"']), 1)
+
+    def test02(self):
+        """Testing `groupby()` on categorical keys"""
+        t = ca.ctable([ca.categorical(self.countries), np.arange(self.N)],
+                      names=['country', 'n'])
+        result = t.groupby('country', {'n': ('n', 'count')})
+        self.assertEqual(sorted(result[:].tolist()),
+                         [('DE', 2500), ('ES', 2500), ('FR', 2500),
+                          ('US', 2500)])
+
+    def test03(self):
+        """Testing other comparisons of categorical columns"""
+        t = ca.ctable([ca.categorical(self.countries), np.arange(self.N)],
+                      names=['country', 'n'])
+        ra = t[:]
+        assert_array_equal(t["country > 'ES'"], ra[ra['country'] > 'ES'])
+        assert_array_equal(t["('DE' < country) & (n < 100)"],
+                           ra[('DE' < ra['country']) & (ra['n'] < 100)])
+        assert_array_equal(t["(country == 'US') | (country <= 'DE')"],
+                           ra[(ra['country'] == 'US') |
+                              (ra['country'] <= 'DE')])
+        rows = [r.n for r in t.where("country in ('FR', 'XX')", 'n')]
+        assert_array_equal(rows, np.flatnonzero(ra['country'] == 'FR'))
+
+
+class topkTest(unittest.TestCase):
+
+    N = 20*1000 + 7
+
+    def setUp(self):
+        rs = np.random.RandomState(1)
+        self.ra = np.fromiter(((rs.randint(1000), i, i % 3)
+                               for i in xrange(self.N)),
+                              dtype='i4,i8,i1', count=self.N)
+        self.rootdir = tempfile.mkdtemp(prefix='ctable-')
+
+    def tearDown(self):
+        shutil.rmtree(self.rootdir)
+
+    def expected(self, k, mask=None, largest=True):
+        ra = self.ra
+        if mask is not None:
+            ra = ra[mask]
+        # Stable sort, so ties come in row order
+        order = np.argsort(-ra['f0'] if largest else ra['f0'],
+                           kind='mergesort')
+        return ra[order[:k]]
+
+    def test00(self):
+        """Testing `topk()` against a full sort"""
+        t = ca.ctable(self.ra, chunklen=1000)
+        for k in (0, 1, 10, 1000, self.N + 10):
+            assert_array_equal(t.topk('f0', k), self.expected(k))
+            assert_array_equal(t.topk('f0', k, largest=False),
+                               self.expected(k, largest=False))
+
+    def test01(self):
+        """Testing `topk()` with `where` and `outcols`"""
+        t = ca.ctable(self.ra, chunklen=1000)
+        mask = self.ra['f2'] == 1
+        result = t.topk('f0', 25, 'f1, nrow__', where='f2 == 1')
+        expected = self.expected(25, mask)
+        assert_array_equal(result['f1'], expected['f1'])
+        assert_array_equal(result['nrow__'], expected['f1'])
+        t.create_index('f2')
+        assert_array_equal(t.topk('f0', 25, where='f2 == 1'), expected)
+
+    def test02(self):
+        """Testing that zone maps skip chunks and follow modifications"""
+        t = ca.ctable(self.ra, chunklen=1000, rootdir=self.rootdir, mode='w')
+        assert_array_equal(t.topk('f0', 10), self.expected(10))
+        t = ca.ctable(rootdir=self.rootdir)
+        zonemap = t._zonemap('f0')
+        self.assertEqual(zonemap.known.sum(), self.N // 1000)
+        self.assertEqual(zonemap.get(3), (self.ra['f0'][3000:4000].min(),
+                                          self.ra['f0'][3000:4000].max()))
+        # A large value in a chunk with a known zone is still found
+        t['f0 == 0'] = (5000, 0, 0)
+        self.ra[self.ra['f0'] == 0] = (5000, 0, 0)
+        assert_array_equal(t.topk('f0', 10), self.expected(10))
+        t.trim(1500)
+        self.ra = self.ra[:-1500]
+        self.assertEqual(t._zonemap('f0').known[len(t) // 1000:].sum(), 0)
+        assert_array_equal(t.topk('f0', 10, largest=False),
+                           self.expected(10, largest=False))
+
+    def test03(self):
+        """Testing that NaNs come last in `topk()`"""
+        select = ca.topk._select
+        values, rowids = select(np.array([1, 2, np.nan, 3]), np.arange(4),
+                                2, True)
+        assert_array_equal(values, [3, 2])
+        assert_array_equal(rowids, [3, 1])
+        values, rowids = select(np.array([np.nan, 1, np.nan]), np.arange(3),
+                                2, False)
+        assert_array_equal(values, [1, np.nan])
+        assert_array_equal(rowids, [1, 0])
+        # Chunks with NaNs (and with NaNs only) in a zone map
+        self.ra = self.ra.astype('f8,i8,i1')
+        self.ra['f0'][::3] = np.nan
+        self.ra['f0'][5000:6000] = np.nan
+        t = ca.ctable(self.ra, chunklen=1000)
+        for i in range(2):
+            for k in (1, 10, self.N - self.N // 3 + 10):
+                for largest in (True, False):
+                    # NaNs are not equal in structured arrays
+                    result = t.topk('f0', k, largest=largest)
+                    expected = self.expected(k, largest=largest)
+                    assert_array_equal(result['f0'], expected['f0'])
+                    assert_array_equal(result['f1'], expected['f1'])
+
+
+class distinctTest(unittest.TestCase):
+
+    N = 20*1000 + 7
+
+    def setUp(self):
+        self.rootdir = tempfile.mkdtemp(prefix='ctable-')
+        self.a = np.arange(self.N) % 5000
+        self.t = ca.ctable([self.a, ca.categorical(self.a % 7 * 10)],
+                           names=['a', 'c'], chunklen=1000,
+                           rootdir=self.rootdir, mode='w')
+
+    def tearDown(self):
+        shutil.rmtree(self.rootdir)
+
+    def test00(self):
+        """Testing `count_distinct()` and `unique()` on ctable columns"""
+        t = self.t
+        self.assertEqual(t.count_distinct('a'), 5000)
+        self.assertEqual(t.count_distinct('a', 4500, 6000), 1500)
+        self.assertEqual(t.count_distinct('c'), 7)
+        assert_array_equal(t.unique('c')[:], np.arange(7) * 10)
+        estimate = t.count_distinct('a', approx=True)
+        self.assertTrue(abs(estimate - 5000) < 250)
+
+    def test01(self):
+        """Testing that chunk sketches are persisted and kept up to date"""
+        self.t.count_distinct('a', approx=True)
+        t = ca.ctable(rootdir=self.rootdir)
+        self.assertEqual(len(t._sketch('a')), self.N // 1000)
+        t.trim(10*1000)
+        self.assertEqual(len(t._sketch('a')), 10)
+        estimate = t.count_distinct('a', 0, 4000, approx=True)
+        self.assertTrue(abs(estimate - 4000) < 200)
+        t['a < 100'] = (7, 7)
+        self.assertEqual(len(t._sketch('a')), 0)
+        self.assertEqual(t.count_distinct('a'), 4901)
+
+
+class statsTest(unittest.TestCase):
+
+    N = 10*1000
+
+    def setUp(self):
+        self.rootdir = tempfile.mkdtemp(prefix='ctable-')
+        a = np.arange(self.N, dtype='f8')
+        a[::10] = np.nan
+        self.t = ca.ctable([np.arange(self.N) % 100, a,
+                            ca.categorical(np.array(['x', 'y', 'z'])[
+                                np.arange(self.N) % 3])],
+                           names=['i', 'f', 'c'], rootdir=self.rootdir,
+                           mode='w')
+
+    def tearDown(self):
+        shutil.rmtree(self.rootdir)
+
+    def test00(self):
+        """Testing the statistics of columns"""
+        stats = self.t.stats
+        self.assertEqual(sorted(stats), ['c', 'f', 'i'])
+        i, f, c = stats['i'], stats['f'], stats['c']
+        self.assertEqual((i.rows, i.min, i.max, i.nulls), (self.N, 0, 99, 0))
+        self.assertTrue(abs(i.ndv - 100) <= 5)
+        self.assertEqual((f.min, f.max, f.nulls), (1., self.N - 1., 1000))
+        self.assertEqual(f.histogram[0].sum(), self.N - 1000)
+        self.assertEqual((c.min, c.max, c.ndv, c.histogram),
+                         ('x', 'z', 3, None))
+        self.assertAlmostEqual(i.selectivity(('range', 10, True, 19, True)),
+                               0.1, 2)
+        self.assertAlmostEqual(i.selectivity(('in', [5, 1000])), 0.01, 3)
+        self.assertEqual(i.selectivity(('range', 200, True, None, False)),
+                         0)
+        self.assertAlmostEqual(f.selectivity(('range', None, False, 5000,
+                                              False)), 0.45, 2)
+
+    def test01(self):
+        """Testing that statistics are persisted and updated on appends"""
+        self.t.stats
+        self.t.append([np.array([-5, 200]), np.array([np.nan, 1e6]),
+                       np.array(['w', 'x'])])
+        self.t.flush()
+        t = ca.ctable(rootdir=self.rootdir)
+        i, f = t.stats['i'], t.stats['f']
+        self.assertEqual((i.rows, i.min, i.max), (self.N + 2, -5, 200))
+        self.assertEqual((f.nulls, f.max), (1001, 1e6))
+        self.assertEqual(i.histogram[0].sum(), self.N + 2)
+        self.assertEqual(t.stats['c'].min, 'w')
+        t.trim(2)
+        self.assertEqual((t.stats['i'].min, t.stats['i'].max), (0, 99))
+        t.delcol('f')
+        t2 = ca.ctable(rootdir=self.rootdir)
+        self.assertEqual(sorted(colstats.read_stats(self.rootdir)),
+                         ['c', 'i'])
+        self.assertEqual(sorted(t2.stats), ['c', 'i'])
+
+    def test02(self):
+        """Testing that statistics are kept by appends and written by flush"""
+        t = self.t
+        statsfile = os.path.join(self.rootdir, colstats.STATSFILE)
+        t.stats
+        self.assertFalse(os.path.exists(statsfile))
+        t.append([np.array([-5]), np.array([1e6]), np.array(['w'])])
+        # The appended rows are taken into account without a rescan
+        self.assertEqual(t._stats['i'].rows, self.N + 1)
+        self.assertEqual(t._stats['f'].max, 1e6)
+        t.stats
+        self.assertFalse(os.path.exists(statsfile))
+        t.flush()
+        self.assertEqual(colstats.read_stats(self.rootdir)['i'].min, -5)
+
+    def test03(self):
+        """Testing that statistics are only built when asked for"""
+        t = ca.ctable([np.arange(10), np.arange(10.)], names=['a', 'b'])
+        self.assertEqual(t._stats, None)
+        t.append([np.arange(10, 20), np.arange(10.)])
+        self.assertEqual(t._stats, {})
+        self.assertEqual((t.stats['a'].rows, t.stats['a'].max), (20, 19))
+
+
+class whereTest(unittest.TestCase):
+
+    N = 50*1000 + 11
+
+    def setUp(self):
+        self.ra = np.fromiter(((i, i*2., str(i % 7)) for i in xrange(self.N)),
+                              dtype='i8,f8,S1', count=self.N)
+        self.t = ca.ctable(self.ra, chunklen=1000)
+
+    def test00(self):
+        """Testing `where()` with limit, skip and outcols"""
+        t, ra = self.t, self.ra
+        mask = ra['f0'] % 1001 == 3
+        rows = list(t.where('f0 % 1001 == 3', 'nrow__, f1'))
+        self.assertEqual([r.nrow__ for r in rows], list(np.flatnonzero(mask)))
+        self.assertEqual([r.f1 for r in rows], list(ra['f1'][mask]))
+        rows = [r.f0 for r in t.where('f2 == "3"', limit=1500, skip=1234)]
+        assert_array_equal(rows, ra['f0'][ra['f2'] == '3'][1234:1234+1500])
+        self.assertEqual(list(t.where('f0 < 0')), [])
+        self.assertEqual(list(t.where('f0 > 0', limit=0)), [])
+
+    def test01(self):
+        """Testing `whereblocks()`"""
+        t, ra = self.t, self.ra
+        blocks = list(t.whereblocks('f0 % 2 == 0', blen=3000,
+                                    outcols=['f2', 'f0']))
+        self.assertTrue(all(len(b) >= 3000 for b in blocks[:-1]))
+        self.assertEqual(blocks[0].dtype.names, ('f2', 'f0'))
+        result = np.concatenate(blocks)
+        assert_array_equal(result['f0'], ra['f0'][::2])
+        assert_array_equal(result['f2'], ra['f2'][::2])
+
+    def test02(self):
+        """Testing that `where()` sees the variables of the caller"""
+        lim = 10
+        self.assertEqual([r.f0 for r in self.t.where('f0 < lim')], range(10))
+        assert_array_equal(self.t['f0 < lim'], self.ra[:10])
+
+
+class viewTest(unittest.TestCase):
+
+    N = 50*1000 + 11
+
+    def setUp(self):
+        self.ra = np.fromiter(((i, i*2., str(i % 7)) for i in xrange(self.N)),
+                              dtype='i8,f8,S1', count=self.N)
+        self.t = ca.ctable(self.ra, chunklen=1000)
+        self.t.addcol(ca.categorical(self.ra['f2']), 'cat')
+
+    def test00(self):
+        """Testing the read operations of views"""
+        v = self.t.view(['f0', 'cat'], 1500, 40000)
+        ra = self.ra[1500:40000]
+        self.assertEqual(len(v), len(ra))
+        self.assertEqual(v.names, ['f0', 'cat'])
+        self.assertEqual(tuple(v[-1]), (ra['f0'][-1], ra['f2'][-1]))
+        assert_array_equal(v[10:20]['f0'], ra['f0'][10:20])
+        assert_array_equal(v.eval('f0 * 2'), ra['f0'] * 2)
+        rows = list(v.where("(f0 % 1001 == 3) & (cat == '3')", 'nrow__, f0'))
+        mask = (ra['f0'] % 1001 == 3) & (ra['f2'] == '3')
+        self.assertEqual([r.nrow__ for r in rows], list(np.flatnonzero(mask)))
+        self.assertEqual([r.f0 for r in rows], list(ra['f0'][mask]))
+        self.assertEqual([r.cat for r in v.iter(3, 10, 3)],
+                         list(ra['f2'][3:10:3]))
+        lim = 1510
+        assert_array_equal(v['f0 < lim']['f0'], ra['f0'][:10])
+        self.assertEqual(v.topk('f0', 1)['f0'][0], ra['f0'][-1])
+        # Views of views
+        v2 = v[['f0']].view(start=100, stop=110)
+        assert_array_equal(v2[:]['f0'], ra['f0'][100:110])
+
+    def test01(self):
+        """Testing that views are copied on write"""
+        t, ra = self.t, self.ra
+        v = t.view('f0 cat', 10, 20)
+        v[0] = (-1, '9')
+        v.append((np.array([-2]), np.array(['8'])))
+        self.assertEqual(len(v), 11)
+        self.assertEqual(tuple(v[0]), (-1, '9'))
+        self.assertEqual(tuple(v[-1]), (-2, '8'))
+        # The viewed table is untouched
+        self.assertEqual(len(t), self.N)
+        assert_array_equal(t[:]['f0'], ra['f0'])
+        assert_array_equal(t['cat'][:], ra['f2'])
+        c = t.view(['f1'], 5, 8).copy()
+        self.assertEqual(type(c), ca.ctable)
+        assert_array_equal(c[:]['f1'], ra['f1'][5:8])
+
+
+if __name__ == '__main__':
+    unittest.main()
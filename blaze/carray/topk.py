@@ -0,0 +1,143 @@
+"""Top-k selections on carray columns.
+
+The column is scanned chunk by chunk, keeping the k best candidates
+found so far.  Every chunk is cut down to its own k best values with
+`np.partition()` before being merged with the candidates, so the column
+is never sorted.  Once there are k candidates, the chunks whose zone
+(see `zonemaps`) cannot beat the worst of them are skipped without
+decompressing them.
+"""
+
+import numpy as np
+
+import zonemaps
+
+
+def _select(values, rowids, k, largest):
+    """Return the `k` best `values` and their `rowids`, best first.
+
+    Ties are broken in favour of the lowest row ids, like a stable sort
+    would do.  NaNs come after any other value (as in `np.sort()`), be
+    it the largest or the smallest values that are wanted.
+    """
+    if values.dtype.kind in 'fc':
+        nans = np.isnan(values)
+        if nans.any():
+            best, bestids = _select(values[~nans], rowids[~nans], k, largest)
+            nanids = np.sort(rowids[nans])[:k - len(best)]
+            return (np.concatenate((best, values[nans][:len(nanids)])),
+                    np.concatenate((bestids, nanids)))
+    n = len(values)
+    if n > k:
+        # Discard most of the values before sorting
+        if largest:
+            kth = np.partition(values, n - k)[n - k]
+            keep = values >= kth
+        else:
+            kth = np.partition(values, k - 1)[k - 1]
+            keep = values <= kth
+        values, rowids = values[keep], rowids[keep]
+    if largest:
+        order = np.lexsort((-rowids, values))[::-1][:k]
+    else:
+        order = np.lexsort((rowids, values))[:k]
+    return values[order], rowids[order]
+
+
+def topk(column, k, largest=True, mask=None, zonemap=None):
+    """
+    topk(column, k, largest=True, mask=None, zonemap=None)
+
+    Return the `k` largest (or smallest) values in `column`.
+
+    Parameters
+    ----------
+    column : carray or categorical
+        The column to look into.
+    k : int
+        The number of values to return.
+    largest : bool
+        Whether the largest or the smallest values are wanted.
+    mask : boolean carray, optional
+        Only the values where `mask` is true are considered.
+    zonemap : zonemap, optional
+        The zone map of `column`, used for skipping chunks.  The zones
+        of the chunks that are decompressed are added to it.
+
+    Returns
+    -------
+    out : a (values, rowids) tuple
+        The values, best first, and the row ids where they are.
+
+    """
+    values = np.empty(0, dtype=column.dtype)
+    rowids = np.empty(0, dtype=np.int64)
+    if k <= 0:
+        return values, rowids
+    if not zonemaps.supported(column.dtype):
+        zonemap = None
+    clen = column.chunklen
+    nchunks = len(column) // clen
+
+    # Visit the chunks with an unknown zone first (they have to be
+    # decompressed anyway), and then the others, most promising first
+    known, unknown = [], []
+    for nchunk in xrange(nchunks):
+        zone = zonemap.get(nchunk) if zonemap is not None else None
+        if zone is None:
+            unknown.append(nchunk)
+        else:
+            known.append((zone[1] if largest else zone[0], nchunk))
+    # Chunks with NaNs only (see `zonemap.set()`) go last
+    nanzones = [(bound, nchunk) for bound, nchunk in known if bound != bound]
+    known = [(bound, nchunk) for bound, nchunk in known if bound == bound]
+    known.sort(reverse=largest)
+    known += nanzones
+    if len(column) % clen:
+        unknown.append(nchunks)
+
+    for bound, nchunk in [(None, n) for n in unknown] + known:
+        # A NaN is worse than any other candidate, so it cannot be used
+        # for discarding values
+        full = len(values) == k and values[-1] == values[-1]
+        if bound is not None and full:
+            # Chunks whose bound ties with the worst candidate are still
+            # visited, as they may hold ties with lower row ids
+            if bound != bound:
+                break  # only chunks with NaNs are left
+            if (bound < values[-1]) if largest else (bound > values[-1]):
+                break  # no other chunk can beat the candidates
+        start = nchunk * clen
+        stop = min(start + clen, len(column))
+        if mask is not None:
+            bmask = mask[start:stop]
+            if not bmask.any():
+                continue
+        chunk = column[start:stop]
+        if zonemap is not None and bound is None and nchunk < nchunks:
+            zonemap.set(nchunk, chunk)
+        chunkids = np.arange(start, stop, dtype=np.int64)
+        if mask is not None:
+            chunk, chunkids = chunk[bmask], chunkids[bmask]
+        if full:
+            # Only values as good as the worst candidate matter
+            if largest:
+                better = chunk >= values[-1]
+            else:
+                better = chunk <= values[-1]
+            chunk, chunkids = chunk[better], chunkids[better]
+        if len(chunk) == 0:
+            continue
+        chunk, chunkids = _select(chunk, chunkids, k, largest)
+        values, rowids = _select(np.concatenate((values, chunk)),
+                                 np.concatenate((rowids, chunkids)),
+                                 k, largest)
+    return values, rowids
+
+
+## Local Variables:
+## mode: python
+## py-indent-offset: 4
+## tab-width: 4
+## fill-column: 78
+## End:
@@ -13,10 +13,19 @@ import sys
 import os, os.path
 import glob
 import itertools as it
+import tokenize
+from cStringIO import StringIO
 import numpy as np
-#import blaze.carray as ca
 from carrayExtension import carray
+import ufuncvm
 import math
+import time
+
+# This module is loaded while the `blaze.carray` package is still being
+# initialized, so ``import blaze.carray as ca`` cannot be used here
+ca = sys.modules['blaze.carray']
+if ca.numexpr_here:
+    from numexpr.expressions import functions as numexpr_functions
 
 def detect_number_of_cores():
     """
@@ -408,12 +417,16 @@ def _getvars(expression, user_dict, depth, vm):
         exprvars = [ var for var in cexpr.co_names
                      if var not in ['None', 'False', 'True'] ]
     else:
-        # Check that var is not a numexpr function here.  This is useful for
-        # detecting unbound variables in expressions.  This is not necessary
-        # for the 'python' engine.
+        # Check that var is not a numexpr (or ufunc vm) function here.  This
+        # is useful for detecting unbound variables in expressions.  This is
+        # not necessary for the 'python' engine.
+        if vm == "numexpr":
+            functions = numexpr_functions
+        else:
+            functions = ufuncvm.functions
         exprvars = [ var for var in cexpr.co_names
                      if var not in ['None', 'False', 'True']
-                     and var not in numexpr_functions ]
+                     and var not in functions ]
 
 
     # Get the local and global variable mappings of the user frame
@@ -433,7 +446,7 @@ def _getvars(expression, user_dict, depth, vm):
         elif var in user_globals:
             val = user_globals[var]
         else:
-            if vm == "numexpr":
+            if vm != "python":
                 raise NameError("variable name ``%s`` not found" % var)
             val = None
         # Check the value.
@@ -453,6 +466,129 @@ def _getvars(expression, user_dict, depth, vm):
 # Assign function `eval` to a variable because we are overriding it
 _eval = eval
 
+# The reductions that `eval` knows how to compute in blocks.  Every entry
+# maps the function name used in expressions to a pair of functions: the
+# first one reduces a block and the second one combines two partial
+# results.  'mean' is computed as a sum that is divided by the number of
+# elements at the end.
+_reductions = {
+    'sum':  (np.sum, np.add),
+    'prod': (np.prod, np.multiply),
+    'min':  (np.min, np.minimum),
+    'max':  (np.max, np.maximum),
+    'any':  (np.any, np.logical_or),
+    'all':  (np.all, np.logical_and),
+    'mean': (np.sum, np.add),
+    }
+
+def _split_reductions(expression):
+    """Split the reduction calls out of `expression`.
+
+    Returns an ``(outer, reductions)`` tuple.  `reductions` is a list of
+    ``(fname, operand)`` pairs, one per reduction call found, and `outer`
+    is `expression` with every such call replaced by a ``__red<n>__``
+    placeholder.  Only calls with a single argument are recognized, so
+    reductions with additional arguments (e.g. an `axis`) are left
+    untouched.
+    """
+
+    tokens = [tok[:2] for tok in
+              tokenize.generate_tokens(StringIO(expression).readline)]
+    outer, reductions = [], []
+    i, ntokens = 0, len(tokens)
+    while i < ntokens:
+        toktype, tokstr = tokens[i]
+        if (toktype == tokenize.NAME and tokstr in _reductions and
+            i+1 < ntokens and tokens[i+1][1] == '(' and
+            (i == 0 or tokens[i-1][1] != '.')):
+            # Look for the matching closing parenthesis
+            depth, single_arg = 0, True
+            for j in xrange(i+1, ntokens):
+                if tokens[j][1] in ('(', '[', '{'):
+                    depth += 1
+                elif tokens[j][1] in (')', ']', '}'):
+                    depth -= 1
+                    if depth == 0:
+                        break
+                elif tokens[j][1] in (',', '=') and depth == 1:
+                    single_arg = False
+            operand = tokens[i+2:j]
+            if single_arg and operand:
+                if _split_reductions(tokenize.untokenize(operand))[1]:
+                    raise NotImplementedError(
+                        "nested reductions are not supported in `eval`")
+                placeholder = "__red%d__" % len(reductions)
+                reductions.append((tokstr, tokenize.untokenize(operand)))
+                outer.append((tokenize.NAME, placeholder))
+                i = j + 1
+                continue
+        outer.append((toktype, tokstr))
+        i += 1
+    return tokenize.untokenize(outer).strip(), reductions
+
+# The operators binding less tightly than `&`: expressions with any of
+# them at the top level are not conjunctions
+_looser_than_and = set(['|', '^', '<', '<=', '>', '>=', '==', '!=', '<>',
+                        'and', 'or', 'not', 'in', 'is', 'if', 'else',
+                        'lambda', ',', ':'])
+
+def _split_conjuncts(expression):
+    """Split `expression` into the operands of its top-level `&`s.
+
+    The operands are split recursively, looking into parenthesized ones,
+    so '(a > 1) & ((b < 2) & (c == 3))' gives ['a > 1', 'b < 2', 'c ==
+    3'].  A list with `expression` alone is returned if it is not such a
+    conjunction.
+    """
+
+    try:
+        tokens = list(tokenize.generate_tokens(
+            StringIO(expression).readline))
+    except (tokenize.TokenError, IndentationError):
+        return [expression]
+    # The offsets in `expression` where every line starts
+    lines = [0]
+    for line in StringIO(expression):
+        lines.append(lines[-1] + len(line))
+    offset = lambda pos: lines[pos[0]-1] + pos[1]
+
+    tokens = [tok for tok in tokens
+              if tok[0] not in (tokenize.NL, tokenize.NEWLINE,
+                                tokenize.COMMENT, tokenize.ENDMARKER)]
+    if not tokens:
+        return [expression]
+    depth, cuts, enclosed = 0, [], True
+    for n, tok in enumerate(tokens):
+        toktype, tokstr = tok[:2]
+        if toktype == tokenize.OP and tokstr in ('(', '[', '{'):
+            depth += 1
+        elif toktype == tokenize.OP and tokstr in (')', ']', '}'):
+            depth -= 1
+            if depth == 0 and n < len(tokens) - 1:
+                enclosed = False
+        elif depth == 0:
+            if tokstr == '&':
+                cuts.append(tok)
+            elif tokstr in _looser_than_and:
+                return [expression]
+
+    if not cuts:
+        if enclosed and tokens[0][1] == '(' and tokens[-1][1] == ')':
+            inner = expression[offset(tokens[0][3]):
+                               offset(tokens[-1][2])].strip()
+            conjuncts = _split_conjuncts(inner)
+            if len(conjuncts) > 1:
+                return conjuncts
+        return [expression]
+    bounds = [offset(tokens[0][2])]
+    for tok in cuts:
+        bounds.extend((offset(tok[2]), offset(tok[3])))
+    bounds.append(offset(tokens[-1][3]))
+    conjuncts = []
+    for start, stop in zip(bounds[::2], bounds[1::2]):
+        conjuncts.extend(_split_conjuncts(expression[start:stop].strip()))
+    return conjuncts
+
 def eval(expression, vm=None, out_flavor=None, user_dict={}, **kwargs):
     """
     eval(expression, vm=None, out_flavor=None, user_dict=None, **kwargs)
@@ -466,8 +602,12 @@ def eval(expression, vm=None, out_flavor=None, user_dict={}, **kwargs):
         'b' are variable names to be taken from the calling function's frame.
         These variables may be scalars, carrays or NumPy arrays.
     vm : string
-        The virtual machine to be used in computations.  It can be 'numexpr'
-        or 'python'.  The default is to use 'numexpr' if it is installed.
+        The virtual machine to be used in computations.  It can be
+        'numexpr', 'python' or 'ufunc'.  The 'ufunc' vm compiles the
+        expression once into NumPy ufunc calls that write into temporaries
+        which are reused for every block, so it does not allocate memory
+        during the evaluation.  The default is to use 'numexpr' if it is
+        installed.
     out_flavor : string
         The flavor for the `out` object.  It can be 'carray' or 'numpy'.
     user_dict : dict
@@ -483,23 +623,97 @@ def eval(expression, vm=None, out_flavor=None, user_dict={}, **kwargs):
         properties of this carray by passing additional arguments
         supported by carray constructor in `kwargs`.
 
+    Notes
+    -----
+    The reductions sum(), prod(), min(), max(), mean(), any() and all()
+    are recognized in `expression` (e.g. 'sum(a*b) / sum(b)').  Their
+    operands are evaluated block by block and the partial results are
+    folded as they are produced, so the operands are never materialized.
+    As in NumPy, these reduce over all the elements of their operand.
+
+    Conjunctions of boolean conditions (e.g. '(a > 5) & (b == 3)') are
+    evaluated with short-circuit: in every block, each condition is only
+    evaluated for the elements that passed the previous ones, and the
+    rest of them are skipped as soon as no element passes.  The
+    conditions are reordered so that the most selective (and cheapest)
+    ones go first, as measured while evaluating the first blocks.
+
     """
 
     if vm is None:
         vm = ca.defaults.eval_vm
-    if vm not in ("numexpr", "python"):
-        raiseValue, "`vm` must be either 'numexpr' or 'python'"
+    if vm not in ("numexpr", "python", "ufunc"):
+        raise ValueError, "`vm` must be either 'numexpr', 'python' or 'ufunc'"
+    if vm == "numexpr" and not ca.numexpr_here:
+        raise ValueError, "cannot use `numexpr` virtual machine"
 
     if out_flavor is None:
         out_flavor = ca.defaults.eval_out_flavor
     if out_flavor not in ("carray", "numpy"):
-        raiseValue, "`out_flavor` must be either 'carray' or 'numpy'"
+        raise ValueError, "`out_flavor` must be either 'carray' or 'numpy'"
 
     # Get variables and column names participating in expression
     depth = kwargs.pop('depth', 2)
+    outer, reductions = _split_reductions(expression)
+    if reductions:
+        # Only the operands of every reduction need to have the same
+        # length, so reductions are streamed in groups of operands with
+        # the same length
+        groups = {}
+        for j, (fname, operand) in enumerate(reductions):
+            vars = _getvars(operand, user_dict, depth, vm=vm)
+            vlen = _sizes(vars)[1]
+            groups.setdefault(vlen, ([], {}))
+            groups[vlen][0].append(j)
+            groups[vlen][1].update(vars)
+        results = [None] * len(reductions)
+        for vlen, (js, vars) in groups.iteritems():
+            typesize = _sizes(vars)[0]
+            group = _reduce_blocks([reductions[j] for j in js], vars, vlen,
+                                   typesize, vm)
+            for j, result in zip(js, group):
+                results[j] = result
+        if outer == "__red0__":
+            return results[0]
+        # Evaluate the rest of the expression with the reduced values
+        vars = _getvars(outer, user_dict, depth, vm="python")
+        for i, result in enumerate(results):
+            vars["__red%d__" % i] = result
+        if vm == "python":
+            return _eval(outer, vars)
+        elif vm == "ufunc":
+            return _eval(outer, dict(ufuncvm.functions, **vars))
+        else:
+            return ca.numexpr.evaluate(outer, local_dict=vars)[()]
+
     vars = _getvars(expression, user_dict, depth, vm=vm)
+    typesize, vlen = _sizes(vars)
+
+    if typesize == 0:
+        # All scalars
+        if vm == "python":
+            return _eval(expression, vars)
+        elif vm == "ufunc":
+            return _eval(expression, dict(ufuncvm.functions, **vars))
+        else:
+            return ca.numexpr.evaluate(expression, local_dict=vars)
+
+    conjuncts = _split_conjuncts(expression)
+    if len(conjuncts) > 1:
+        result = _filter_blocks(conjuncts, vars, vlen, typesize, vm,
+                                out_flavor, **kwargs)
+        if result is not None:
+            return result
+    return _eval_blocks(expression, vars, vlen, typesize, vm, out_flavor,
+                        **kwargs)
+
+def _sizes(vars):
+    """Get the size of an element and the length of the arrays in `vars`.
+
+    Returns a ``(typesize, vlen)`` tuple.  The arrays must all have the
+    same length.
+    """
 
-    # Gather info about sizes and lengths
     typesize, vlen = 0, 1
     for name in vars.iterkeys():
         var = vars[name]
@@ -510,7 +724,7 @@ def eval(expression, vm=None, out_flavor=None, user_dict={}, **kwargs):
         if hasattr(var, "dtype"):  # numpy/carray arrays
             if isinstance(var, np.ndarray):  # numpy array
                 typesize += var.dtype.itemsize * np.prod(var.shape[1:])
-            elif isinstance(var, ca.carray):  # carray array
+            elif hasattr(var, "_getrange"):  # carray array (or a view)
                 typesize += var.dtype.itemsize
             else:
                 raise ValueError, "only numpy/carray objects supported"
@@ -518,30 +732,19 @@ def eval(expression, vm=None, out_flavor=None, user_dict={}, **kwargs):
             if vlen > 1 and vlen != len(var):
                 raise ValueError, "arrays must have the same length"
             vlen = len(var)
+    return typesize, vlen
 
-    if typesize == 0:
-        # All scalars
-        if vm == "python":
-            return _eval(expression, vars)
-        else:
-            return ca.numexpr.evaluate(expression, local_dict=vars)
-
-    return _eval_blocks(expression, vars, vlen, typesize, vm, out_flavor,
-                        **kwargs)
+def _calc_blen(vm, typesize, vlen):
+    """Compute the optimal block size (in elements) for evaluation."""
 
-def _eval_blocks(expression, vars, vlen, typesize, vm, out_flavor,
-                 **kwargs):
-    """Perform the evaluation in blocks."""
-
-    # Compute the optimal block size (in elements)
     # The next is based on experiments with bench/ctable-query.py
     if vm == "numexpr":
         # If numexpr, make sure that operands fits in L3 chache
         bsize = 2**20  # 1 MB is common for L3
     else:
-        # If python, make sure that operands fits in L2 chache
+        # If python or ufunc, make sure that operands fits in L2 chache
         bsize = 2**17  # 256 KB is common for L2
-    bsize //= typesize
+    bsize //= max(typesize, 1)
     # Evaluation seems more efficient if block size is a power of 2
     bsize = 2 ** (int(math.log(bsize, 2)))
     if vlen < 100*1000:
@@ -553,55 +756,75 @@ def _eval_blocks(expression, vars, vlen, typesize, vm, out_flavor,
     # Protection against too large atomsizes
     if bsize == 0:
         bsize = 1
+    return bsize
+
+def _block_buffers(vars, bsize):
+    """Get temporaries for the carray `vars` that are larger than `bsize`."""
 
     vars_ = {}
-    # Get temporaries for vars
-    maxndims = 0
     for name in vars.iterkeys():
         var = vars[name]
         if hasattr(var, "__len__"):
-            ndims = len(var.shape) + len(var.dtype.shape)
-            if ndims > maxndims:
-                maxndims = ndims
             if len(var) > bsize and hasattr(var, "_getrange"):
                 vars_[name] = np.empty(bsize, dtype=var.dtype)
+    return vars_
 
-    for i in xrange(0, vlen, bsize):
-        # Get buffers for vars
-        for name in vars.iterkeys():
-            var = vars[name]
-            if hasattr(var, "__len__") and len(var) > bsize:
-                if hasattr(var, "_getrange"):
-                    if i+bsize < vlen:
-                        var._getrange(i, bsize, vars_[name])
-                    else:
-                        vars_[name] = var[i:]
+def _fill_block(vars, vars_, i, bsize, vlen):
+    """Fill `vars_` with the values of `vars` in the block starting at `i`."""
+
+    for name in vars.iterkeys():
+        var = vars[name]
+        if hasattr(var, "__len__") and len(var) > bsize:
+            if hasattr(var, "_getrange"):
+                if i+bsize < vlen:
+                    var._getrange(i, bsize, vars_[name])
                 else:
-                    vars_[name] = var[i:i+bsize]
+                    vars_[name] = var[i:]
             else:
-                if hasattr(var, "__getitem__"):
-                    vars_[name] = var[:]
-                else:
-                    vars_[name] = var
+                vars_[name] = var[i:i+bsize]
+        else:
+            if hasattr(var, "__len__"):
+                vars_[name] = var[:]
+            else:
+                vars_[name] = var
+
+def _evaluator(expression, vars, vm, bsize):
+    """Get a function that evaluates `expression` for a block of `vars`.
+
+    The function is called with the values for the block and its length.
+    """
+
+    if vm == "python":
+        cexpr = compile(expression, '<string>', 'eval')
+        return lambda vars_, blen: _eval(cexpr, vars_)
+    elif vm == "ufunc":
+        return ufuncvm.program(expression, vars, bsize).run
+    else:
+        return lambda vars_, blen: ca.numexpr.evaluate(
+            expression, local_dict=vars_)
+
+def _eval_blocks(expression, vars, vlen, typesize, vm, out_flavor,
+                 **kwargs):
+    """Perform the evaluation in blocks."""
+
+    bsize = _calc_blen(vm, typesize, vlen)
+    vars_ = _block_buffers(vars, bsize)
+    evaluate = _evaluator(expression, vars, vm, bsize)
+
+    for i in xrange(0, vlen, bsize):
+        # Get buffers for vars
+        _fill_block(vars, vars_, i, bsize, vlen)
 
         # Perform the evaluation for this block
-        if vm == "python":
-            res_block = _eval(expression, vars_)
-        else:
-            res_block = ca.numexpr.evaluate(expression, local_dict=vars_)
+        blen = min(bsize, vlen - i)
+        res_block = evaluate(vars_, blen)
+        if res_block.shape[:1] != (blen,):
+            raise ValueError(
+                "`expression` does not evaluate to an array with the "
+                "length of its operands; reductions can only be computed "
+                "via %s" % ", ".join("%s()" % r for r in sorted(_reductions)))
 
         if i == 0:
-            # Detection of reduction operations
-            scalar = False
-            dim_reduction = False
-            if len(res_block.shape) == 0:
-                scalar = True
-                result = res_block
-                continue
-            elif len(res_block.shape) < maxndims:
-                dim_reduction = True
-                result = res_block
-                continue
             # Get a decent default for expectedlen
             if out_flavor == "carray":
                 nrows = kwargs.pop('expectedlen', vlen)
@@ -612,19 +835,188 @@ def _eval_blocks(expression, vars, vlen, typesize, vm, out_flavor,
                 result = np.empty(out_shape, dtype=res_block.dtype)
                 result[:bsize] = res_block
         else:
-            if scalar or dim_reduction:
-                result += res_block
-            elif out_flavor == "carray":
+            if out_flavor == "carray":
                 result.append(res_block)
             else:
                 result[i:i+bsize] = res_block
 
     if isinstance(result, ca.carray):
         result.flush()
-    if scalar:
-        return result[()]
     return result
 
+def _filter_blocks(conjuncts, vars, vlen, typesize, vm, out_flavor,
+                   **kwargs):
+    """Evaluate the conjunction of the boolean `conjuncts` in blocks.
+
+    In every block, the conjuncts are evaluated in turn, and the rest of
+    them are skipped as soon as no element passes.  The values of the
+    variables are only fetched when a conjunct needs them, so the blocks
+    of the carrays that only appear in the last conjuncts are not even
+    decompressed when no element survives the first ones.  Once few
+    elements survive, the next conjuncts are only evaluated for them.
+
+    The first block is fully evaluated for every conjunct, in order to
+    measure their selectivity and their cost.  The conjuncts are sorted
+    by their cost per element divided by the fraction of elements that
+    they discard (the best order for independent conjuncts), and the
+    measures are refined with every block.
+
+    Returns None if some conjunct does not evaluate to a boolean array
+    (or if there are no elements).  This is checked on a few elements
+    before evaluating anything else.
+    """
+
+    if vlen == 0:
+        return None
+    bsize = _calc_blen(vm, typesize, vlen)
+    nconj = len(conjuncts)
+    names = [[name for name in compile(c, '<string>', 'eval').co_names
+              if name in vars] for c in conjuncts]
+    evaluators = [_evaluator(c, vars, vm, bsize) for c in conjuncts]
+    # The first block is fully evaluated for every conjunct, so its values
+    # are fetched right away and the conjuncts are checked on a few of them
+    first = {}
+    for name in set(sum(names, [])):
+        var = vars[name]
+        first[name] = var[:bsize] if hasattr(var, "__len__") else var
+    n = min(vlen, 8)
+    for j in xrange(nconj):
+        vars_ = dict((name, first[name][:n]
+                      if hasattr(first[name], "__len__") else first[name])
+                     for name in names[j])
+        res = np.asarray(evaluators[j](vars_, n))
+        if res.dtype != np.bool_ or res.shape not in ((), (n,)):
+            return None
+    # The elements evaluated, the elements passed and the time spent
+    # (fetching the operands included) for every conjunct
+    seen, passed, spent = [0] * nconj, [0] * nconj, [0.] * nconj
+    def rank(j):
+        discarded = 1 - passed[j] / float(max(seen[j], 1))
+        return (spent[j] / max(seen[j], 1)) / max(discarded, 1e-3)
+    order = range(nconj)
+
+    for i in xrange(0, vlen, bsize):
+        blen = min(bsize, vlen - i)
+        # The values of the variables fetched so far
+        block = first if i == 0 else {}
+        # The surviving elements, either as a mask or, when there are
+        # few of them, as their positions in the block
+        mask, rows, nrows = None, None, blen
+        for j in order:
+            if nrows == 0 and i > 0:
+                break
+            t0 = time.time()
+            vars_ = {}
+            for name in names[j]:
+                if name not in block:
+                    var = vars[name]
+                    if hasattr(var, "__len__"):
+                        var = var[i:i+blen]
+                    block[name] = var
+                value = block[name]
+                if rows is not None and hasattr(value, "__len__"):
+                    value = value[rows]
+                vars_[name] = value
+            n = blen if rows is None else nrows
+            res = np.asarray(evaluators[j](vars_, n))
+            if res.dtype != np.bool_ or res.shape not in ((), (n,)):
+                raise ValueError(
+                    "conjunct `%s` does not evaluate to a boolean array "
+                    "for all the blocks" % conjuncts[j])
+            if res.ndim == 0:
+                res = np.repeat(res, n)
+            if rows is not None:
+                rows = rows[res]
+                npassed = len(rows)
+            elif mask is None:
+                mask = res.copy()
+                npassed = np.count_nonzero(mask)
+            elif i == 0:
+                # Measure the selectivity on the full block
+                npassed = np.count_nonzero(res)
+                mask &= res
+            else:
+                mask &= res
+                npassed = np.count_nonzero(mask)
+            spent[j] += time.time() - t0
+            seen[j] += n if i == 0 or rows is not None else nrows
+            passed[j] += npassed
+            nrows = npassed if i > 0 else np.count_nonzero(mask)
+            if rows is None and i > 0 and nrows < blen // 8:
+                rows = np.flatnonzero(mask)
+        order.sort(key=rank)
+
+        if rows is not None:
+            res_block = np.zeros(blen, dtype=np.bool_)
+            res_block[rows] = True
+        else:
+            res_block = mask
+        if i == 0:
+            if out_flavor == "carray":
+                nrows = kwargs.pop('expectedlen', vlen)
+                result = ca.carray(res_block, expectedlen=nrows, **kwargs)
+            else:
+                result = np.empty(vlen, dtype=np.bool_)
+                result[:blen] = res_block
+        else:
+            if out_flavor == "carray":
+                result.append(res_block)
+            else:
+                result[i:i+blen] = res_block
+
+    if isinstance(result, ca.carray):
+        result.flush()
+    return result
+
+def _reduce_blocks(reductions, vars, vlen, typesize, vm):
+    """Compute `reductions` in blocks.  Return the list of results.
+
+    The operand of every reduction is evaluated for each block and reduced
+    right away, so that only the partial results are kept in memory.
+    """
+
+    bsize = _calc_blen(vm, typesize, vlen)
+    vars_ = _block_buffers(vars, bsize)
+    evaluators = [_evaluator(operand, vars, vm, bsize)
+                  for fname, operand in reductions]
+    partials = [None] * len(reductions)
+    counts = [0] * len(reductions)
+    # Operands that do not depend on arrays only need to be reduced once
+    constant = [False] * len(reductions)
+
+    for i in xrange(0, vlen, bsize):
+        # Get buffers for vars
+        _fill_block(vars, vars_, i, bsize, vlen)
+
+        # Reduce every operand in this block and fold the partial result
+        for j, (fname, operand) in enumerate(reductions):
+            if constant[j]:
+                continue
+            res_block = evaluators[j](vars_, min(bsize, vlen - i))
+            if np.ndim(res_block) == 0:
+                constant[j] = True
+            elif np.size(res_block) == 0:
+                continue
+            reduce_, combine = _reductions[fname]
+            partial = reduce_(res_block)
+            counts[j] += np.size(res_block)
+            if partials[j] is None:
+                partials[j] = partial
+            else:
+                partials[j] = combine(partials[j], partial)
+
+    results = []
+    for j, (fname, operand) in enumerate(reductions):
+        result = partials[j]
+        if result is None:
+            # Empty operands behave as in NumPy (i.e. min() raises)
+            reduce_ = np.mean if fname == 'mean' else _reductions[fname][0]
+            result = reduce_(np.empty(0))
+        elif fname == 'mean':
+            result = np.true_divide(result, counts[j])
+        results.append(result)
+    return results
+
 
 def walk(dir, classname=None, mode='a'):
     """walk(dir, classname=None, mode='a')
@@ -0,0 +1,242 @@
+"""A virtual machine for `eval` based on NumPy ufuncs.
+
+Expressions are parsed only once into a sequence of ufunc calls (the
+ufunc tree in post-order).  The temporaries for these calls are
+preallocated for a block of elements and every call writes into its
+temporary via the `out` argument.  Temporaries are recycled as soon as
+their value has been consumed, so evaluating a new block does not
+allocate any memory.
+"""
+
+import ast
+import numpy as np
+
+
+def _where(cond, x, y, out=None):
+    """A `where` function that accepts an `out` argument."""
+    if out is None:
+        return np.where(cond, x, y)
+    out[...] = y
+    np.copyto(out, x, where=cond)
+    return out
+
+_binops = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+    ast.FloorDiv: np.floor_divide,
+    ast.Mod: np.mod,
+    ast.Pow: np.power,
+    ast.BitAnd: np.bitwise_and,
+    ast.BitOr: np.bitwise_or,
+    ast.BitXor: np.bitwise_xor,
+    ast.LShift: np.left_shift,
+    ast.RShift: np.right_shift,
+    }
+
+_unaryops = {
+    ast.USub: np.negative,
+    ast.Not: np.logical_not,
+    ast.Invert: np.invert,
+    }
+
+_cmpops = {
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    }
+
+_boolops = {
+    ast.And: np.logical_and,
+    ast.Or: np.logical_or,
+    }
+
+functions = {
+    'abs': np.absolute,
+    'arccos': np.arccos,
+    'arccosh': np.arccosh,
+    'arcsin': np.arcsin,
+    'arcsinh': np.arcsinh,
+    'arctan': np.arctan,
+    'arctan2': np.arctan2,
+    'arctanh': np.arctanh,
+    'ceil': np.ceil,
+    'conj': np.conjugate,
+    'cos': np.cos,
+    'cosh': np.cosh,
+    'exp': np.exp,
+    'expm1': np.expm1,
+    'floor': np.floor,
+    'fmod': np.fmod,
+    'log': np.log,
+    'log10': np.log10,
+    'log1p': np.log1p,
+    'sin': np.sin,
+    'sinh': np.sinh,
+    'sqrt': np.sqrt,
+    'tan': np.tan,
+    'tanh': np.tanh,
+    'where': _where,
+    }
+"""The functions that can be used in expressions for the 'ufunc' vm."""
+
+# Functions whose output cannot overlap with their inputs
+_no_inplace = set([_where])
+
+_constants = {'True': True, 'False': False}
+
+
+class program(object):
+    """
+    program(expression, vars, bsize)
+
+    An `expression` compiled into ufunc calls with preallocated temporaries.
+
+    Parameters
+    ----------
+    expression : string
+        An elementwise expression like '2*a+sin(b)'.
+    vars : dict
+        The variables participating in `expression`.  Arrays are only
+        used for getting their dtype and trailing shape.
+    bsize : int
+        The maximum number of elements in blocks passed to `run()`.
+
+    """
+
+    def __init__(self, expression, vars, bsize):
+        self.expression = expression
+        self.bsize = bsize
+        self._vars = vars
+        self._code = []       # the (func, args, nbuf) instructions
+        self._buffers = []    # the preallocated temporaries
+        self._pool = {}       # (dtype, shape) -> list of free buffers
+        tree = ast.parse(expression.strip(), mode='eval')
+        with np.errstate(all='ignore'):
+            self._result = self._visit(tree.body)
+        del self._vars, self._pool
+
+    def _sample(self, arg):
+        """Return a sample value for `arg` to infer types with."""
+        kind, value = arg[:2]
+        if kind == 'tmp':
+            return value
+        if kind == 'var':
+            var = self._vars[value]
+            if hasattr(var, "__len__"):
+                return np.zeros((1,) + var.shape[1:], dtype=var.dtype)
+            return var
+        return value
+
+    def _emit(self, func, args):
+        """Add a call to `func` and return a reference to its result."""
+        sample = func(*[self._sample(arg) for arg in args])
+        key = (sample.dtype, sample.shape[1:])
+        if func not in _no_inplace:
+            self._release(args)
+        free = self._pool.setdefault(key, [])
+        if free:
+            nbuf = free.pop()
+        else:
+            nbuf = len(self._buffers)
+            self._buffers.append(np.empty((self.bsize,) + key[1], key[0]))
+        if func in _no_inplace:
+            self._release(args)
+        self._code.append((func, args, nbuf))
+        return ('tmp', sample, nbuf)
+
+    def _release(self, args):
+        """Return the temporaries in `args` to the pool."""
+        for arg in args:
+            if arg[0] == 'tmp':
+                buf = self._buffers[arg[2]]
+                self._pool[(buf.dtype, buf.shape[1:])].append(arg[2])
+
+    def _visit(self, node):
+        if isinstance(node, ast.Name):
+            if node.id in _constants:
+                return ('const', _constants[node.id])
+            if node.id not in self._vars:
+                raise NameError("variable name ``%s`` not found" % node.id)
+            return ('var', node.id)
+        elif isinstance(node, ast.Num):
+            return ('const', node.n)
+        elif isinstance(node, ast.BinOp) and type(node.op) in _binops:
+            args = [self._visit(node.left), self._visit(node.right)]
+            return self._emit(_binops[type(node.op)], args)
+        elif isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.UAdd):
+                return self._visit(node.operand)
+            return self._emit(_unaryops[type(node.op)],
+                              [self._visit(node.operand)])
+        elif isinstance(node, ast.Compare):
+            # Chained comparisons are and-ed, as in Python
+            result, left = None, node.left
+            for op, right in zip(node.ops, node.comparators):
+                if type(op) not in _cmpops:
+                    break
+                cmp_ = self._emit(_cmpops[type(op)],
+                                  [self._visit(left), self._visit(right)])
+                if result is None:
+                    result = cmp_
+                else:
+                    result = self._emit(np.logical_and, [result, cmp_])
+                left = right
+            else:
+                return result
+        elif isinstance(node, ast.BoolOp):
+            result = self._visit(node.values[0])
+            for value in node.values[1:]:
+                result = self._emit(_boolops[type(node.op)],
+                                    [result, self._visit(value)])
+            return result
+        elif (isinstance(node, ast.Call) and
+              isinstance(node.func, ast.Name) and
+              node.func.id in functions and
+              not (node.keywords or node.starargs or node.kwargs)):
+            return self._emit(functions[node.func.id],
+                              [self._visit(arg) for arg in node.args])
+        raise NotImplementedError(
+            "`%s` is not supported by the 'ufunc' vm" %
+            node.__class__.__name__)
+
+    def run(self, vars, blen):
+        """
+        run(vars, blen)
+
+        Evaluate the program for a block of `blen` elements in `vars`.
+
+        The outcome is a view of an internal temporary that is overwritten
+        by the next call, so it has to be consumed (or copied) before that.
+
+        """
+        buffers = self._buffers
+        for func, args, nbuf in self._code:
+            operands = []
+            for arg in args:
+                kind, value = arg[:2]
+                if kind == 'tmp':
+                    operands.append(buffers[arg[2]][:blen])
+                elif kind == 'var':
+                    operands.append(vars[value])
+                else:
+                    operands.append(value)
+            func(*operands, out=buffers[nbuf][:blen])
+        kind, value = self._result[:2]
+        if kind == 'tmp':
+            return buffers[self._result[2]][:blen]
+        elif kind == 'var':
+            return vars[value]
+        return value
+
+
+## Local Variables:
+## mode: python
+## py-indent-offset: 4
+## tab-width: 4
+## fill-column: 78
+## End:
@@ -0,0 +1,310 @@
+"""Views over ctables.
+
+A `ctableview` exposes some of the columns and a range of the rows of a
+ctable without copying any data: its columns are `colview` objects
+that translate the accesses to the rows of the underlying columns.
+Views support the read operations of ctables (`where()`, `eval()`,
+`iter()`, indexing, `topk()`, ...).  Writing to a view makes private
+copies of the shared columns first, so the viewed table is never
+modified through a view.
+"""
+
+import sys
+
+import numpy as np
+
+import indexes, attrs
+from ctable import ctable, cols as colsaccessor
+
+# See the note in toplevel.py about importing the package here
+ca = sys.modules['blaze.carray']
+
+
+class colview(object):
+    """
+    colview(column, start, stop)
+
+    A read-only view of the `start` to `stop` rows of the `column`
+    carray.
+
+    """
+
+    rootdir = None
+    "Views are never persisted."
+
+    @property
+    def cbytes(self):
+        "The (estimated) compressed size of the rows in the view."
+        if len(self.column) == 0:
+            return 0
+        return self.column.cbytes * len(self) // len(self.column)
+
+    @property
+    def chunklen(self):
+        "The chunklen of the underlying carray."
+        return self.column.chunklen
+
+    @property
+    def cparams(self):
+        "The compression parameters of the underlying carray."
+        return self.column.cparams
+
+    @property
+    def dtype(self):
+        "The data type of this object (numpy dtype)."
+        return self.column.dtype
+
+    @property
+    def nbytes(self):
+        "The original (uncompressed) size of this object (in bytes)."
+        return len(self) * self.dtype.itemsize
+
+    @property
+    def ndim(self):
+        "The number of dimensions of this object."
+        return 1
+
+    @property
+    def shape(self):
+        "The shape of this object."
+        return (len(self),)
+
+    def __init__(self, column, start, stop):
+        if isinstance(column, colview):
+            # Views of views look directly into the underlying carray
+            column, start, stop = (column.column, column.start + start,
+                                   column.start + stop)
+        self.column = column
+        "The underlying carray."
+        self.start, self.stop = start, stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self[:]
+        return self[:].astype(dtype)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, long, np.integer)):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError, "index out of range"
+            return self.column[self.start + key]
+        elif isinstance(key, slice):
+            if key.step is not None and key.step <= 0:
+                raise NotImplementedError(
+                    "step in slice can only be positive")
+            start, stop, step = key.indices(len(self))
+            stop = max(stop, start)
+            return self.column[self.start + start:self.start + stop:step]
+        elif isinstance(key, tuple) and len(key) == 1:
+            return self[key[0]]
+        elif isinstance(key, list) or hasattr(key, "dtype"):
+            key = np.asarray(key)
+            if key.dtype.type == np.bool_:
+                if len(key) != len(self):
+                    raise IndexError, \
+                          "boolean array length must match len(self)"
+                return indexes.gather(self.column,
+                                      np.flatnonzero(key) + self.start)
+            if not np.issubsctype(key, np.integer):
+                raise IndexError, \
+                      "arrays used as indices must be integer (or boolean)"
+            key = np.where(key < 0, key + len(self), key)
+            if len(key) and (key.min() < 0 or key.max() >= len(self)):
+                raise IndexError, "index out of range"
+            order = np.argsort(key, kind='mergesort')
+            out = np.empty(len(key), dtype=self.dtype)
+            out[order] = indexes.gather(self.column,
+                                        key[order] + self.start)
+            return out
+        raise NotImplementedError, "key not supported: %s" % repr(key)
+
+    def _getrange(self, start, blen, out):
+        # carray._getrange() only supports ranges starting at a chunk
+        # boundary
+        start += self.start
+        out[:blen] = self.column[start:start + blen]
+
+    def iter(self, start=0, stop=None, step=1, limit=None, skip=0):
+        """
+        iter(start=0, stop=None, step=1, limit=None, skip=0)
+
+        Iterator with `start`, `stop` and `step` bounds.
+
+        """
+        start, stop, step = slice(start, stop, step).indices(len(self))
+        stop = max(stop, start)
+        return self.column.iter(self.start + start, self.start + stop, step,
+                                limit=limit, skip=skip)
+
+    def __iter__(self):
+        return self.iter()
+
+    def copy(self, **kwargs):
+        """
+        copy(**kwargs)
+
+        Return the rows of the view as a new carray.
+
+        Parameters
+        ----------
+        kwargs : list of parameters or dictionary
+            Any parameter supported by the carray constructor.
+
+        """
+        kwargs.setdefault('cparams', self.cparams)
+        kwargs.setdefault('expectedlen', len(self))
+        ccopy = ca.carray(np.empty(0, dtype=self.dtype), **kwargs)
+        bsize = self.chunklen
+        for i in xrange(self.start, self.stop, bsize):
+            ccopy.append(self.column[i:min(i + bsize, self.stop)])
+        ccopy.flush()
+        return ccopy
+
+    def flush(self):
+        """Views have nothing to flush."""
+        pass
+
+    def __str__(self):
+        return str(self[:])
+
+    def __repr__(self):
+        return "colview(%s, %s)\n  start := %d; stop := %d\n%s" % (
+            self.shape, self.dtype, self.start, self.stop, str(self))
+
+
+def _view(column, start, stop):
+    """Return a view of the `start` to `stop` rows of `column`."""
+    if type(column) is ca.categorical:
+        # Share the categories, and look into the codes
+        view = ca.categorical.__new__(ca.categorical)
+        view.rootdir, view.mode = None, 'a'
+        view.categories, view._lookup = column.categories, column._lookup
+        view.codes = colview(column.codes, start, stop)
+        return view
+    return colview(column, start, stop)
+
+
+def _copy(column):
+    """Return a private, in-memory copy of the `column` view."""
+    if type(column) is ca.categorical:
+        ccopy = ca.categorical(np.empty(0, dtype=column.dtype),
+                               column.categories)
+        ccopy.codes = column.codes.copy()
+        return ccopy
+    return column.copy()
+
+
+class ctableview(ctable):
+    """
+    ctableview(table, cols=None, start=0, stop=None)
+
+    A view of some columns and rows of a ctable.
+
+    The view shares the columns of `table`, so creating it does not copy
+    or decompress any data.  Like with NumPy views, the changes made to
+    `table` are seen through the view (as long as it keeps enough rows).
+    Modifying the view (`append()`, `trim()`, `resize()` or item
+    assignment) does not modify `table`: the shared columns are copied
+    into private (in-memory) carrays first.
+
+    Parameters
+    ----------
+    table : ctable
+        The table to look into.
+    cols : list of strings or string
+        The names of the columns in the view.  Alternatively, it can be
+        specified as a string such as 'f0 f1' or 'f0, f1'.  If None, all
+        the columns are in the view.
+    start, stop : int
+        The range of rows in the view (all of them by default).
+
+    """
+
+    def __init__(self, table, cols=None, start=0, stop=None):
+        names = table._check_outcols(cols)
+        if 'nrow__' in names:
+            raise ValueError, "not all cols are real column names"
+        start, stop, _ = slice(start, stop).indices(len(table))
+        stop = max(stop, start)
+
+        self.base = table
+        "The table this view looks into."
+        self._cparams = table.cparams
+        self.rootdir = None
+        self.mode = 'a'
+        self.cols = colsaccessor(None, 'a')
+        for name in names:
+            self.cols[name] = _view(table.cols[name], start, stop)
+        self.len = stop - start
+        self.indexes = {}
+        self._zonemaps = {}
+        self._sketches = {}
+        self._stats = None
+        self._stats_dirty = False
+        self.attrs = attrs.attrs(None, 'a', _new=True)
+        self._arr1 = np.empty(shape=(1,), dtype=self.dtype)
+        # The columns that are still shared with `table`
+        self._shared = set(names)
+
+    def _own(self):
+        """Replace the shared columns with private copies."""
+        for name in self.names:
+            if name in self._shared:
+                self.cols._set(name, _copy(self.cols[name]))
+        self._shared.clear()
+
+    def append(self, rows):
+        self._own()
+        super(ctableview, self).append(rows)
+    append.__doc__ = ctable.append.__doc__
+
+    def trim(self, nitems):
+        self._own()
+        super(ctableview, self).trim(nitems)
+    trim.__doc__ = ctable.trim.__doc__
+
+    def resize(self, nitems):
+        self._own()
+        super(ctableview, self).resize(nitems)
+    resize.__doc__ = ctable.resize.__doc__
+
+    def __setitem__(self, key, value):
+        self._own()
+        super(ctableview, self).__setitem__(key, value)
+
+    def delcol(self, name=None, pos=None):
+        super(ctableview, self).delcol(name, pos)
+        self._shared &= set(self.names)
+    delcol.__doc__ = ctable.delcol.__doc__
+
+    def copy(self, **kwargs):
+        """
+        copy(**kwargs)
+
+        Return the columns and rows of this view as a new ctable.
+
+        Parameters
+        ----------
+        kwargs : list of parameters or dictionary
+            Any parameter supported by the ctable constructor.
+
+        """
+        names = kwargs.pop('names', self.names)
+        cols = [_copy(self.cols[name]) for name in self.names]
+        return ctable(cols, names, **kwargs)
+
+    def __repr__(self):
+        return "view of " + super(ctableview, self).__repr__()
+
+
+## Local Variables:
+## mode: python
+## py-indent-offset: 4
+## tab-width: 4
+## fill-column: 78
+## End:
@@ -0,0 +1,147 @@
+"""Zone maps for ctable columns.
+
+A zone map keeps the minimum and maximum values of every full chunk of
+a column.  Queries that only want values in a given range (like top-k
+selections) can then skip the chunks that cannot hold any of them,
+without decompressing them.
+
+Zones are filled lazily by the operations that have to decompress a
+chunk anyway, and they are persisted in the rootdir of the ctable (if
+any).  The trailing partial chunk of a column is never kept, so
+appending rows does not invalidate a zone map.
+"""
+
+import os, os.path
+import shutil
+
+import numpy as np
+
+ZONEMAPSDIR = '__zonemaps__'
+
+
+def supported(dtype):
+    """Tell whether columns of `dtype` can have zone maps."""
+    return dtype.kind in 'biufmM'
+
+
+class zonemap(object):
+    """
+    zonemap(filename=None, mode='a')
+
+    The minimum and maximum values of the full chunks of a column.
+
+    Parameters
+    ----------
+    filename : string
+        The file where the zone map is persisted.  If it exists, the zone
+        map is read from it.
+    mode : string
+        The mode in which the zone map is opened ('r' or 'a').
+
+    """
+
+    def __init__(self, filename=None, mode='a'):
+        self.filename = filename
+        self.mode = mode
+        self.mins = self.maxs = None
+        self.known = np.zeros(0, dtype=np.bool_)
+        "Whether the zone of every chunk is known."
+        self._dirty = False
+        if filename and os.path.isfile(filename):
+            data = np.load(filename)
+            try:
+                self.mins, self.maxs = data['mins'], data['maxs']
+                self.known = data['known']
+            finally:
+                data.close()
+
+    def get(self, nchunk):
+        """
+        get(nchunk)
+
+        Return the (min, max) values of the chunk `nchunk`, or None if
+        they are not known.
+
+        """
+        if nchunk < len(self.known) and self.known[nchunk]:
+            return self.mins[nchunk], self.maxs[nchunk]
+        return None
+
+    def set(self, nchunk, values):
+        """
+        set(nchunk, values)
+
+        Set the zone of the chunk `nchunk` out of its `values`.  NaNs
+        are ignored, so a chunk with NaNs only gets a NaN zone.
+
+        """
+        if nchunk >= len(self.known):
+            size = max(nchunk + 1, 2 * len(self.known))
+            mins = np.empty(size, dtype=values.dtype)
+            maxs = np.empty(size, dtype=values.dtype)
+            known = np.zeros(size, dtype=np.bool_)
+            if self.mins is not None:
+                n = len(self.known)
+                mins[:n], maxs[:n] = self.mins, self.maxs
+                known[:n] = self.known
+            self.mins, self.maxs, self.known = mins, maxs, known
+        if values.dtype.kind in 'fc':
+            values = values[~np.isnan(values)]
+        if len(values) == 0:
+            self.mins[nchunk] = self.maxs[nchunk] = np.nan
+        else:
+            self.mins[nchunk], self.maxs[nchunk] = values.min(), values.max()
+        self.known[nchunk] = True
+        self._dirty = True
+
+    def truncate(self, nchunks):
+        """
+        truncate(nchunks)
+
+        Forget about the zones of the chunks after the first `nchunks`.
+
+        """
+        if self.known[nchunks:].any():
+            self.known[nchunks:] = False
+            self._dirty = True
+
+    def flush(self):
+        """Save the zone map in its file (if any)."""
+        if not (self.filename and self._dirty) or self.mode == 'r':
+            return
+        dirname = os.path.dirname(self.filename)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with open(self.filename, 'wb') as zfile:
+            np.savez(zfile, mins=self.mins, maxs=self.maxs, known=self.known)
+        self._dirty = False
+
+    def __repr__(self):
+        return "zonemap(nknown=%d)" % self.known.sum()
+
+
+def filename(rootdir, name):
+    """The file for the zone map of the `name` column in `rootdir`."""
+    if not rootdir:
+        return None
+    return os.path.join(rootdir, ZONEMAPSDIR, name + '.npz')
+
+
+def remove_zonemaps(rootdir, name=None):
+    """Remove the zone map of `name` (or all of them) from `rootdir`."""
+    if not rootdir:
+        return
+    if name is None:
+        zonemapsdir = os.path.join(rootdir, ZONEMAPSDIR)
+        if os.path.isdir(zonemapsdir):
+            shutil.rmtree(zonemapsdir)
+    elif os.path.isfile(filename(rootdir, name)):
+        os.remove(filename(rootdir, name))
+
+
+## Local Variables:
+## mode: python
+## py-indent-offset: 4
+## tab-width: 4
+## fill-column: 78
+## End:
@@ -154,8 +154,27 @@ def build_operand_dict(context, aterm_graph):
     context['operand_dict'] = operand_dict
     return context, aterm_graph
 
+def do_pushdown(context, aterm_graph):
+    """ Let the source of the operands run the whole expression if it
+    can, e.g. a SQL database (see ByteProvider.pushdown).  The result
+    ends up in ``context['result']`` and the later passes are skipped.
+    """
+    for op in context['operands']:
+        source = getattr(op, 'data', None)
+        if not hasattr(source, 'pushdown'):
+            continue
+        result = source.pushdown(aterm_graph, context['operand_dict'])
+        if result is not NotImplemented:
+            context = dict(context)
+            context['result'] = result
+            break
+    return context, aterm_graph
+
 def substitute_llvm(context, aterm_graph):
     "Substitute executors for the parts of the graph we can handle"
+    if 'result' in context:
+        return context, aterm_graph
+
     from blaze.engine import llvm_execution
 
     executors = context['executors'] = {}
@@ -181,6 +200,9 @@ def do_plan(context, aterm_graph):
         ret %0
 
     """
+    if 'result' in context:
+        return context, aterm_graph
+
     context = dict(context)
 
     ivisitor = InstructionGen(context['executors'], have_numbapro=have_numbapro)
@@ -220,6 +242,7 @@ class Pipeline(object):
 
             # codegen stages
             build_operand_dict,
+            do_pushdown,
             substitute_llvm,
             do_plan,
         ]
@@ -22,6 +22,10 @@ PyObject_Representation = [
     'str', 'repr'
 ]
 
+Reductions = [
+    'sum', 'min', 'max', 'count'
+]
+
 PyArray_Intrinsics = [
     "dtype", "size"
 ]
@@ -9,7 +9,8 @@ from collections import Iterable
 from blaze.expr import nodes, catalog
 from blaze.datashape import coretypes
 from blaze.sources.canonical import PythonSource
-from blaze.datashape.coretypes import int_, float_, string, top, dynamic
+from blaze.datashape.coretypes import int_, float_, string, top, dynamic, \
+    DataShape
 
 # Type checking and unification
 from blaze.datashape.unification import unify
@@ -222,7 +223,7 @@ class ExpressionNode(nodes.Node):
             return App(iop)
 
         elif arity == -1:
-            return op(func_name, iargs, kwargs)
+            return op(func_name, iargs)
 
     def generate_fnnode(self, fname, args=None, kwargs=None):
         pass
@@ -273,6 +274,16 @@ class ExpressionNode(nodes.Node):
         del name
         del _
 
+    # Reductions
+    # ----------
+    for name in catalog.Reductions:
+        exec (
+            "def %(name)s(self):\n"
+            "    return self.generate_opnode(-1, '%(name)s', [self])"
+            "\n"
+        ) % locals()
+        del name
+
 #------------------------------------------------------------------------
 # Indexables
 #------------------------------------------------------------------------
@@ -373,6 +384,12 @@ class ArrayNode(ExpressionNode):
                                      intnode(idx.step)])
         elif isinstance(idx, Integral) or isinstance(idx, np.integer):
             result = IndexNode(context, [self, idx])
+        elif isinstance(idx, basestring):
+            # A field of the records, like a column of a table
+            result = IndexNode(context, [self, StringNode(idx)])
+        elif isinstance(idx, nodes.Node):
+            # A mask, like a predicate over the columns of a table
+            result = IndexNode(context, [self, idx])
         else:
             # TODO: detect other forms
             ndx = IndexNode(idx)
@@ -558,7 +575,11 @@ class Op(ExpressionNode):
         # the function. Does naive type checking and inference.
 
         # TODO: type inference on the aterm graph
-        self.datashape = coretypes.broadcast(*operands)
+        self.datashape = self.infer_datashape(operands)
+
+    def infer_datashape(self, operands):
+        """ The datashape of the result, out of the operands. """
+        return coretypes.broadcast(*operands)
 
     @property
     def nin(self):
@@ -704,11 +725,28 @@ class FloatNode(Literal):
 # Slices and Indexes
 #------------------------------------------------------------------------
 
-class IndexNode(Op):
+class IndexNode(Op, ArrayNode):
+    # Indexing results can be indexed further, like t[t['a'] > 0]['b']
     arity  = 2 # <INDEXABLE>, <INDEXER>
     vtype = tuple
     kind  = OP
 
+    def infer_datashape(self, operands):
+        indexable, indexer = operands
+        if isinstance(indexer, StringNode):
+            # The field of the records, with the same dimensions
+            ds = indexable.datashape
+            measure = coretypes.extract_measure(ds)
+            return DataShape(coretypes.extract_dims(ds) +
+                             (measure(indexer.val),))
+        elif isinstance(indexer, nodes.Node):
+            # The elements selected by a mask
+            return indexable.datashape
+        return super(IndexNode, self).infer_datashape(operands)
+
+    def simple_type(self):
+        return self.datashape
+
     @property
     def name(self):
         return 'Index%s' % str(self.val)
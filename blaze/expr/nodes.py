@@ -20,14 +20,18 @@ class Node(object):
 
     def eval(self):
         """ Evaluates the expression graph """
-        from blaze.rts.execution import execplan
-
         # setup a default pipeline
         line = pipeline.Pipeline()
 
         # generate the plan
         ctx, plan = line.run_pipeline(self)
 
+        # the whole expression was run by the source of its data
+        if 'result' in ctx:
+            return ctx['result']
+
+        from blaze.rts.execution import execplan
+
         # submit to the runtime for the result
         return execplan(ctx, plan)
 
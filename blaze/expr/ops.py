@@ -1,6 +1,6 @@
 import numpy as np
 
-from graph import Op
+from graph import Op, App
 from blaze.datashape import coretypes as C
 from blaze.datashape.coretypes import promote
 
@@ -112,3 +112,150 @@ class Abs(Op):
     sideffectful = False
 
     is_arithmetic = True
+
+#------------------------------------------------------------------------
+# Comparisons
+#------------------------------------------------------------------------
+
+def datashape(node):
+    """ The datashape of an operand, looking into applications. """
+    if isinstance(node, App):
+        node = node.operator
+    return node.datashape
+
+class Logical(Op):
+    """
+    Operators with boolean results, shaped like their operands.
+    """
+    abstract = True
+
+    def infer_datashape(self, operands):
+        for operand in operands:
+            ds = datashape(operand)
+            if not isinstance(ds, C.CType):
+                return C.DataShape(C.extract_dims(ds) + (C.bool_,))
+        return C.bool_
+
+    def simple_type(self):
+        return self.datashape
+
+class Comparison(Logical):
+    abstract = True
+
+    # -----------------------
+    arity = 2
+    signature = 'a -> a -> bool'
+    dom = [universal, universal]
+    # -----------------------
+
+    identity     = None
+    associative  = False
+    idempotent   = False
+    nilpotent    = False
+    sideffectful = False
+
+class Eq(Comparison):
+    commutative = True
+
+class Ne(Comparison):
+    commutative = True
+
+class Lt(Comparison):
+    commutative = False
+
+class Le(Comparison):
+    commutative = False
+
+class Gt(Comparison):
+    commutative = False
+
+class Ge(Comparison):
+    commutative = False
+
+#------------------------------------------------------------------------
+# Boolean Logic
+#------------------------------------------------------------------------
+
+class And(Logical):
+    # -----------------------
+    arity = 2
+    signature = 'bool -> bool -> bool'
+    dom = [bools, bools]
+    # -----------------------
+
+    identity     = true
+    commutative  = True
+    associative  = True
+    idempotent   = True
+    nilpotent    = False
+    sideffectful = False
+
+class Or(Logical):
+    # -----------------------
+    arity = 2
+    signature = 'bool -> bool -> bool'
+    dom = [bools, bools]
+    # -----------------------
+
+    identity     = false
+    commutative  = True
+    associative  = True
+    idempotent   = True
+    nilpotent    = False
+    sideffectful = False
+
+class Invert(Logical):
+    # -----------------------
+    arity = 1
+    signature = 'bool -> bool'
+    dom = [bools]
+    # -----------------------
+
+    identity     = None
+    commutative  = False
+    associative  = False
+    idempotent   = False
+    nilpotent    = True
+    sideffectful = False
+
+#------------------------------------------------------------------------
+# Reductions
+#------------------------------------------------------------------------
+
+class Reduction(Op):
+    abstract = True
+
+    # -----------------------
+    arity = 1
+    signature = 'a -> a'
+    dom = [indexable]
+    # -----------------------
+
+    commutative  = False
+    associative  = False
+    idempotent   = False
+    nilpotent    = False
+    sideffectful = False
+
+    def infer_datashape(self, operands):
+        # All the dimensions are reduced
+        return C.extract_measure(datashape(operands[0]))
+
+    def simple_type(self):
+        return self.datashape
+
+class Sum(Reduction):
+    identity = zero
+
+class Min(Reduction):
+    identity = None
+
+class Max(Reduction):
+    identity = None
+
+class Count(Reduction):
+    signature = 'a -> int64'
+    identity  = zero
+
+    def infer_datashape(self, operands):
+        return C.int64
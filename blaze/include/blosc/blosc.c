@@ -114,6 +114,18 @@ struct temp_data {
 } current_temp;
 
 
+/* Structure for the temporaries of the re-entrant functions.  They are
+   kept from call to call, and only grown when a larger block comes. */
+struct blosc_context {
+  uint32_t tempsize;             /* the size of every temporary */
+  uint8_t *tmp;
+  uint8_t *tmp2;
+};
+
+/* The context for blosc_getitem() */
+static struct blosc_context getitem_context = {0};
+
+
 /* Macros for synchronization */
 int32_t rc = 0;
 
@@ -226,18 +238,18 @@ int32_t sw32(int32_t a)
 
 
 /* Shuffle & compress a single block */
-static int blosc_c(uint32_t blocksize, int32_t leftoverblock,
-                   uint32_t ntbytes, uint32_t maxbytes,
+static int blosc_c(const struct thread_data *p, uint32_t blocksize,
+                   int32_t leftoverblock, uint32_t ntbytes, uint32_t maxbytes,
                    uint8_t *src, uint8_t *dest, uint8_t *tmp)
 {
   int32_t j, neblock, nsplits;
   int32_t cbytes;                   /* number of compressed bytes in split */
   int32_t ctbytes = 0;              /* number of compressed bytes in block */
   int32_t maxout;
-  uint32_t typesize = params.typesize;
+  uint32_t typesize = p->typesize;
   uint8_t *_tmp;
 
-  if ((params.flags & BLOSC_DOSHUFFLE) && (typesize > 1)) {
+  if ((p->flags & BLOSC_DOSHUFFLE) && (typesize > 1)) {
     /* Shuffle this block (this makes sense only if typesize > 1) */
     shuffle(typesize, blocksize, src, tmp);
     _tmp = tmp;
@@ -268,7 +280,7 @@ static int blosc_c(uint32_t blocksize, int32_t leftoverblock,
         return 0;                  /* non-compressible block */
       }
     }
-    cbytes = blosclz_compress(params.clevel, _tmp+j*neblock, neblock,
+    cbytes = blosclz_compress(p->clevel, _tmp+j*neblock, neblock,
                               dest, maxout);
     if (cbytes >= maxout) {
       /* Buffer overrun caused by blosclz_compress (should never happen) */
@@ -299,8 +311,9 @@ static int blosc_c(uint32_t blocksize, int32_t leftoverblock,
 
 
 /* Decompress & unshuffle a single block */
-static int blosc_d(uint32_t blocksize, int32_t leftoverblock,
-                   uint8_t *src, uint8_t *dest, uint8_t *tmp, uint8_t *tmp2)
+static int blosc_d(const struct thread_data *p, uint32_t blocksize,
+                   int32_t leftoverblock, uint8_t *src, uint8_t *dest,
+                   uint8_t *tmp, uint8_t *tmp2)
 {
   int32_t j, neblock, nsplits;
   int32_t nbytes;                /* number of decompressed bytes in split */
@@ -308,9 +321,9 @@ static int blosc_d(uint32_t blocksize, int32_t leftoverblock,
   int32_t ctbytes = 0;           /* number of compressed bytes in block */
   int32_t ntbytes = 0;           /* number of uncompressed bytes in block */
   uint8_t *_tmp;
-  uint32_t typesize = params.typesize;
+  uint32_t typesize = p->typesize;
 
-  if ((params.flags & BLOSC_DOSHUFFLE) && (typesize > 1)) {
+  if ((p->flags & BLOSC_DOSHUFFLE) && (typesize > 1)) {
     _tmp = tmp;
   }
   else {
@@ -347,7 +360,7 @@ static int blosc_d(uint32_t blocksize, int32_t leftoverblock,
     ntbytes += nbytes;
   } /* Closes j < nsplits */
 
-  if ((params.flags & BLOSC_DOSHUFFLE) && (typesize > 1)) {
+  if ((p->flags & BLOSC_DOSHUFFLE) && (typesize > 1)) {
     if ((uintptr_t)dest % 16 == 0) {
       /* 16-bytes aligned dest.  SSE2 unshuffle will work. */
       unshuffle(typesize, blocksize, tmp, dest);
@@ -368,22 +381,22 @@ static int blosc_d(uint32_t blocksize, int32_t leftoverblock,
 
 
 /* Serial version for compression/decompression */
-int serial_blosc(void)
+int serial_blosc(struct thread_data *p)
 {
   uint32_t j, bsize, leftoverblock;
   int32_t cbytes;
-  int32_t compress = params.compress;
-  uint32_t blocksize = params.blocksize;
-  int32_t ntbytes = params.ntbytes;
-  int32_t flags = params.flags;
-  uint32_t maxbytes = params.maxbytes;
-  uint32_t nblocks = params.nblocks;
-  int32_t leftover = params.nbytes % params.blocksize;
-  uint32_t *bstarts = params.bstarts;
-  uint8_t *src = params.src;
-  uint8_t *dest = params.dest;
-  uint8_t *tmp = params.tmp[0];     /* tmp for thread 0 */
-  uint8_t *tmp2 = params.tmp2[0];   /* tmp2 for thread 0 */
+  int32_t compress = p->compress;
+  uint32_t blocksize = p->blocksize;
+  int32_t ntbytes = p->ntbytes;
+  int32_t flags = p->flags;
+  uint32_t maxbytes = p->maxbytes;
+  uint32_t nblocks = p->nblocks;
+  int32_t leftover = p->nbytes % p->blocksize;
+  uint32_t *bstarts = p->bstarts;
+  uint8_t *src = p->src;
+  uint8_t *dest = p->dest;
+  uint8_t *tmp = p->tmp[0];         /* tmp for thread 0 */
+  uint8_t *tmp2 = p->tmp2[0];       /* tmp2 for thread 0 */
 
   for (j = 0; j < nblocks; j++) {
     if (compress && !(flags & BLOSC_MEMCPYED)) {
@@ -403,7 +416,7 @@ int serial_blosc(void)
       }
       else {
         /* Regular compression */
-        cbytes = blosc_c(bsize, leftoverblock, ntbytes, maxbytes,
+        cbytes = blosc_c(p, bsize, leftoverblock, ntbytes, maxbytes,
                          src+j*blocksize, dest+ntbytes, tmp);
         if (cbytes == 0) {
           ntbytes = 0;              /* uncompressible data */
@@ -419,7 +432,7 @@ int serial_blosc(void)
       }
       else {
         /* Regular decompression */
-        cbytes = blosc_d(bsize, leftoverblock,
+        cbytes = blosc_d(p, bsize, leftoverblock,
                          src+sw32(bstarts[j]), dest+j*blocksize, tmp, tmp2);
       }
     }
@@ -517,7 +530,7 @@ int do_job(void) {
   /* Run the serial version when nthreads is 1 or when the buffers are
      not much larger than blocksize */
   if (nthreads == 1 || (params.nbytes / params.blocksize) <= 1) {
-    ntbytes = serial_blosc();
+    ntbytes = serial_blosc(&params);
   }
   else {
     ntbytes = parallel_blosc();
@@ -527,6 +540,46 @@ int do_job(void) {
 }
 
 
+/* Make the temporaries in `ctx` hold at least `size` bytes */
+static void context_temporaries(struct blosc_context *ctx, uint32_t size)
+{
+  if (ctx->tempsize >= size) {
+    return;
+  }
+  if (ctx->tempsize > 0) {
+    my_free(ctx->tmp);
+    my_free(ctx->tmp2);
+  }
+  ctx->tmp = my_malloc(size);
+  ctx->tmp2 = my_malloc(size);
+  ctx->tempsize = size;
+}
+
+
+/* Release the temporaries in `ctx` */
+static void release_context_temporaries(struct blosc_context *ctx)
+{
+  if (ctx->tempsize > 0) {
+    my_free(ctx->tmp);
+    my_free(ctx->tmp2);
+    ctx->tempsize = 0;
+  }
+}
+
+
+/* Do the compression or decompression of the buffer depending on the
+   parameters in `p`, in the calling thread and with the temporaries of
+   `ctx`, so this is re-entrant. */
+int do_job_ctx(struct thread_data *p, struct blosc_context *ctx) {
+  uint32_t ebsize = p->blocksize + p->typesize*sizeof(int32_t);
+
+  context_temporaries(ctx, ebsize);
+  p->tmp[0] = ctx->tmp;
+  p->tmp2[0] = ctx->tmp2;
+  return serial_blosc(p);
+}
+
+
 int32_t compute_blocksize(int32_t clevel, uint32_t typesize, int32_t nbytes)
 {
   uint32_t blocksize;
@@ -588,9 +641,13 @@ int32_t compute_blocksize(int32_t clevel, uint32_t typesize, int32_t nbytes)
 }
 
 
-/* The public routine for compression.  See blosc.h for docstrings. */
-int blosc_compress(int clevel, int doshuffle, size_t typesize, size_t nbytes,
-		   const void *src, void *dest, size_t destsize)
+/* Compression with the parameters in `p`: the global params (in the
+   pool of threads) or private ones (in the calling thread, with the
+   temporaries in `ctx`). */
+static int compress_buffer(struct thread_data *p, struct blosc_context *ctx,
+                           int clevel, int doshuffle,
+                           size_t typesize, size_t nbytes,
+                           const void *src, void *dest, size_t destsize)
 {
   uint8_t *_dest=NULL;         /* current pos for destination buffer */
   uint8_t *flags;              /* flags for header.  Currently booked:
@@ -674,28 +731,28 @@ int blosc_compress(int clevel, int doshuffle, size_t typesize, size_t nbytes,
   }
 
   /* Populate parameters for compression routines */
-  params.compress = 1;
-  params.clevel = clevel;
-  params.flags = (int32_t)*flags;
-  params.typesize = (uint32_t)typesize;
-  params.blocksize = blocksize;
-  params.ntbytes = ntbytes;
-  params.nbytes = nbytes_;
-  params.maxbytes = maxbytes;
-  params.nblocks = nblocks;
-  params.leftover = leftover;
-  params.bstarts = bstarts;
-  params.src = (uint8_t *)src;
-  params.dest = (uint8_t *)dest;
+  p->compress = 1;
+  p->clevel = clevel;
+  p->flags = (int32_t)*flags;
+  p->typesize = (uint32_t)typesize;
+  p->blocksize = blocksize;
+  p->ntbytes = ntbytes;
+  p->nbytes = nbytes_;
+  p->maxbytes = maxbytes;
+  p->nblocks = nblocks;
+  p->leftover = leftover;
+  p->bstarts = bstarts;
+  p->src = (uint8_t *)src;
+  p->dest = (uint8_t *)dest;
 
   if (!(*flags & BLOSC_MEMCPYED)) {
     /* Do the actual compression */
-    ntbytes = do_job();
+    ntbytes = (p == &params)? do_job(): do_job_ctx(p, ctx);
     if ((ntbytes == 0) && (nbytes_+BLOSC_MAX_OVERHEAD <= maxbytes)) {
       /* Last chance for fitting `src` buffer in `dest`.  Update flags
        and do a memcpy later on. */
       *flags |= BLOSC_MEMCPYED;
-      params.flags |= BLOSC_MEMCPYED;
+      p->flags |= BLOSC_MEMCPYED;
     }
   }
 
@@ -704,11 +761,11 @@ int blosc_compress(int clevel, int doshuffle, size_t typesize, size_t nbytes,
       /* We are exceeding maximum output size */
       ntbytes = 0;
     }
-    else if (((nbytes_ % L1) == 0) || (nthreads > 1)) {
+    else if (((nbytes_ % L1) == 0) || (p == &params && nthreads > 1)) {
       /* More effective with large buffers that are multiples of the
        cache size or multi-cores */
-      params.ntbytes = BLOSC_MAX_OVERHEAD;
-      ntbytes = do_job();
+      p->ntbytes = BLOSC_MAX_OVERHEAD;
+      ntbytes = (p == &params)? do_job(): do_job_ctx(p, ctx);
     }
     else {
       memcpy((uint8_t *)dest+BLOSC_MAX_OVERHEAD, src, nbytes_);
@@ -724,8 +781,30 @@ int blosc_compress(int clevel, int doshuffle, size_t typesize, size_t nbytes,
 }
 
 
-/* The public routine for decompression.  See blosc.h for docstrings. */
-int blosc_decompress(const void *src, void *dest, size_t destsize)
+/* The public routines for compression.  See blosc.h for docstrings. */
+int blosc_compress(int clevel, int doshuffle, size_t typesize, size_t nbytes,
+		   const void *src, void *dest, size_t destsize)
+{
+  return compress_buffer(&params, NULL, clevel, doshuffle, typesize, nbytes,
+                         src, dest, destsize);
+}
+
+
+int blosc_compress_ctx(struct blosc_context *ctx, int clevel, int doshuffle,
+                       size_t typesize, size_t nbytes, const void *src,
+                       void *dest, size_t destsize)
+{
+  struct thread_data p = {0};
+
+  return compress_buffer(&p, ctx, clevel, doshuffle, typesize, nbytes,
+                         src, dest, destsize);
+}
+
+
+/* Decompression with the parameters in `p` (see compress_buffer) */
+static int decompress_buffer(struct thread_data *p,
+                             struct blosc_context *ctx, const void *src,
+                             void *dest, size_t destsize)
 {
   uint8_t *_src=NULL;            /* current pos for source buffer */
   uint8_t *_dest=NULL;           /* current pos for destination buffer */
@@ -765,25 +844,25 @@ int blosc_decompress(const void *src, void *dest, size_t destsize)
   }
 
   /* Populate parameters for decompression routines */
-  params.compress = 0;
-  params.clevel = 0;            /* specific for compression */
-  params.flags = (int32_t)flags;
-  params.typesize = typesize;
-  params.blocksize = blocksize;
-  params.ntbytes = 0;
-  params.nbytes = nbytes;
-  params.nblocks = nblocks;
-  params.leftover = leftover;
-  params.bstarts = bstarts;
-  params.src = (uint8_t *)src;
-  params.dest = (uint8_t *)dest;
+  p->compress = 0;
+  p->clevel = 0;            /* specific for compression */
+  p->flags = (int32_t)flags;
+  p->typesize = typesize;
+  p->blocksize = blocksize;
+  p->ntbytes = 0;
+  p->nbytes = nbytes;
+  p->nblocks = nblocks;
+  p->leftover = leftover;
+  p->bstarts = bstarts;
+  p->src = (uint8_t *)src;
+  p->dest = (uint8_t *)dest;
 
   /* Check whether this buffer is memcpy'ed */
   if (flags & BLOSC_MEMCPYED) {
-    if (((nbytes % L1) == 0) || (nthreads > 1)) {
+    if (((nbytes % L1) == 0) || (p == &params && nthreads > 1)) {
       /* More effective with large buffers that are multiples of the
        cache size or multi-cores */
-      ntbytes = do_job();
+      ntbytes = (p == &params)? do_job(): do_job_ctx(p, ctx);
     }
     else {
       memcpy(dest, (uint8_t *)src+BLOSC_MAX_OVERHEAD, nbytes);
@@ -792,7 +871,7 @@ int blosc_decompress(const void *src, void *dest, size_t destsize)
   }
   else {
     /* Do the actual decompression */
-    ntbytes = do_job();
+    ntbytes = (p == &params)? do_job(): do_job_ctx(p, ctx);
   }
 
   assert(ntbytes <= (int32_t)destsize);
@@ -800,10 +879,28 @@ int blosc_decompress(const void *src, void *dest, size_t destsize)
 }
 
 
+/* The public routines for decompression.  See blosc.h for docstrings. */
+int blosc_decompress(const void *src, void *dest, size_t destsize)
+{
+  return decompress_buffer(&params, NULL, src, dest, destsize);
+}
+
+
+int blosc_decompress_ctx(struct blosc_context *ctx, const void *src,
+                         void *dest, size_t destsize)
+{
+  struct thread_data p = {0};
+
+  return decompress_buffer(&p, ctx, src, dest, destsize);
+}
+
+
 /* Specific routine optimized for decompression a small number of
    items out of a compressed chunk.  This does not use threads because
-   it would affect negatively to performance. */
-int blosc_getitem(const void *src, int start, int nitems, void *dest)
+   it would affect negatively to performance.  The temporaries are taken
+   from `ctx`. */
+static int getitem_buffer(struct blosc_context *ctx, const void *src,
+                          int start, int nitems, void *dest)
 {
   uint8_t *_src=NULL;               /* current pos for source buffer */
   uint8_t version, versionlz;       /* versions for compressed header */
@@ -812,9 +909,8 @@ int blosc_getitem(const void *src, int start, int nitems, void *dest)
   uint32_t nblocks;                 /* number of total blocks in buffer */
   uint32_t leftover;                /* extra bytes at end of buffer */
   uint32_t *bstarts;                /* start pointers for each block */
-  uint8_t *tmp = params.tmp[0];     /* tmp for thread 0 */
-  uint8_t *tmp2 = params.tmp2[0];   /* tmp2 for thread 0 */
-  int tmp_init = 0;
+  uint8_t *tmp, *tmp2;              /* temporaries in ctx */
+  struct thread_data p;             /* parameters needed by blosc_d */
   uint32_t typesize, blocksize, nbytes, ctbytes;
   uint32_t j, bsize, bsize2, leftoverblock;
   int32_t cbytes, startb, stopb;
@@ -853,15 +949,13 @@ int blosc_getitem(const void *src, int start, int nitems, void *dest)
   }
 
   /* Parameters needed by blosc_d */
-  params.typesize = typesize;
-  params.flags = flags;
+  p.typesize = typesize;
+  p.flags = flags;
 
   /* Initialize temporaries if needed */
-  if (tmp == NULL || tmp2 == NULL || current_temp.blocksize < blocksize) {
-    tmp = my_malloc(blocksize);
-    tmp2 = my_malloc(blocksize);
-    tmp_init = 1;
-  }
+  context_temporaries(ctx, blocksize);
+  tmp = ctx->tmp;
+  tmp2 = ctx->tmp2;
 
   for (j = 0; j < nblocks; j++) {
     bsize = blocksize;
@@ -895,7 +989,7 @@ int blosc_getitem(const void *src, int start, int nitems, void *dest)
     }
     else {
       /* Regular decompression.  Put results in tmp2. */
-      cbytes = blosc_d(bsize, leftoverblock,
+      cbytes = blosc_d(&p, bsize, leftoverblock,
                        (uint8_t *)src+sw32(bstarts[j]), tmp2, tmp, tmp2);
       if (cbytes < 0) {
         ntbytes = cbytes;
@@ -908,12 +1002,46 @@ int blosc_getitem(const void *src, int start, int nitems, void *dest)
     ntbytes += cbytes;
   }
 
-  if (tmp_init) {
-    my_free(tmp);
-    my_free(tmp2);
+  return ntbytes;
+}
+
+
+/* The public routines for getting items.  See blosc.h for docstrings. */
+int blosc_getitem(const void *src, int start, int nitems, void *dest)
+{
+  return getitem_buffer(&getitem_context, src, start, nitems, dest);
+}
+
+
+int blosc_getitem_ctx(struct blosc_context *ctx, const void *src,
+                      int start, int nitems, void *dest)
+{
+  return getitem_buffer(ctx, src, start, nitems, dest);
+}
+
+
+/* Create a context for the re-entrant functions */
+struct blosc_context *blosc_create_context(void)
+{
+  struct blosc_context *ctx;
+
+  ctx = (struct blosc_context *)malloc(sizeof(struct blosc_context));
+  if (ctx == NULL) {
+    printf("Error allocating memory!");
+    exit(1);
   }
+  ctx->tempsize = 0;
+  ctx->tmp = NULL;
+  ctx->tmp2 = NULL;
+  return ctx;
+}
 
-  return ntbytes;
+
+/* Release a context created with blosc_create_context() */
+void blosc_free_context(struct blosc_context *ctx)
+{
+  release_context_temporaries(ctx);
+  free(ctx);
 }
 
 
@@ -1020,7 +1148,7 @@ void *t_blosc(void *tids)
         }
         else {
           /* Regular compression */
-          cbytes = blosc_c(bsize, leftoverblock, 0, ebsize,
+          cbytes = blosc_c(&params, bsize, leftoverblock, 0, ebsize,
                            src+nblock_*blocksize, tmp2, tmp);
         }
       }
@@ -1032,7 +1160,7 @@ void *t_blosc(void *tids)
           cbytes = bsize;
         }
         else {
-          cbytes = blosc_d(bsize, leftoverblock,
+          cbytes = blosc_d(&params, bsize, leftoverblock,
                            src+sw32(bstarts[nblock_]), dest+nblock_*blocksize,
                            tmp, tmp2);
         }
@@ -1200,6 +1328,7 @@ void blosc_free_resources(void)
   if (init_temps_done) {
     release_temporaries();
   }
+  release_context_temporaries(&getitem_context);
 
   /* Finish the possible thread pool */
   if (nthreads > 1 && init_threads_done) {
@@ -111,12 +111,40 @@ int blosc_decompress(const void *src, void *dest, size_t destsize);
   Get `nitems` (of typesize size) in `src` buffer starting in `start`.
   The items are returned in `dest` buffer, which has to have enough
   space for storing all items.  Returns the number of bytes copied to
-  `dest` or a negative value if some error happens.
+  `dest` or a negative value if some error happens.  Its temporaries
+  are kept from call to call, so it is not re-entrant (see
+  blosc_getitem_ctx() below).
  */
 
 int blosc_getitem(const void *src, int start, int nitems, void *dest);
 
 
+/**
+  Re-entrant versions of blosc_compress(), blosc_decompress() and
+  blosc_getitem().  They keep their parameters private to the call and
+  work in the calling thread (ignoring blosc_set_nthreads()), so they
+  can be called concurrently from several threads.  Their temporaries
+  are kept in `ctx`, which is created with blosc_create_context() and
+  can only be used by a thread at a time.
+*/
+
+struct blosc_context;
+
+struct blosc_context *blosc_create_context(void);
+
+void blosc_free_context(struct blosc_context *ctx);
+
+int blosc_compress_ctx(struct blosc_context *ctx, int clevel, int doshuffle,
+                       size_t typesize, size_t nbytes, const void *src,
+                       void *dest, size_t destsize);
+
+int blosc_decompress_ctx(struct blosc_context *ctx, const void *src,
+                         void *dest, size_t destsize);
+
+int blosc_getitem_ctx(struct blosc_context *ctx, const void *src,
+                      int start, int nitems, void *dest);
+
+
 /**
   Initialize a pool of threads for compression/decompression.  If
   `nthreads` is 1, then the serial version is chosen and a possible
@@ -10,3 +10,25 @@ class Simple(Layout):
 
     def change_coordinates(self):
         pass
+
+class Categorical(Layout):
+    """
+    Layout of a dictionary-encoded column.  The elements are integer codes,
+    laid out by the ``codes`` layout, that index into a dictionary of
+    ``categories``.  The storage of such columns in ctables is implemented
+    by ``blaze.carray.categorical``.
+    """
+
+    boundscheck = False
+    wraparound = False
+
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+
+    def desc(self):
+        return 'Categorical(%d categories)' % len(self.categories)
+
+    def change_coordinates(self, indexer):
+        # Coordinates address codes, the dictionary is looked up afterwards
+        return self.codes.change_coordinates(indexer)
@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim :set ft=py:
+
+""" Compression benchmark for choosing Blosc parameters.
+
+Sweeps the compression level, the shuffle filter, the typesize, the
+chunk size and the number of threads over a sample of data, both for
+carray and Bloscpack storage, and measures what every combination buys:
+compression and decompression speed, compression ratio and the latency
+of reading a single random element.  The results can be printed as a
+table or as JSON, and `recommend` picks the best parameters for a goal.
+
+Usage::
+
+    python benchmark.py [options] [FILE]
+
+where FILE holds the sample data (raw, or a '.npy' file).
+
+"""
+
+from __future__ import division
+
+import sys
+import os
+import os.path as path
+import argparse
+import itertools
+import json
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import bloscpack
+from blaze import carray as ca
+
+STORAGES = ['carray', 'bloscpack']
+GOALS = ['balanced', 'ratio', 'speed']
+DEFAULT_CLEVELS = [1, 5, 9]
+DEFAULT_SHUFFLES = [False, True]
+DEFAULT_CHUNK_SIZES = ['64K', '1M']
+DEFAULT_NTHREADS = [1]
+DEFAULT_NREADS = 100
+PARAMS = ['storage', 'clevel', 'shuffle', 'typesize', 'chunk_size',
+          'nthreads']
+MEASURES = ['compress_mbs', 'decompress_mbs', 'ratio', 'read_latency']
+
+def load_sample(in_file, dtype='u1', nbytes=None):
+    """ Read the sample data of a benchmark from a file.
+
+    Parameters
+    ----------
+    in_file : str
+        the name of the file, either a '.npy' file or raw data
+    dtype : NumPy dtype
+        The type of the items in raw files.
+    nbytes : int or str, optional
+        Only the first 'nbytes' of the file (or a pretty size like '64M')
+        are read.
+
+    Returns
+    -------
+    sample : NumPy array
+        the data, as a flat array
+
+    """
+    if isinstance(nbytes, basestring):
+        nbytes = bloscpack.reverse_pretty(nbytes)
+    if in_file.endswith('.npy'):
+        sample = np.load(in_file, mmap_mode='r').reshape(-1)
+        if nbytes is not None:
+            sample = sample[:nbytes // sample.dtype.itemsize]
+        return np.array(sample)
+    dtype = np.dtype(dtype)
+    count = -1 if nbytes is None else nbytes // dtype.itemsize
+    return np.fromfile(in_file, dtype=dtype, count=count)
+
+def _view(sample, typesize):
+    """ Return 'sample' as an array of items of 'typesize' bytes. """
+    if typesize == sample.dtype.itemsize:
+        return sample
+    if typesize not in (1, 2, 4, 8) or sample.nbytes % typesize:
+        return None
+    return sample.view('u%d' % typesize)
+
+def _timed(func, repeat):
+    """ Return the result of 'func()' and the best time of 'repeat' runs. """
+    best = None
+    for _ in xrange(repeat):
+        t0 = time.time()
+        result = func()
+        elapsed = time.time() - t0
+        if best is None or elapsed < best:
+            best = elapsed
+    return result, max(best, 1e-9)
+
+def bench_carray(sample, clevel, shuffle, chunk_size, nthreads,
+                 nreads=DEFAULT_NREADS, repeat=1):
+    """ Measure the storage of 'sample' in a carray.
+
+    The typesize is the itemsize of 'sample', and the chunklen is
+    'chunk_size' in items.  'nthreads' is the number of Blosc threads.
+
+    Returns
+    -------
+    measures : dict
+        the compress and decompress speeds (in MB/s), the compression
+        ratio and the mean latency of reading a random element (in
+        seconds)
+
+    """
+    chunklen = max(chunk_size // sample.dtype.itemsize, 1)
+    old_nthreads = ca.set_nthreads(nthreads)
+    try:
+        def compress():
+            carr = ca.carray(sample, cparams=ca.cparams(clevel, shuffle),
+                             chunklen=chunklen)
+            carr.flush()
+            return carr
+        carr, compress_time = _timed(compress, repeat)
+        _, decompress_time = _timed(lambda: carr[:], repeat)
+        indices = np.random.randint(0, len(sample), nreads)
+        t0 = time.time()
+        for i in indices:
+            carr[i]
+        read_time = time.time() - t0
+    finally:
+        ca.set_nthreads(old_nthreads)
+    return {'compress_mbs': sample.nbytes / compress_time / 2**20,
+            'decompress_mbs': sample.nbytes / decompress_time / 2**20,
+            'ratio': sample.nbytes / max(carr.cbytes, 1),
+            'read_latency': read_time / max(nreads, 1),
+            }
+
+def bench_bloscpack(sample, clevel, shuffle, chunk_size, nthreads,
+                    nreads=DEFAULT_NREADS, repeat=1, tmpdir=None):
+    """ Measure the storage of 'sample' in a Bloscpack file.
+
+    The typesize is the itemsize of 'sample'.  'nthreads' is the number
+    of threads compressing and decompressing chunks.  The file is written
+    in 'tmpdir' (or a new temporary directory), and removed afterwards.
+
+    Returns
+    -------
+    measures : dict
+        the compress and decompress speeds (in MB/s), the compression
+        ratio and the mean latency of reading a random element (in
+        seconds) from a file that is not open yet
+
+    """
+    typesize = sample.dtype.itemsize
+    blosc_args = dict(typesize=typesize, clevel=clevel, shuffle=shuffle)
+    data = sample.tostring()
+    chunks = [data[i:i + chunk_size]
+              for i in xrange(0, len(data), chunk_size)]
+    own_tmpdir = tmpdir is None
+    if own_tmpdir:
+        tmpdir = tempfile.mkdtemp(prefix='benchmark-')
+    out_file = path.join(tmpdir, 'benchmark' + bloscpack.EXTENSION)
+    try:
+        _, compress_time = _timed(
+            lambda: bloscpack.pack_chunks(chunks, {}, out_file, blosc_args,
+                                          nthreads=nthreads), repeat)
+        _, decompress_time = _timed(
+            lambda: bloscpack.unpack_ndarray(out_file, nthreads=nthreads),
+            repeat)
+        indices = np.random.randint(0, len(sample), nreads)
+        t0 = time.time()
+        for i in indices:
+            bloscpack.unpack_range(out_file, i, i + 1)
+        read_time = time.time() - t0
+        file_size = path.getsize(out_file)
+    finally:
+        if own_tmpdir:
+            shutil.rmtree(tmpdir)
+        elif path.exists(out_file):
+            os.remove(out_file)
+    return {'compress_mbs': sample.nbytes / compress_time / 2**20,
+            'decompress_mbs': sample.nbytes / decompress_time / 2**20,
+            'ratio': sample.nbytes / file_size,
+            'read_latency': read_time / max(nreads, 1),
+            }
+
+def sweep(sample, storages=STORAGES, clevels=DEFAULT_CLEVELS,
+          shuffles=DEFAULT_SHUFFLES, typesizes=None,
+          chunk_sizes=DEFAULT_CHUNK_SIZES, nthreads=DEFAULT_NTHREADS,
+          nreads=DEFAULT_NREADS, repeat=1):
+    """ Benchmark all the combinations of the parameters on 'sample'.
+
+    Parameters
+    ----------
+    sample : NumPy array
+        the data to compress
+    storages : list of str
+        the storages to benchmark ('carray' and/or 'bloscpack')
+    clevels : list of int
+        the compression levels
+    shuffles : list of bool
+        whether the shuffle filter is used
+    typesizes : list of int
+        The typesizes, the itemsize of 'sample' by default.  Other
+        typesizes are tried by viewing the data as unsigned integers of
+        that size (1, 2, 4 or 8 bytes).
+    chunk_sizes : list of int or str
+        the chunk sizes in bytes (or pretty sizes like '1M')
+    nthreads : list of int
+        the numbers of threads
+    nreads : int
+        the number of random elements read for measuring the latency
+    repeat : int
+        The number of times compression and decompression are run.  The
+        best time is kept.
+
+    Returns
+    -------
+    results : list of dict
+        A dict for every combination with the parameters (see 'PARAMS')
+        and the measures (see 'MEASURES').
+
+    """
+    sample = np.ascontiguousarray(sample).reshape(-1)
+    if typesizes is None:
+        typesizes = [sample.dtype.itemsize]
+    tmpdir = tempfile.mkdtemp(prefix='benchmark-')
+    results = []
+    try:
+        for (storage, typesize, chunk_size, clevel, shuffle,
+             nthreads_) in itertools.product(
+                 storages, typesizes, chunk_sizes, clevels, shuffles,
+                 nthreads):
+            data = _view(sample, typesize)
+            if data is None:
+                bloscpack.print_verbose("typesize '%d' not supported for "
+                                        "this sample, skipping" % typesize)
+                continue
+            chunk_size = bloscpack._chunk_size_arg(chunk_size)
+            if storage == 'carray':
+                measures = bench_carray(data, clevel, shuffle, chunk_size,
+                                        nthreads_, nreads, repeat)
+            elif storage == 'bloscpack':
+                measures = bench_bloscpack(data, clevel, shuffle, chunk_size,
+                                           nthreads_, nreads, repeat, tmpdir)
+            else:
+                raise ValueError("unknown storage '%s', use one of: %s" %
+                                 (storage, STORAGES))
+            result = dict(zip(PARAMS, (storage, clevel, bool(shuffle),
+                                       typesize, chunk_size, nthreads_)))
+            result.update(measures)
+            bloscpack.print_verbose(format_table([result], header=False))
+            results.append(result)
+    finally:
+        shutil.rmtree(tmpdir)
+    return results
+
+def recommend(results, goal='balanced', storage=None):
+    """ Pick the best parameters out of the 'results' of 'sweep'.
+
+    Parameters
+    ----------
+    results : list of dict
+        the results of 'sweep'
+    goal : str
+        What to optimize: 'ratio' picks the best compression ratio,
+        'speed' the fastest decompression and 'balanced' the best ratio
+        among the results that decompress at least half as fast as the
+        fastest one.
+    storage : str, optional
+        Only the results for this storage are considered.
+
+    Returns
+    -------
+    params : dict
+        The parameters of the best result (see 'PARAMS').  Its 'clevel'
+        and 'shuffle' are the arguments of 'carray.cparams', or the blosc
+        args for Bloscpack (with 'typesize').
+
+    Raises
+    ------
+    ValueError
+        if there are no results to pick from, or 'goal' is not known
+
+    """
+    if storage is not None:
+        results = [r for r in results if r['storage'] == storage]
+    if not results:
+        raise ValueError("no results to recommend parameters from")
+    if goal == 'ratio':
+        best = max(results, key=lambda r: (r['ratio'], r['decompress_mbs']))
+    elif goal == 'speed':
+        best = max(results, key=lambda r: (r['decompress_mbs'], r['ratio']))
+    elif goal == 'balanced':
+        fastest = max(r['decompress_mbs'] for r in results)
+        best = max((r for r in results if r['decompress_mbs'] >= fastest / 2),
+                   key=lambda r: (r['ratio'], r['decompress_mbs']))
+    else:
+        raise ValueError("unknown goal '%s', use one of: %s" % (goal, GOALS))
+    return dict((param, best[param]) for param in PARAMS)
+
+def format_table(results, header=True):
+    """ Return the 'results' of 'sweep' as a table of text. """
+    row = "%-9s %6s %7s %8s %10s %8s %11s %13s %7s %9s"
+    lines = []
+    if header:
+        lines.append(row % ('storage', 'clevel', 'shuffle', 'typesize',
+                            'chunk_size', 'nthreads', 'comp (MB/s)',
+                            'decomp (MB/s)', 'ratio', 'read (us)'))
+    for r in results:
+        chunk_size = bloscpack.pretty_size(r['chunk_size'])
+        lines.append(row % (r['storage'], r['clevel'], r['shuffle'],
+                            r['typesize'], chunk_size,
+                            r['nthreads'], '%.1f' % r['compress_mbs'],
+                            '%.1f' % r['decompress_mbs'],
+                            '%.2f' % r['ratio'],
+                            '%.1f' % (r['read_latency'] * 1e6)))
+    return '\n'.join(lines)
+
+def create_parser():
+    """ Create and return the parser. """
+    def int_list(text):
+        return [int(x) for x in text.split(',')]
+    def str_list(text):
+        return text.split(',')
+    parser = argparse.ArgumentParser(
+            description='benchmark Blosc parameters for carray and '
+                        'Bloscpack storage')
+    parser.add_argument('in_file', nargs='?',
+            help='the sample data (raw or .npy), a synthetic sample of '
+                 'float64 by default')
+    parser.add_argument('--dtype', default='u1',
+            help='the type of the items in raw files (default: u1)')
+    parser.add_argument('--nbytes', default='64M',
+            help='the size of the sample (default: 64M)')
+    parser.add_argument('--storages', type=str_list, default=STORAGES,
+            help='comma separated storages (default: carray,bloscpack)')
+    parser.add_argument('--clevels', type=int_list, default=DEFAULT_CLEVELS,
+            help='comma separated compression levels (default: 1,5,9)')
+    parser.add_argument('--shuffles', type=int_list,
+            default=DEFAULT_SHUFFLES,
+            help='comma separated shuffle flags (default: 0,1)')
+    parser.add_argument('--typesizes', type=int_list, default=None,
+            help='comma separated typesizes (default: the itemsize)')
+    parser.add_argument('--chunk-sizes', type=str_list,
+            default=DEFAULT_CHUNK_SIZES,
+            help='comma separated chunk sizes (default: 64K,1M)')
+    parser.add_argument('--nthreads', type=int_list,
+            default=DEFAULT_NTHREADS,
+            help='comma separated numbers of threads (default: 1)')
+    parser.add_argument('--nreads', type=int, default=DEFAULT_NREADS,
+            help='the number of random reads (default: %d)' % DEFAULT_NREADS)
+    parser.add_argument('--repeat', type=int, default=1,
+            help='the number of runs to keep the best time of (default: 1)')
+    parser.add_argument('--goal', choices=GOALS, default='balanced',
+            help='what the recommended parameters optimize '
+                 '(default: balanced)')
+    parser.add_argument('--json', action='store_true', default=False,
+            help='print the results and recommendations as JSON')
+    return parser
+
+if __name__ == '__main__':
+    args = create_parser().parse_args()
+    if args.in_file is None:
+        n = bloscpack.reverse_pretty(args.nbytes) // 8
+        sample = np.linspace(0, 100, n) + np.random.normal(0, 0.01, n)
+    else:
+        sample = load_sample(args.in_file, args.dtype, args.nbytes)
+    results = sweep(sample, args.storages, args.clevels, args.shuffles,
+                    args.typesizes, args.chunk_sizes, args.nthreads,
+                    args.nreads, args.repeat)
+    recommendations = dict((storage, recommend(results, args.goal, storage))
+                           for storage in args.storages)
+    if args.json:
+        json.dump({'results': results, 'recommendations': recommendations},
+                  sys.stdout, indent=2)
+        print('')
+    else:
+        print(format_table(results))
+        for storage, params in recommendations.iteritems():
+            print("recommended for %s (%s): %s" % (storage, args.goal,
+                  ', '.join('%s=%s' % (p, params[p]) for p in PARAMS[1:])))
@@ -16,14 +16,18 @@ production purposes yet.
 from __future__ import division
 
 import sys
+import os
 import os.path as path
+import stat
 import struct
 import argparse
 import math
+import mmap
 import zlib
 import hashlib
 import itertools
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from multiprocessing.pool import ThreadPool
 import blosc
 import numpy as np
 import json
@@ -447,7 +451,8 @@ def create_bloscpack_header(format_version=FORMAT_VERSION,
         typesize=0,
         chunk_size=-1,
         last_chunk=-1,
-        nchunks=-1):
+        nchunks=-1,
+        max_app_chunks=0):
     """ Create the bloscpack header string.
 
     Parameters
@@ -466,6 +471,9 @@ def create_bloscpack_header(format_version=FORMAT_VERSION,
         the size of the last chunk
     nchunks : int
         the number of chunks
+    max_app_chunks : int
+        the number of free entries for appended chunks at the end of the
+        offsets table
 
     Returns
     -------
@@ -493,6 +501,7 @@ def create_bloscpack_header(format_version=FORMAT_VERSION,
     check_range('chunk_size', chunk_size, -1, blosc.BLOSC_MAX_BUFFERSIZE)
     check_range('last_chunk', last_chunk, -1, blosc.BLOSC_MAX_BUFFERSIZE)
     check_range('nchunks',    nchunks,    -1, MAX_CHUNKS)
+    check_range('max_app_chunks', max_app_chunks, 0, MAX_CHUNKS)
 
     format_version = encode_uint8(format_version)
     options = encode_uint8(int(options, 2))
@@ -501,12 +510,12 @@ def create_bloscpack_header(format_version=FORMAT_VERSION,
     chunk_size = encode_int32(chunk_size)
     last_chunk = encode_int32(last_chunk)
     nchunks = encode_int64(nchunks)
-    RESERVED = encode_int64(0)
+    max_app_chunks = encode_int64(max_app_chunks)
 
     return (MAGIC + format_version + options + checksum + typesize +
             chunk_size + last_chunk +
             nchunks +
-            RESERVED)
+            max_app_chunks)
 
 def decode_bloscpack_header(buffer_):
     """ Check that the magic marker exists and return number of chunks.
@@ -532,8 +541,9 @@ def decode_bloscpack_header(buffer_):
         the size of the last chunk
     nchunks : int
         the number of chunks
-    RESERVED : int
-        the RESERVED field from the header, should be zero
+    max_app_chunks : int
+        the number of free entries for appended chunks at the end of the
+        offsets table
 
     """
     if len(buffer_) != 32:
@@ -552,7 +562,7 @@ def decode_bloscpack_header(buffer_):
             'chunk_size':     decode_int32(buffer_[8:12]),
             'last_chunk':     decode_int32(buffer_[12:16]),
             'nchunks':        decode_int64(buffer_[16:24]),
-            'RESERVED':       decode_int64(buffer_[24:32]),
+            'max_app_chunks': decode_int64(buffer_[24:32]),
             }
 
 def process_compression_args(args):
@@ -636,86 +646,193 @@ def process_nthread_arg(args):
     print_verbose('using %d thread%s' %
             (args.nthreads, 's' if args.nthreads > 1 else ''))
 
-def pack_list(in_list, meta_info, out_file, blosc_args,
-              offsets=DEFAULT_OFFSETS, checksum=DEFAULT_CHECKSUM):
-    """ Main function for compressing a list of buffers.
+def _chunk_size_arg(chunk_size):
+    """ Return `chunk_size` in bytes, reversing pretty sizes like '1M'. """
+    if isinstance(chunk_size, basestring):
+        chunk_size = reverse_pretty(chunk_size)
+    check_range('chunk_size', chunk_size, 1, blosc.BLOSC_MAX_BUFFERSIZE)
+    return chunk_size
+
+def _compress_chunk(chunk, blosc_args, checksum_impl):
+    """ Compress a chunk and compute the checksum of the compressed data.
+
+    Returns
+    -------
+    compressed, digest : str
+        the compressed chunk and its digest ('' if there is no checksum)
+    """
+    compressed = blosc.compress(chunk, **blosc_args)
+    return compressed, checksum_impl(compressed)
+
+def _check_digest(compressed, expected_digest, checksum_impl, i):
+    """ Verify the digest of the compressed chunk 'i'. """
+    if checksum_impl.size == 0:
+        return
+    received_digest = checksum_impl(compressed)
+    if received_digest != expected_digest:
+        raise ChecksumMismatch(
+                "Checksum mismatch detected in chunk '%d' " % i +
+                "expected: '%s', received: '%s'" %
+                (repr(expected_digest), repr(received_digest)))
+    print_verbose('checksum OK (%s): %s ' %
+            (checksum_impl.name, repr(received_digest)),
+            level=DEBUG)
+
+def _ordered_imap(func, iterable, nthreads):
+    """ Like 'itertools.imap(func, iterable)', computed by 'nthreads' threads.
+
+    The results come in the order of 'iterable'.  At most '2 * nthreads'
+    items are in flight, so 'iterable' is only consumed as the results
+    are, and memory stays bounded.
+    """
+    if nthreads <= 1:
+        return itertools.imap(func, iterable)
+    return _threaded_imap(func, iterable, nthreads)
+
+# the thread pools, by number of threads
+_thread_pools = {}
+
+def _thread_pool(nthreads):
+    """ Return the (shared) pool of 'nthreads' threads.
+
+    Pools are kept for reuse, since shutting a pool down waits for its
+    handler thread, which takes up to 0.1 seconds.
+    """
+    if nthreads not in _thread_pools:
+        _thread_pools[nthreads] = ThreadPool(nthreads)
+    return _thread_pools[nthreads]
+
+def _threaded_imap(func, iterable, nthreads):
+    pool = _thread_pool(nthreads)
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= 2 * nthreads:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def pack_chunks(chunks, meta_info, out_file, blosc_args, nchunks=None,
+                offsets=DEFAULT_OFFSETS, checksum=DEFAULT_CHECKSUM,
+                nthreads=1, reserve_factor=0):
+    """ Main function for compressing an iterable of buffers.
+
+    The buffers are compressed and written as they come, so only one of
+    them has to be in memory at a time.  The header is written once all
+    of them have been seen, so the sizes of the chunks need not be known
+    in advance.
 
     Parameters
     ----------
-    in_list : list
-        the list of buffers
+    chunks : iterable
+        the buffers (strings), all of them of the same size except the last
     meta_info : dict
         dictionary with the associated metainfo
     out_file : str
         the name of the output file
     blosc_args : dict
         dictionary of blosc keyword args
+    nchunks : int
+        The number of buffers.  It is needed for writing offsets if
+        `chunks` has no length.
     offsets : bool
         Wheather to include offsets.
     checksum : str
         Which checksum to use.
+    nthreads : int
+        The number of threads compressing (and checksumming) chunks
+        concurrently.  Chunks are still written in order.
+    reserve_factor : float
+        The free entries left in the offsets table for appending chunks
+        later (see 'append_to'), as a fraction of the number of chunks.
+
+    Raises
+    ------
+    ChunkingException
+        if the buffers are not of the same size, or if their number is not
+        `nchunks`
 
     """
-    # XXX Check for empty lists
-    # calculate chunk sizes
-    nchunks = len(in_list)
-    chunk_size = len(in_list[0])
-    last_chunk_size = len(in_list[-1])
-    in_list_size = nchunks * chunk_size + last_chunk_size
-    print_verbose('input file size: %s' % double_pretty_size(in_list_size))
-    # calculate header
+    if nchunks is None and hasattr(chunks, '__len__'):
+        nchunks = len(chunks)
+    if offsets and nchunks is None:
+        raise ValueError("'nchunks' is needed for writing the offsets of "
+                         "chunks from an iterator")
+    if reserve_factor < 0:
+        raise ValueError("'reserve_factor' can not be negative")
     options = create_options(offsets=offsets)
+    max_app_chunks = 0
     if offsets:
-        offsets_storage = list(itertools.repeat(0, nchunks))
+        max_app_chunks = int(math.ceil(nchunks * reserve_factor))
     # set the checksum impl
     checksum_impl = CHECKSUMS_LOOKUP[checksum]
-    raw_bloscpack_header = create_bloscpack_header(
-        options=options,
-        checksum=CHECKSUMS_AVAIL.index(checksum),
-        typesize=blosc_args['typesize'],
-        chunk_size=chunk_size,
-        last_chunk=last_chunk_size,
-        nchunks=nchunks
-        )
-    print_verbose('raw_bloscpack_header: %s' % repr(raw_bloscpack_header),
-                  level=DEBUG)
-    # write the chunks to the file
+    chunk_size = last_chunk_size = 0
+    in_size = out_size = 0
+    offsets_storage = []
     with open(out_file, 'wb') as output_fp:
-        output_fp.write(raw_bloscpack_header)
-        # preallocate space for the offsets
+        # the header is written at the end, when all sizes are known
+        output_fp.write('\0' * BLOSCPACK_HEADER_LENGTH)
+        # preallocate space for the offsets (and the appended ones)
         if offsets:
-            output_fp.write(encode_int64(-1) * nchunks)
-        # if nchunks == 1 the last_chunk_size is the size of the single chunk
-        for i in xrange(nchunks):
+            output_fp.write(encode_int64(-1) * (nchunks + max_app_chunks))
+        def compress(chunk):
+            compressed, digest = _compress_chunk(chunk, blosc_args,
+                                                 checksum_impl)
+            return len(chunk), compressed, digest
+        for i, (current_size, compressed, digest) in enumerate(
+                _ordered_imap(compress, chunks, nthreads)):
+            if i > 0 and last_chunk_size != chunk_size:
+                raise ChunkingException(
+                    "only the last chunk can be smaller than the others, "
+                    "but chunk '%d' has '%d' bytes, not '%d'" %
+                    (i - 1, last_chunk_size, chunk_size))
+            if offsets and i == nchunks:
+                raise ChunkingException(
+                    "more than the expected '%d' chunks" % nchunks)
             # store the current position in the file
-            if offsets:
-                offsets_storage[i] = output_fp.tell()
-            current_chunk = in_list[i]
-            # do compression
-            compressed = blosc.compress(current_chunk, **blosc_args)
-            # write compressed data
+            offsets_storage.append(output_fp.tell())
+            # write compressed data and digest
             output_fp.write(compressed)
-            print_verbose("chunk '%d'%s written, in: %s out: %s ratio: %s" %
-                    (i, ' (last)' if i == nchunks - 1 else '',
-                    double_pretty_size(len(current_chunk)),
+            output_fp.write(digest)
+            if i == 0:
+                chunk_size = current_size
+            last_chunk_size = current_size
+            in_size += current_size
+            out_size += len(compressed) + len(digest)
+            print_verbose("chunk '%d' written, in: %s out: %s ratio: %s" %
+                    (i, double_pretty_size(current_size),
                     double_pretty_size(len(compressed)),
-                    "%0.3f" % (len(compressed) / len(current_chunk))
-                    if len(current_chunk) != 0 else "N/A"),
+                    "%0.3f" % (len(compressed) / current_size)
+                    if current_size != 0 else "N/A"),
                     level=DEBUG)
             tail_mess = ""
             if checksum_impl.size > 0:
-                # compute the checksum on the compressed data
-                digest = checksum_impl(compressed)
-                # write digest
-                output_fp.write(digest)
                 tail_mess += ('checksum (%s): %s ' % (checksum, repr(digest)))
             if offsets:
                 tail_mess += ("offset: '%d'" % offsets_storage[i])
             if len(tail_mess) > 0:
                 print_verbose(tail_mess, level=DEBUG)
+        if nchunks is not None and len(offsets_storage) != nchunks:
+            raise ChunkingException(
+                "expected '%d' chunks, but got '%d'" %
+                (nchunks, len(offsets_storage)))
+        nchunks = len(offsets_storage)
+        print_verbose('input size: %s' % double_pretty_size(in_size))
+        # calculate header
+        raw_bloscpack_header = create_bloscpack_header(
+            options=options,
+            checksum=CHECKSUMS_AVAIL.index(checksum),
+            typesize=blosc_args['typesize'],
+            chunk_size=chunk_size,
+            last_chunk=last_chunk_size,
+            nchunks=nchunks,
+            max_app_chunks=max_app_chunks
+            )
+        print_verbose('raw_bloscpack_header: %s' % repr(raw_bloscpack_header),
+                      level=DEBUG)
+        output_fp.seek(0, 0)
+        output_fp.write(raw_bloscpack_header)
         if offsets:
-            # seek to 32 bits into the file
-            output_fp.seek(BLOSCPACK_HEADER_LENGTH, 0)
             print_verbose("Writing '%d' offsets: '%s'" %
                     (len(offsets_storage), repr(offsets_storage)), level=DEBUG)
             # write the offsets encoded into the reserved space in the file
@@ -728,15 +845,108 @@ def pack_list(in_list, meta_info, out_file, blosc_args,
         json.dump(meta_info, output_fp)
     out_file_size = path.getsize(out_file)
     print_verbose('output file size: %s' % double_pretty_size(out_file_size))
-    print_verbose('compression ratio: %f' % (out_file_size/in_list_size))
+    if in_size:
+        print_verbose('compression ratio: %f' % (out_file_size/in_size))
+
+def pack_list(in_list, meta_info, out_file, blosc_args,
+              offsets=DEFAULT_OFFSETS, checksum=DEFAULT_CHECKSUM, nthreads=1,
+              reserve_factor=0):
+    """ Main function for compressing a list of buffers.
+
+    Parameters
+    ----------
+    in_list : list
+        the list of buffers
+    meta_info : dict
+        dictionary with the associated metainfo
+    out_file : str
+        the name of the output file
+    blosc_args : dict
+        dictionary of blosc keyword args
+    offsets : bool
+        Wheather to include offsets.
+    checksum : str
+        Which checksum to use.
+    nthreads : int
+        The number of threads compressing chunks concurrently.
+    reserve_factor : float
+        The free entries left in the offsets table for appending chunks,
+        as a fraction of the number of chunks.
+
+    """
+    pack_chunks(in_list, meta_info, out_file, blosc_args,
+                nchunks=len(in_list), offsets=offsets, checksum=checksum,
+                nthreads=nthreads, reserve_factor=reserve_factor)
+
+def pack_file(in_file, meta_info, out_file, blosc_args,
+              chunk_size=DEFAULT_CHUNK_SIZE, offsets=DEFAULT_OFFSETS,
+              checksum=DEFAULT_CHECKSUM, nthreads=1, reserve_factor=0):
+    """ Main function for compressing a file in chunks.
+
+    The file is read and compressed one chunk at a time, so the memory
+    needed does not depend on its size.
+
+    Parameters
+    ----------
+    in_file : str or file object
+        the name of the input file, or a file object opened for reading
+        (it is read from its current position up to its end)
+    meta_info : dict
+        dictionary with the associated metainfo
+    out_file : str
+        the name of the output file
+    blosc_args : dict
+        dictionary of blosc keyword args
+    chunk_size : int or str
+        The size of the chunks in bytes, or a pretty size like '1M'.
+    offsets : bool
+        Wheather to include offsets.
+    checksum : str
+        Which checksum to use.
+    nthreads : int
+        The number of threads compressing chunks concurrently.
+    reserve_factor : float
+        The free entries left in the offsets table for appending chunks,
+        as a fraction of the number of chunks.
 
-def unpack_file(in_file):
+    """
+    chunk_size = _chunk_size_arg(chunk_size)
+    if isinstance(in_file, basestring):
+        with open(in_file, 'rb') as input_fp:
+            return pack_file(input_fp, meta_info, out_file, blosc_args,
+                             chunk_size, offsets, checksum, nthreads,
+                             reserve_factor)
+    try:
+        in_stat = os.fstat(in_file.fileno())
+    except (AttributeError, IOError, OSError):
+        in_stat = None
+    if in_stat is not None and stat.S_ISREG(in_stat.st_mode):
+        nchunks = -(-(in_stat.st_size - in_file.tell()) // chunk_size)
+    elif offsets:
+        raise ValueError("offsets can only be written when packing regular "
+                         "files, not '%s'" % in_file)
+    else:
+        nchunks = None
+    def read_chunks():
+        while True:
+            chunk = in_file.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    pack_chunks(read_chunks(), meta_info, out_file, blosc_args,
+                nchunks=nchunks, offsets=offsets, checksum=checksum,
+                nthreads=nthreads, reserve_factor=reserve_factor)
+
+def unpack_file(in_file, nthreads=1):
     """ Main function for decompressing a file.  Returns a list of buffers.
 
     Parameters
     ----------
     in_file : str
         the name of the input file
+    nthreads : int
+        The number of threads checksumming and decompressing chunks
+        concurrently.  Chunks are still read in order.
     """
     out_list = []
     in_file_size = path.getsize(in_file)
@@ -765,36 +975,22 @@ def unpack_file(in_file):
             offset_storage = [decode_int64(offsets_raw[j-8:j]) for j in
                     xrange(8, nchunks*8+1, 8)]
             print_verbose('Offsets: %s' % offset_storage, level=DEBUG)
-        # decompress
-        for i in range(nchunks):
-            print_verbose("decompressing chunk '%d'%s" %
-                    (i, ' (last)' if i == nchunks-1 else ''), level=DEBUG)
-            # read blosc header
-            blosc_header_raw = input_fp.read(BLOSC_HEADER_LENGTH)
-            blosc_header = decode_blosc_header(blosc_header_raw)
-            print_verbose('blosc_header: %s' % repr(blosc_header), level=DEBUG)
-            ctbytes = blosc_header['ctbytes']
-            # Seek back BLOSC_HEADER_LENGTH bytes in file relative to current
-            # position. Blosc needs the header too and presumably this is
-            # better than to read the whole buffer and then concatenate it...
-            input_fp.seek(-BLOSC_HEADER_LENGTH, 1)
-            # read chunk
-            compressed = input_fp.read(ctbytes)
-            if checksum_impl.size > 0:
-                # do checksum
-                expected_digest = input_fp.read(checksum_impl.size)
-                received_digest = checksum_impl(compressed)
-                if received_digest != expected_digest:
-                    raise ChecksumMismatch(
-                            "Checksum mismatch detected in chunk '%d' " % i +
-                            "expected: '%s', received: '%s'" %
-                            (repr(expected_digest), repr(received_digest)))
-                else:
-                    print_verbose('checksum OK (%s): %s ' %
-                            (checksum_impl.name, repr(received_digest)),
-                            level=DEBUG)
+            # skip the free entries for appended chunks
+            input_fp.seek(8 * max_app_chunks, 1)
+        # read the chunks, and decompress them (maybe in other threads)
+        def read_chunks():
+            for i in xrange(nchunks):
+                print_verbose("reading chunk '%d'%s" %
+                        (i, ' (last)' if i == nchunks-1 else ''),
+                        level=DEBUG)
+                yield i, _read_compressed(input_fp, checksum_impl)
+        def decompress(item):
+            i, (compressed, expected_digest, nbytes) = item
+            _check_digest(compressed, expected_digest, checksum_impl, i)
             # if checksum OK, decompress buffer
-            decompressed = blosc.decompress(compressed)
+            return compressed, blosc.decompress(compressed)
+        for compressed, decompressed in _ordered_imap(
+                decompress, read_chunks(), nthreads):
             # write decompressed chunk
             out_list.append(decompressed)
             print_verbose("chunk append, in: %s out: %s" %
@@ -807,6 +1003,443 @@ def unpack_file(in_file):
     print_verbose('decompression ratio: %f' % (out_list_size/in_file_size))
     return out_list, meta_info
 
+def _read_header_and_offsets(input_fp):
+    """ Read the bloscpack header and the offsets table of a file.
+
+    Returns
+    -------
+    bloscpack_header : dict
+        the decoded header (see 'decode_bloscpack_header')
+    offsets : list of int
+        the offsets of the chunks
+
+    Raises
+    ------
+    ValueError
+        if the file has no offsets table
+    """
+    input_fp.seek(0, 0)
+    bloscpack_header = decode_bloscpack_header(
+        input_fp.read(BLOSCPACK_HEADER_LENGTH))
+    if FORMAT_VERSION != bloscpack_header['format_version']:
+        raise ValueError(
+            "format version of file was not '%s' as expected, but '%d'" %
+            (FORMAT_VERSION, bloscpack_header['format_version']))
+    if not decode_options(bloscpack_header['options'])['offsets']:
+        raise ValueError("random access needs a file with offsets")
+    nchunks = bloscpack_header['nchunks']
+    offsets_raw = input_fp.read(8 * nchunks)
+    offsets = [decode_int64(offsets_raw[j:j+8])
+               for j in xrange(0, 8 * nchunks, 8)]
+    return bloscpack_header, offsets
+
+def _chunk_nbytes(bloscpack_header, i):
+    """ The size of the chunk 'i' once decompressed. """
+    if i == bloscpack_header['nchunks'] - 1:
+        return bloscpack_header['last_chunk']
+    return bloscpack_header['chunk_size']
+
+def _read_compressed(input_fp, checksum_impl):
+    """ Read the compressed chunk at the current position of 'input_fp'.
+
+    Returns
+    -------
+    compressed : str
+        the compressed chunk, including its blosc header
+    expected_digest : str
+        the digest stored after the chunk
+    nbytes : int
+        the size of the chunk once decompressed
+    """
+    blosc_header_raw = input_fp.read(BLOSC_HEADER_LENGTH)
+    blosc_header = decode_blosc_header(blosc_header_raw)
+    print_verbose('blosc_header: %s' % repr(blosc_header), level=DEBUG)
+    # Seek back BLOSC_HEADER_LENGTH bytes in file relative to current
+    # position. Blosc needs the header too and presumably this is
+    # better than to read the whole buffer and then concatenate it...
+    input_fp.seek(-BLOSC_HEADER_LENGTH, 1)
+    compressed = input_fp.read(blosc_header['ctbytes'])
+    expected_digest = input_fp.read(checksum_impl.size)
+    return compressed, expected_digest, blosc_header['nbytes']
+
+def _decompress_into(compressed, nbytes, out):
+    """ Decompress a chunk of 'nbytes' into the 'out' uint8 array. """
+    if len(out) != nbytes or not out.flags.c_contiguous:
+        raise ValueError("the output buffer must be contiguous and have "
+                         "'%d' bytes, not '%d'" % (nbytes, len(out)))
+    blosc.decompress_ptr(compressed, out.__array_interface__['data'][0])
+
+def _output_buffer(out, nbytes):
+    """ Return 'out' (or a new array) as a uint8 array of 'nbytes'. """
+    if out is None:
+        return np.empty(nbytes, dtype=np.uint8)
+    out = np.asarray(out)
+    if not out.flags.c_contiguous or not out.flags.writeable:
+        raise ValueError("the output buffer must be contiguous and writable")
+    out = out.reshape(-1).view(np.uint8)
+    if len(out) != nbytes:
+        raise ValueError("the output buffer must have '%d' bytes, not '%d'"
+                         % (nbytes, len(out)))
+    return out
+
+def _open_input(in_file):
+    """ Return a file object for reading 'in_file' and whether to close it. """
+    if isinstance(in_file, basestring):
+        return open(in_file, 'rb'), True
+    return in_file, False
+
+def unpack_chunk(in_file, i, out=None):
+    """ Decompress a single chunk of a file.
+
+    The chunk is located via the offsets table, so no other chunk is read.
+
+    Parameters
+    ----------
+    in_file : str or file object
+        the name of the input file, or a file object opened for reading
+    i : int
+        the index of the chunk (negative values count from the end)
+    out : NumPy array or writable buffer, optional
+        Where the chunk is decompressed.  It must be contiguous and have
+        the size of the decompressed chunk.
+
+    Returns
+    -------
+    out : NumPy array
+        the decompressed chunk, as a view of 'out' with uint8 items (or a
+        new array if 'out' was not given)
+
+    """
+    input_fp, close = _open_input(in_file)
+    try:
+        bloscpack_header, offsets = _read_header_and_offsets(input_fp)
+        nchunks = bloscpack_header['nchunks']
+        if i < 0:
+            i += nchunks
+        if not 0 <= i < nchunks:
+            raise IndexError("chunk '%d' out of range" % i)
+        out = _output_buffer(out, _chunk_nbytes(bloscpack_header, i))
+        checksum_impl = CHECKSUMS[bloscpack_header['checksum']]
+        input_fp.seek(offsets[i], 0)
+        compressed, expected_digest, nbytes = _read_compressed(
+            input_fp, checksum_impl)
+        _check_digest(compressed, expected_digest, checksum_impl, i)
+        _decompress_into(compressed, nbytes, out)
+    finally:
+        if close:
+            input_fp.close()
+    return out
+
+def unpack_range(in_file, start_elem, stop_elem, out=None, nthreads=1):
+    """ Decompress a range of elements of a file.
+
+    Only the chunks overlapping with the range are read (via the offsets
+    table), checksummed and decompressed.  Whole chunks are decompressed
+    straight into 'out'.
+
+    Parameters
+    ----------
+    in_file : str or file object
+        the name of the input file, or a file object opened for reading
+    start_elem, stop_elem : int
+        the range of elements, whose size is the typesize of the file
+    out : NumPy array or writable buffer, optional
+        Where the elements are decompressed.  It must be contiguous and
+        have the size of the elements in the range.
+    nthreads : int
+        The number of threads checksumming and decompressing chunks
+        concurrently.
+
+    Returns
+    -------
+    out : NumPy array
+        the elements, as a view of 'out' with uint8 items (or a new array
+        if 'out' was not given)
+
+    """
+    input_fp, close = _open_input(in_file)
+    try:
+        bloscpack_header, offsets = _read_header_and_offsets(input_fp)
+        typesize = max(bloscpack_header['typesize'], 1)
+        nchunks = bloscpack_header['nchunks']
+        chunk_size = bloscpack_header['chunk_size']
+        total = 0
+        if nchunks > 0:
+            total = (nchunks - 1) * chunk_size + bloscpack_header['last_chunk']
+        start, stop = (min(max(elem * typesize, 0), total)
+                       for elem in (start_elem, stop_elem))
+        stop = max(start, stop)
+        out = _output_buffer(out, stop - start)
+        checksum_impl = CHECKSUMS[bloscpack_header['checksum']]
+        if start == stop:
+            return out
+        def read_chunks():
+            for i in xrange(start // chunk_size, (stop - 1) // chunk_size + 1):
+                input_fp.seek(offsets[i], 0)
+                yield i, _read_compressed(input_fp, checksum_impl)
+        def decompress(item):
+            i, (compressed, expected_digest, nbytes) = item
+            _check_digest(compressed, expected_digest, checksum_impl, i)
+            # the part of the range in chunk 'i'
+            cstart = i * chunk_size
+            cstop = cstart + _chunk_nbytes(bloscpack_header, i)
+            lo, hi = max(start, cstart), min(stop, cstop)
+            if lo == cstart and hi == cstop:
+                _decompress_into(compressed, nbytes,
+                                 out[lo - start:hi - start])
+            else:
+                chunk = np.empty(nbytes, dtype=np.uint8)
+                _decompress_into(compressed, nbytes, chunk)
+                out[lo - start:hi - start] = chunk[lo - cstart:hi - cstart]
+        for _ in _ordered_imap(decompress, read_chunks(), nthreads):
+            pass
+    finally:
+        if close:
+            input_fp.close()
+    return out
+
+def _skip_chunks(input_fp, nchunks, checksum_impl):
+    """ Seek past 'nchunks' chunks, reading their blosc headers only. """
+    for i in xrange(nchunks):
+        blosc_header = decode_blosc_header(input_fp.read(BLOSC_HEADER_LENGTH))
+        input_fp.seek(blosc_header['ctbytes'] - BLOSC_HEADER_LENGTH +
+                      checksum_impl.size, 1)
+
+def unpack_ndarray(in_file, out=None, mmap_input=False, nthreads=1):
+    """ Decompress a file into a single NumPy array.
+
+    The array is allocated once (or passed in), and every chunk is
+    decompressed straight into its slice, so the data is not copied
+    after decompression.
+
+    Parameters
+    ----------
+    in_file : str
+        the name of the input file
+    out : NumPy array, optional
+        Where the data is decompressed.  It must be contiguous and have
+        the size of the decompressed data.  If not given, an array is
+        allocated with the 'dtype' and 'shape' in the metadata of the file
+        (if any), or else as a flat array of bytes.
+    mmap_input : bool
+        Whether the input file is memory-mapped instead of read.
+    nthreads : int
+        The number of threads checksumming and decompressing chunks
+        concurrently.
+
+    Returns
+    -------
+    out : NumPy array
+        the decompressed data
+    meta_info : dict
+        the metadata of the file
+
+    """
+    with open(in_file, 'rb') as input_fp:
+        if mmap_input:
+            input_fp = mmap.mmap(input_fp.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        try:
+            bloscpack_header = decode_bloscpack_header(
+                input_fp.read(BLOSCPACK_HEADER_LENGTH))
+            if FORMAT_VERSION != bloscpack_header['format_version']:
+                raise ValueError(
+                    "format version of file was not '%s' as expected, "
+                    "but '%d'" % (FORMAT_VERSION,
+                                  bloscpack_header['format_version']))
+            nchunks = bloscpack_header['nchunks']
+            chunk_size = bloscpack_header['chunk_size']
+            checksum_impl = CHECKSUMS[bloscpack_header['checksum']]
+            if decode_options(bloscpack_header['options'])['offsets']:
+                input_fp.seek(
+                    8 * (nchunks + bloscpack_header['max_app_chunks']), 1)
+            data_start = input_fp.tell()
+            # the metadata is after the chunks
+            _skip_chunks(input_fp, nchunks, checksum_impl)
+            meta_info = json.loads(input_fp.read(
+                path.getsize(in_file) - input_fp.tell()))
+            total = 0
+            if nchunks > 0:
+                total = ((nchunks - 1) * chunk_size +
+                         bloscpack_header['last_chunk'])
+            if out is None:
+                dtype = np.dtype(str(meta_info.get('dtype', 'u1')))
+                shape = meta_info.get('shape')
+                if shape is None or np.prod(shape) * dtype.itemsize != total:
+                    shape = (total // dtype.itemsize,)
+                out = np.empty(shape, dtype=dtype)
+            flat = _output_buffer(out, total)
+
+            input_fp.seek(data_start, 0)
+            def read_chunks():
+                for i in xrange(nchunks):
+                    yield i, _read_compressed(input_fp, checksum_impl)
+            def decompress(item):
+                i, (compressed, expected_digest, nbytes) = item
+                _check_digest(compressed, expected_digest, checksum_impl, i)
+                _decompress_into(compressed, nbytes,
+                                 flat[i * chunk_size:i * chunk_size + nbytes])
+            for _ in _ordered_imap(decompress, read_chunks(), nthreads):
+                pass
+        finally:
+            if mmap_input:
+                input_fp.close()
+    return out, meta_info
+
+def _rechunk(buffers, chunk_size, head=''):
+    """ Iterate over 'head' and 'buffers' cut into chunks of 'chunk_size'.
+
+    All the chunks have 'chunk_size' bytes except the last one.
+    """
+    pending, size = ([head], len(head)) if head else ([], 0)
+    for buffer_ in buffers:
+        pending.append(buffer_)
+        size += len(buffer_)
+        if size < chunk_size:
+            continue
+        data = ''.join(pending)
+        full = len(data) - len(data) % chunk_size
+        for i in xrange(0, full, chunk_size):
+            yield data[i:i + chunk_size]
+        rest = data[full:]
+        pending, size = ([rest], len(rest)) if rest else ([], 0)
+    if size:
+        yield ''.join(pending)
+
+def append_to(in_file, buffers, meta_info=None, blosc_args=None, nthreads=1):
+    """ Append data to an existing file.
+
+    The data is compressed into new chunks, written where the metadata
+    was, and followed by the metadata again.  Only the header, the new
+    offsets and the last chunk (if it was not full) are rewritten, so the
+    cost is proportional to the appended data, not to the whole file.
+    Files with offsets need free entries in the offsets table for the
+    new chunks (see the 'reserve_factor' argument of 'pack_chunks').
+
+    Parameters
+    ----------
+    in_file : str
+        the name of the file
+    buffers : iterable
+        the buffers (strings) to append.  They can have any size: their
+        data is cut into chunks of the chunk size of the file.
+    meta_info : dict, optional
+        The new metadata of the file.  By default, the old metadata is
+        kept.
+    blosc_args : dict, optional
+        Dictionary of blosc keyword args for the new chunks.  By default,
+        the typesize of the file with the default compression level and
+        shuffle.
+    nthreads : int
+        The number of threads compressing chunks concurrently.
+
+    Returns
+    -------
+    nchunks : int
+        the number of chunks written (including the last chunk of the
+        file, if it had to be rewritten)
+
+    Raises
+    ------
+    ChunkingException
+        if there are not enough free entries in the offsets table.  The
+        file is left as it was.
+    ValueError
+        if the file has no chunks, so its chunk size is not known
+
+    """
+    with open(in_file, 'r+b') as fp:
+        bloscpack_header = decode_bloscpack_header(
+            fp.read(BLOSCPACK_HEADER_LENGTH))
+        if FORMAT_VERSION != bloscpack_header['format_version']:
+            raise ValueError(
+                "format version of file was not '%s' as expected, but '%d'" %
+                (FORMAT_VERSION, bloscpack_header['format_version']))
+        nchunks = bloscpack_header['nchunks']
+        chunk_size = bloscpack_header['chunk_size']
+        max_app_chunks = bloscpack_header['max_app_chunks']
+        if nchunks <= 0:
+            raise ValueError("can only append to files with chunks")
+        has_offsets = decode_options(bloscpack_header['options'])['offsets']
+        checksum_impl = CHECKSUMS[bloscpack_header['checksum']]
+        # locate the last chunk, and the metadata after it
+        if has_offsets:
+            fp.seek(BLOSCPACK_HEADER_LENGTH + 8 * (nchunks - 1), 0)
+            fp.seek(decode_int64(fp.read(8)), 0)
+        else:
+            _skip_chunks(fp, nchunks - 1, checksum_impl)
+        last_offset = fp.tell()
+        old_tail = fp.read()
+        fp.seek(last_offset, 0)
+        _skip_chunks(fp, 1, checksum_impl)
+        meta_start = fp.tell()
+        if meta_info is None:
+            meta_info = json.loads(old_tail[meta_start - last_offset:])
+        if blosc_args is None:
+            blosc_args = dict(DEFAULT_BLOSC_ARGS,
+                              typesize=bloscpack_header['typesize'])
+        # a partial last chunk is rewritten with the head of the new data
+        rewrite_last = bloscpack_header['last_chunk'] < chunk_size
+        first, head = nchunks, ''
+        if rewrite_last:
+            first = nchunks - 1
+            ctbytes = decode_blosc_header(
+                old_tail[:BLOSC_HEADER_LENGTH])['ctbytes']
+            compressed = old_tail[:ctbytes]
+            expected_digest = old_tail[ctbytes:ctbytes + checksum_impl.size]
+            _check_digest(compressed, expected_digest, checksum_impl, first)
+            head = blosc.decompress(compressed)
+        capacity = nchunks + max_app_chunks if has_offsets else MAX_CHUNKS
+        def compress(chunk):
+            compressed, digest = _compress_chunk(chunk, blosc_args,
+                                                 checksum_impl)
+            return len(chunk), compressed, digest
+        offsets_storage = []
+        last_chunk_size = bloscpack_header['last_chunk']
+        try:
+            fp.seek(last_offset if rewrite_last else meta_start, 0)
+            fp.truncate()
+            for current_size, compressed, digest in _ordered_imap(
+                    compress, _rechunk(buffers, chunk_size, head), nthreads):
+                if first + len(offsets_storage) == capacity:
+                    raise ChunkingException(
+                        "no free entries left in the offsets table for "
+                        "more than '%d' chunks" % capacity)
+                offsets_storage.append(fp.tell())
+                fp.write(compressed)
+                fp.write(digest)
+                last_chunk_size = current_size
+                print_verbose("chunk '%d' appended, in: %s out: %s" %
+                        (first + len(offsets_storage) - 1,
+                         double_pretty_size(current_size),
+                         double_pretty_size(len(compressed))), level=DEBUG)
+            json.dump(meta_info, fp)
+        except:
+            # restore the last chunk and the metadata
+            fp.seek(last_offset, 0)
+            fp.truncate()
+            fp.write(old_tail)
+            raise
+        if rewrite_last and not offsets_storage:
+            # an empty last chunk, with nothing appended to it
+            first = nchunks
+        nchunks = first + len(offsets_storage)
+        raw_bloscpack_header = create_bloscpack_header(
+            options=bloscpack_header['options'],
+            checksum=bloscpack_header['checksum'],
+            typesize=bloscpack_header['typesize'],
+            chunk_size=chunk_size,
+            last_chunk=last_chunk_size,
+            nchunks=nchunks,
+            max_app_chunks=capacity - nchunks if has_offsets else 0
+            )
+        fp.seek(0, 0)
+        fp.write(raw_bloscpack_header)
+        if has_offsets:
+            fp.seek(BLOSCPACK_HEADER_LENGTH + 8 * first, 0)
+            fp.write("".join([encode_int64(i) for i in offsets_storage]))
+    return len(offsets_storage)
+
 if __name__ == '__main__':
     parser = create_parser()
     PREFIX = parser.prog
@@ -1,6 +1,13 @@
+import os
+import shutil
+import tempfile
+
 from blaze.carray import carray, cparams
-from bloscpack import pack_list, unpack_file
-from numpy import array, frombuffer
+from bloscpack import (pack_list, pack_chunks, pack_file, unpack_file,
+                       unpack_chunk, unpack_range, unpack_ndarray, append_to,
+                       ChunkingException)
+from benchmark import sweep, recommend, format_table, PARAMS, MEASURES
+from numpy import array, arange, empty, frombuffer
 
 def test_simple():
     filename = 'output'
@@ -27,3 +34,158 @@ def test_compressed():
 
     assert out_list[0] == ca[0]
     assert out_list[1] == ca[1]
+
+def test_pack_file():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        raw = arange(100000.).tostring()
+        in_file = os.path.join(tmpdir, 'raw')
+        with open(in_file, 'wb') as fp:
+            fp.write(raw)
+        filename = os.path.join(tmpdir, 'output')
+        pack_file(in_file, {'x': 1}, filename,
+                  {'typesize': 8, 'clevel': 5, 'shuffle': True},
+                  chunk_size='64K')
+
+        out_list, meta_info = unpack_file(filename)
+
+        assert len(out_list) == 13
+        assert ''.join(out_list) == raw
+        assert meta_info == {'x': 1}
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_pack_chunks():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        chunks = [arange(i, i + 1000.).tostring() for i in range(0, 9500, 1000)]
+        filename = os.path.join(tmpdir, 'output')
+        blosc_args = {'typesize': 8, 'clevel': 5, 'shuffle': True}
+        pack_chunks(iter(chunks), {}, filename, blosc_args,
+                    nchunks=len(chunks))
+
+        out_list, meta_info = unpack_file(filename)
+
+        assert out_list == chunks
+        try:
+            pack_chunks(iter(chunks), {}, filename, blosc_args, nchunks=20)
+        except ChunkingException:
+            pass
+        else:
+            assert False, "ChunkingException not raised"
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_unpack_chunk_and_range():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        arr = arange(100000.)
+        filename = os.path.join(tmpdir, 'output')
+        chunks = [arr[i:i + 8000].tostring() for i in range(0, len(arr), 8000)]
+        pack_list(chunks, {}, filename,
+                  {'typesize': 8, 'clevel': 5, 'shuffle': True})
+
+        assert (unpack_chunk(filename, 3).view('f8') ==
+                arr[24000:32000]).all()
+        out = empty(4000)
+        unpack_chunk(filename, -1, out)
+        assert (out == arr[96000:]).all()
+        for start, stop in [(0, 100000), (5, 7), (7999, 8001),
+                            (99990, 200000)]:
+            assert (unpack_range(filename, start, stop).view('f8') ==
+                    arr[start:stop]).all()
+        out = empty(20000)
+        unpack_range(filename, 10000, 30000, out)
+        assert (out == arr[10000:30000]).all()
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_parallel():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        arr = arange(100000.)
+        filename = os.path.join(tmpdir, 'output')
+        chunks = [arr[i:i + 3000].tostring() for i in range(0, len(arr), 3000)]
+        pack_list(chunks, {'x': 1}, filename,
+                  {'typesize': 8, 'clevel': 5, 'shuffle': True},
+                  checksum='sha1', nthreads=3)
+
+        out_list, meta_info = unpack_file(filename, nthreads=3)
+
+        assert out_list == chunks
+        assert meta_info == {'x': 1}
+        assert (unpack_range(filename, 10, 99999, nthreads=3).view('f8') ==
+                arr[10:99999]).all()
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_unpack_ndarray():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        arr = arange(100000.).reshape(1000, 100)
+        in_file = os.path.join(tmpdir, 'raw')
+        with open(in_file, 'wb') as fp:
+            fp.write(arr.tostring())
+        filename = os.path.join(tmpdir, 'output')
+        pack_file(in_file, {'dtype': 'float64', 'shape': [1000, 100]},
+                  filename, {'typesize': 8, 'clevel': 5, 'shuffle': True},
+                  chunk_size=30000)
+
+        out, meta_info = unpack_ndarray(filename)
+        assert out.dtype == arr.dtype and (out == arr).all()
+        buf = empty(100000)
+        out, meta_info = unpack_ndarray(filename, buf, mmap_input=True)
+        assert out is buf and (out == arr.ravel()).all()
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_append_to():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        arr = arange(100000.)
+        data = arr.tostring()
+        filename = os.path.join(tmpdir, 'output')
+        chunks = [data[i:i + 80000] for i in range(0, 400000, 80000)]
+        pack_list(chunks[:-1] + [chunks[-1][:1000]], {'x': 1}, filename,
+                  {'typesize': 8, 'clevel': 5, 'shuffle': True},
+                  reserve_factor=0.5)
+
+        # the partial last chunk is completed, and new ones are added
+        append_to(filename, [chunks[-1][1000:], data[400000:560000]])
+        out_list, meta_info = unpack_file(filename)
+        assert ''.join(out_list) == data[:560000]
+        assert meta_info == {'x': 1}
+        assert (unpack_range(filename, 100, 70000).view('f8') ==
+                arr[100:70000]).all()
+
+        # there is no room for more than 3 new chunks
+        try:
+            append_to(filename, [data[560000:]])
+        except ChunkingException:
+            pass
+        else:
+            assert False, "ChunkingException not raised"
+        out, meta_info = unpack_ndarray(filename)
+        assert (out.view('f8') == arr[:70000]).all()
+
+        append_to(filename, [data[560000:640000]], {'x': 2})
+        out, meta_info = unpack_ndarray(filename)
+        assert (out.view('f8') == arr[:80000]).all()
+        assert meta_info == {'x': 2}
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_benchmark():
+    sample = arange(100000.)
+    results = sweep(sample, clevels=[1, 9], shuffles=[True],
+                    typesizes=[8, 4, 3], chunk_sizes=['64K'], nreads=10)
+
+    # typesize 3 does not divide the sample, so it is skipped
+    assert len(results) == 8
+    for result in results:
+        assert sorted(result) == sorted(PARAMS + MEASURES)
+        assert result['ratio'] > 1
+    params = recommend(results, goal='ratio', storage='bloscpack')
+    assert params['storage'] == 'bloscpack'
+    assert params['typesize'] == 8 and params['shuffle']
+    assert len(format_table(results).splitlines()) == 9
@@ -4,11 +4,19 @@ and units of data.
 """
 
 from blaze.sources.descriptors.byteprovider import ByteProvider
+from blaze.sources.descriptors.datadescriptor import MmapDataDescriptor, \
+    StreamDataDescriptor
 from blaze.datashape import Fixed, dynamic, string, pyobj
-from blaze.datashape.coretypes import from_numpy, to_numpy
+from blaze.datashape.coretypes import from_numpy, to_numpy, \
+    extract_measure, Record
 from blaze.byteproto import CONTIGUOUS, CHUNKED, STREAM, ACCESS_ALLOC
 
+import os
+import mmap
+import Queue
+import select
 import socket
+import threading
 import numpy as np
 
 class ArraySource(ByteProvider):
@@ -129,68 +137,266 @@ class ByteSource(ByteProvider):
 
 class FileSource(ByteProvider):
     """
-    File on local disk.
+    File on local disk, memory mapped.
+
+    The file is opened and mapped on first use.  Reads return memoryviews
+    into the mapping, so the data is not copied, and the operating system
+    pages it in as it is accessed.
+
+    Parameters
+    ----------
+    fname : str
+        The name of the file.
+    mode : str
+        'rb' maps the file read-only, 'rb+' allows writes, which go
+        straight to the file.
+    dshape : dshape
+        The datashape of the contents of the file, bytes by default.
     """
 
-    read_capabilities  = CHUNKED | STREAM
-    write_capabilities = CHUNKED | STREAM
+    read_capabilities  = CONTIGUOUS | CHUNKED | STREAM
+    write_capabilities = CONTIGUOUS | CHUNKED | STREAM
 
-    def __init__(self, fname, mode='rb+'):
-        self.fd = None
+    def __init__(self, fname, mode='rb+', dshape=None):
         self.fname = fname
         self.mode = mode
-        # TODO: lazy
-        self.__alloc__()
+        self.dshape = dshape
+        # The bytes of the mapping, allocated lazily
+        self.bits = None
+
+    @property
+    def nbytes(self):
+        if self.bits is None:
+            return os.path.getsize(self.fname)
+        return len(self.bits)
+
+    @property
+    def writable(self):
+        return '+' in self.mode or 'w' in self.mode
 
     def read(self, offset, nbytes):
-        self.rd.read()
+        """ Return a memoryview of `nbytes` bytes at `offset` of the file,
+        without copying them """
+        bits = self.__alloc__()
+        if offset < 0 or nbytes < 0 or offset + nbytes > len(bits):
+            raise IndexError('reading %d bytes at %d, past the end of %s'
+                             % (nbytes, offset, self.fname))
+        return memoryview(bits[offset:offset+nbytes])
 
-    def write(self, offset, nbytes):
-        pass
+    def write(self, offset, wbytes):
+        """ Write the `wbytes` buffer at `offset` of the file (which does
+        not grow) """
+        if not self.writable:
+            raise IOError("file %s is not open for writing" % self.fname)
+        bits = self.__alloc__()
+        wbytes = np.asarray(memoryview(wbytes)).reshape(-1).view(np.uint8)
+        if offset < 0 or offset + len(wbytes) > len(bits):
+            raise IndexError('writing %d bytes at %d, past the end of %s'
+                             % (len(wbytes), offset, self.fname))
+        bits[offset:offset+len(wbytes)] = wbytes
+
+    def asarray(self):
+        """ The contents of the file as a flat NumPy array of the type in
+        its datashape (a view of the mapping) """
+        bits = self.__alloc__()
+        if self.dshape is None:
+            return bits
+        dtype = extract_measure(self.dshape).to_dtype()
+        return bits[:len(bits) - len(bits) % dtype.itemsize].view(dtype)
+
+    def read_desc(self):
+        return MmapDataDescriptor('file_dd', self.nbytes, self.dshape,
+                                  self.asarray())
 
     def __alloc__(self):
-        self.fd = open(self.fname, self.mode)
+        if self.bits is None:
+            with open(self.fname, self.mode) as fd:
+                size = os.fstat(fd.fileno()).st_size
+                if size == 0:
+                    # Empty files can not be mapped
+                    self.bits = np.empty(0, dtype=np.uint8)
+                else:
+                    access = mmap.ACCESS_WRITE if self.writable \
+                             else mmap.ACCESS_READ
+                    # The mapping does not need the file to stay open
+                    self.bits = np.frombuffer(
+                        mmap.mmap(fd.fileno(), size, access=access),
+                        dtype=np.uint8)
+        return self.bits
 
     def __dealloc__(self):
-        self.fd.close()
+        # The mapping is unmapped once the views into it are gone
+        self.bits = None
 
     def __repr__(self):
-        return 'File(fileno=%s, %s)' % (self.fd.fileno, self.fname)
+        return 'File(%s, mode=%r)' % (self.fname, self.mode)
 
 class SocketSource(ByteProvider):
     """
-    Stream of bytes over TCP.
+    Stream of fixed-size records over TCP.
+
+    A reader thread receives the bytes straight into a ring of
+    preallocated buffers (with `recv_into`), a batch of `batchlen`
+    records per buffer.  The full buffers are handed to the consumer as
+    NumPy arrays, and reused once the consumer asks for the next batch.
+    When all the buffers are full, the reader waits for one to be freed
+    and stops receiving, so a slow consumer slows the sender down
+    through TCP flow control instead of filling up memory.
+
+    Parameters
+    ----------
+    host, port :
+        The address to connect to.
+    flags : int
+        The flags of `recv_into`.
+    dshape : dshape
+        The datashape of the records, bytes by default.
+    dtype : NumPy dtype, or list of (name, type) fields
+        The layout of the records on the wire, by default the measure
+        of `dshape`.  The fields of a Record are unordered, so records
+        with several fields need it.
+    batchlen : int
+        The number of records per batch.
+    nbuffers : int
+        The number of buffers in the ring.
     """
 
     read_capabilities  = STREAM
     write_capabilities = STREAM
 
-    def __init__(self, host, port, flags=None):
+    # Seconds between checks for a closed source while waiting for data
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, host, port, flags=None, dshape=None, dtype=None,
+                 batchlen=4096, nbuffers=4):
         self.host = host
         self.port = port
-        self.flags = flags
-        self.__alloc__()
+        self.flags = flags or 0
+        self.dshape = dshape
+        if dtype is not None:
+            self.dtype = np.dtype(dtype)
+        elif dshape is None:
+            self.dtype = np.dtype(np.uint8)
+        else:
+            measure = extract_measure(dshape)
+            if isinstance(measure, Record) and len(measure.names) > 1:
+                raise ValueError("the fields of %s are unordered, pass the "
+                                 "layout of the records as `dtype`" % dshape)
+            self.dtype = measure.to_dtype()
+        self.batchlen = batchlen
+        self.nbuffers = nbuffers
+        # The connection and the ring, allocated lazily
+        self.socket = None
 
     def __alloc__(self):
-        self.socket = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
-        self.setsockopt(self.SOL_SOCKET, self.SO_REUSEADDR, 1)
+        if self.socket is not None:
+            return
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.socket.connect((self.host, self.port))
-
-    def __dealloc__(self):
-        self.socket.close()
-
-    def read(self, nbytes):
-        msg = bytearray(nbytes)
-        view = memoryview(msg)
-        while view:
-            rbytes = self.socket.recv_into(view, nbytes)
-            yield view[rbytes:]
+        nbytes = self.batchlen * self.dtype.itemsize
+        self.buffers = [bytearray(nbytes) for _ in xrange(self.nbuffers)]
+        # The indices of the buffers that can be filled, and the (index,
+        # nbytes) of the filled ones (None at the end of the stream)
+        self.free = Queue.Queue()
+        self.full = Queue.Queue()
+        for i in xrange(self.nbuffers):
+            self.free.put(i)
+        self.error = None
+        self.closed = False
+        self.reader = threading.Thread(target=self._receive)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def _receive(self):
+        """ Fill the free buffers with the bytes received (in the reader
+        thread) """
+        try:
+            while not self.closed:
+                try:
+                    i = self.free.get(timeout=self.POLL_INTERVAL)
+                except Queue.Empty:
+                    continue
+                view = memoryview(self.buffers[i])
+                nbytes = 0
+                while nbytes < len(view) and not self.closed:
+                    ready, _, _ = select.select([self.socket], [], [],
+                                                self.POLL_INTERVAL)
+                    if not ready:
+                        continue
+                    received = self.socket.recv_into(view[nbytes:],
+                                                     len(view) - nbytes,
+                                                     self.flags)
+                    if received == 0:
+                        break
+                    nbytes += received
+                if nbytes > 0:
+                    self.full.put((i, nbytes))
+                if nbytes < len(view):
+                    # End of the stream (or closed source)
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            self.full.put(None)
+
+    def read(self):
+        """ Iterate over the records received, in batches of `batchlen`
+        records (only the last one can be shorter).
+
+        Every batch is a NumPy array that views a buffer of the ring, and
+        it is only valid until the next batch is requested.  The
+        connection is closed at the end of the stream, or as soon as the
+        consumer stops iterating.
+        """
+        self.__alloc__()
+        itemsize = self.dtype.itemsize
+        try:
+            while True:
+                item = self.full.get()
+                if item is None:
+                    break
+                i, nbytes = item
+                if nbytes % itemsize:
+                    raise IOError("the stream ended in the middle of a "
+                                  "record")
+                try:
+                    yield np.frombuffer(self.buffers[i], dtype=self.dtype,
+                                        count=nbytes // itemsize)
+                finally:
+                    # The consumer is done with the buffer
+                    self.free.put(i)
+        finally:
+            # Also on GeneratorExit, when the consumer stops early
+            self.__dealloc__()
+        if self.error is not None:
+            raise self.error
+
+    def read_desc(self):
+        return StreamDataDescriptor('socket_dd', None, self.dshape,
+                                    self.read())
+
+    def append_to(self, target):
+        """ Append all the records received to `target` (a carray or a
+        ctable) as they come.  Returns the number of records. """
+        nrecords = 0
+        for batch in self.read():
+            target.append(batch)
+            nrecords += len(batch)
+        return nrecords
 
     def write(self, nbytes):
         pass
 
+    def __dealloc__(self):
+        if self.socket is not None:
+            self.closed = True
+            self.reader.join()
+            self.socket.close()
+            self.socket = None
+
     def __repr__(self):
-        return 'Socket(fileno=%s)' % (self.fd.fileno)
+        return 'Socket(%s:%s)' % (self.host, self.port)
 
 class ImageSource(ByteProvider):
 
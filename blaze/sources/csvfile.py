@@ -0,0 +1,341 @@
+"""
+Streaming ingestion of delimited text (CSV) files into chunked arrays
+and tables.
+
+The file is split into byte ranges that end on line boundaries, the
+ranges are parsed into typed blocks by a pool of worker processes, and
+the blocks are appended in file order to a carray (files with a single
+column) or to a ctable.  Only a few blocks are in flight at any time, so
+the memory used does not depend on the size of the file.
+"""
+
+import os
+import time
+import shutil
+from collections import deque
+from cStringIO import StringIO
+from multiprocessing import Pool, cpu_count
+
+from blaze.sources.chunked import CArraySource, CTableSource
+from blaze.datashape import dshape as _dshape
+from blaze.datashape.coretypes import CType, Record, extract_measure
+from blaze.params import params as _params
+
+import numpy as np
+
+# The size of the byte ranges parsed at once
+BLOCKSIZE = 2**24
+
+# The number of lines sampled for inferring the types of the columns,
+# and the number of places in the file they are taken from
+SAMPLE_LINES = 1000
+SAMPLE_RANGES = 64
+
+# Integers over this are not exactly represented by float64
+_MAX_EXACT_INT = 2**53
+
+#------------------------------------------------------------------------
+# Types
+#------------------------------------------------------------------------
+
+def _split(line, delimiter):
+    """ The fields of a line, without surrounding blanks or quotes. """
+    return [field.strip().strip('"\'')
+            for field in line.rstrip('\r\n').split(delimiter)]
+
+def read_header(filename, delimiter=','):
+    """
+    Return the names of the columns in the first line of a file.
+    """
+    with open(filename, 'rb') as fd:
+        return _split(fd.readline(), delimiter)
+
+def _sample(filename, start, nlines, nranges=SAMPLE_RANGES):
+    """ About `nlines` lines after `start`, taken from the beginnings of
+    `nranges` ranges spread across the whole file. """
+    size = os.path.getsize(filename)
+    blocksize = max((size - start) // nranges, 1)
+    per_range = max(nlines // nranges, 1)
+    lines = []
+    with open(filename, 'rb') as fd:
+        for lo, hi in split_ranges(filename, start, blocksize):
+            fd.seek(lo)
+            for _ in xrange(per_range):
+                if fd.tell() >= hi:
+                    break
+                lines.append(fd.readline())
+    return ''.join(lines)
+
+def infer_dtype(filename, delimiter=',', header=True, nlines=SAMPLE_LINES):
+    """
+    Infer the NumPy (record) dtype of the rows of a file out of about
+    `nlines` lines, sampled across the whole file.
+
+    Columns are int64, float64 or strings.  Strings get twice the width
+    of the longest one in the sample, and longer ones are refused when
+    parsed (see `parse_block`).
+    """
+    with open(filename, 'rb') as fd:
+        names = _split(fd.readline(), delimiter) if header else None
+        start = fd.tell()
+    sample = _sample(filename, start, nlines)
+    if not sample.strip():
+        raise ValueError("no rows to infer the types of the columns from")
+    rows = np.atleast_1d(np.genfromtxt(StringIO(sample), dtype=None,
+                                       delimiter=delimiter, autostrip=True))
+    if rows.dtype.fields is None:
+        # All the columns have the same type
+        ncols = len(_split(sample[:sample.index('\n') + 1], delimiter))
+        types = [rows.dtype] * ncols
+    else:
+        types = [rows.dtype.fields[name][0] for name in rows.dtype.names]
+    if names is None:
+        names = ['f%d' % i for i in xrange(len(types))]
+    if len(names) != len(types):
+        raise ValueError("the header has %d columns, but the rows have %d"
+                         % (len(names), len(types)))
+    types = [np.dtype('S%d' % (2 * t.itemsize)) if t.kind == 'S' else t
+             for t in types]
+    return np.dtype(zip(names, types))
+
+def rows_dtype(dshape, names):
+    """
+    The NumPy record dtype for the rows of a file with the `names`
+    columns out of a datashape.
+
+    The measure of `dshape` is either a Record, whose fields are looked
+    up by name (fields are unordered), or a type shared by all the
+    columns.
+    """
+    if isinstance(dshape, basestring):
+        dshape = _dshape(dshape)
+    measure = extract_measure(dshape)
+    if isinstance(measure, Record):
+        missing = set(names) - set(measure.names)
+        if missing:
+            raise ValueError("no types for the columns %s in %s"
+                             % (sorted(missing), dshape))
+        return np.dtype([(name, measure(name).to_dtype())
+                         for name in names])
+    elif isinstance(measure, CType):
+        return np.dtype([(name, measure.to_dtype()) for name in names])
+    raise TypeError("can not load columns of type %s" % measure)
+
+#------------------------------------------------------------------------
+# Parsing
+#------------------------------------------------------------------------
+
+def split_ranges(filename, start=0, blocksize=BLOCKSIZE):
+    """
+    Iterate over the (start, stop) byte ranges of a file after `start`,
+    of about `blocksize` bytes and ending on line boundaries.
+    """
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as fd:
+        while start < size:
+            fd.seek(min(start + blocksize, size) - 1)
+            # Look for the end of the line
+            fd.readline()
+            stop = min(fd.tell(), size)
+            yield start, stop
+            start = stop
+
+def _numeric(dtype):
+    return all(dtype.fields[name][0].kind in 'biuf' for name in dtype.names)
+
+def parse_block(text, dtype, delimiter=','):
+    """
+    Parse the lines in `text` into a record array of `dtype`.
+
+    Raises ValueError for fields that do not fit their column: values
+    of integer columns that are not integers, and strings longer than
+    the width of their column.
+    """
+    ncols = len(dtype.names)
+    nrows = text.count('\n') + (not text.endswith('\n'))
+    if _numeric(dtype):
+        # Fast path: the C number parser of NumPy, with lines turned
+        # into more fields (a blank separator matches any whitespace)
+        if delimiter:
+            values = np.fromstring(text.replace('\n', delimiter),
+                                   sep=delimiter)
+        else:
+            values = np.fromstring(text, sep=' ')
+        if len(values) == nrows * ncols:
+            values = values.reshape(nrows, ncols)
+            exact = True
+            for i, name in enumerate(dtype.names):
+                if dtype.fields[name][0].kind in 'biu' and len(values):
+                    # Not an integer, or not exactly represented
+                    column = values[:, i]
+                    if (np.abs(column).max() >= _MAX_EXACT_INT or
+                            (column != np.floor(column)).any()):
+                        exact = False
+            if exact:
+                block = np.empty(nrows, dtype=dtype)
+                for i, name in enumerate(dtype.names):
+                    block[name] = values[:, i]
+                return block
+    # Quoted fields, strings, missing values, non-integers in integer
+    # columns (refused by the parser)...
+    return np.atleast_1d(np.loadtxt(StringIO(text), dtype=dtype,
+                                    delimiter=delimiter or None,
+                                    converters=_converters(dtype),
+                                    ndmin=1))
+
+def _converters(dtype):
+    """ Strip the blanks and quotes of string fields, and refuse the
+    ones that do not fit, as well as non-integers in integer fields
+    (some versions of `loadtxt` truncate them). """
+    converters = {}
+    for i, name in enumerate(dtype.names):
+        ftype = dtype.fields[name][0]
+        kind, width = ftype.kind, ftype.itemsize
+        if kind == 'S':
+            converters[i] = _string_converter(name, width)
+        elif kind in 'iu':
+            converters[i] = _int_converter(name)
+    return converters
+
+def _int_converter(name):
+    def convert(field):
+        try:
+            return int(field)
+        except ValueError:
+            raise ValueError("%r is not an integer (column %s)"
+                             % (field.strip(), name))
+    return convert
+
+def _string_converter(name, width):
+    def convert(field):
+        field = field.strip().strip('"\'')
+        if len(field) > width:
+            raise ValueError("the string %r does not fit in the %d bytes of "
+                             "column %s (pass a dshape with wider strings)"
+                             % (field, width, name))
+        return field
+    return convert
+
+def _parse_range(args):
+    """ Read and parse a byte range of a file (in a worker process). """
+    filename, start, stop, dtype, delimiter = args
+    with open(filename, 'rb') as fd:
+        fd.seek(start)
+        text = fd.read(stop - start)
+    return parse_block(text, dtype, delimiter)
+
+def read_blocks(filename, dtype, delimiter=',', header=True,
+                blocksize=BLOCKSIZE, nprocs=None):
+    """
+    Iterate over the rows of a file as record arrays of `dtype`, in
+    file order.
+
+    The blocks are parsed by `nprocs` worker processes (the number of
+    cores by default).  At most two blocks per process are in flight.
+    """
+    if nprocs is None:
+        nprocs = cpu_count()
+    start = 0
+    if header:
+        with open(filename, 'rb') as fd:
+            fd.readline()
+            start = fd.tell()
+    tasks = ((filename, lo, hi, dtype, delimiter)
+             for lo, hi in split_ranges(filename, start, blocksize))
+    if nprocs <= 1:
+        for task in tasks:
+            yield _parse_range(task)
+        return
+    pool = Pool(nprocs)
+    try:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(_parse_range, (task,)))
+            if len(pending) >= 2 * nprocs:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+
+#------------------------------------------------------------------------
+# Loading
+#------------------------------------------------------------------------
+
+def load_csv(filename, dshape=None, params=None, delimiter=',', header=True,
+             blocksize=BLOCKSIZE, nprocs=None, progress=None):
+    """
+    Load a delimited text file into a CArraySource (a single column) or
+    a CTableSource.
+
+    Parameters
+    ----------
+    filename : str
+        The file to load.
+    dshape : str, blaze.dshape instance
+        The datashape of the rows, a Record with the types of the columns
+        or a type for all of them.  If not given, the types are inferred
+        from lines sampled across the file.
+    params : blaze.params object
+        The parameters of the chunked array or table, like the directory
+        where it is persisted (`storage`).
+    delimiter : str
+        The separator of the fields (None for any whitespace).
+    header : bool
+        Whether the first line has the names of the columns.  Otherwise
+        the columns are named f0, f1...
+    blocksize : int
+        The number of bytes parsed at once.
+    nprocs : int
+        The number of worker processes parsing blocks, the number of
+        cores by default.
+    progress : callable
+        Called as ``progress(rows, seconds)`` after every block appended,
+        with the rows loaded so far and the seconds it took.
+
+    Returns
+    -------
+    out : CArraySource or CTableSource
+    """
+    if dshape is None:
+        dtype = infer_dtype(filename, delimiter, header)
+    else:
+        if header:
+            names = read_header(filename, delimiter)
+        else:
+            with open(filename, 'rb') as fd:
+                ncols = len(_split(fd.readline(), delimiter))
+            names = ['f%d' % i for i in xrange(ncols)]
+        dtype = rows_dtype(dshape, names)
+    params = params or _params()
+    single = len(dtype.names) == 1
+
+    storage = params.get('storage')
+    created = storage is not None and not os.path.exists(storage)
+    t0 = time.time()
+    source, rows = None, 0
+    try:
+        for block in read_blocks(filename, dtype, delimiter, header,
+                                 blocksize, nprocs):
+            if single:
+                block = block[dtype.names[0]]
+            if source is None:
+                source = (CArraySource if single else CTableSource)(
+                    block, params=params)
+            else:
+                source.ca.append(block)
+            rows += len(block)
+            if progress is not None:
+                progress(rows, time.time() - t0)
+    except:
+        # Do not leave a partial table behind
+        if created and os.path.exists(storage):
+            shutil.rmtree(storage)
+        raise
+    if source is None:
+        # An empty file
+        empty = np.empty(0, dtype=dtype)
+        source = CArraySource(empty[dtype.names[0]], params=params) \
+                 if single else CTableSource(empty, params=params)
+    source.ca.flush()
+    return source
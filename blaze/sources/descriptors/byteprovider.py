@@ -33,6 +33,12 @@ class ByteProvider(object):
         speciazlied by execution """
         raise NotImplementedError
 
+    def pushdown(self, term, operands):
+        """ Run the whole expression `term` (an ATerm graph whose
+        operands are looked up by id in `operands`), for sources that
+        can do it themselves.  Returns NotImplemented otherwise. """
+        return NotImplemented
+
     def has_op(self, op, method):
         if op == READ:
             return method & self.read_capabilities
@@ -1,3 +1,6 @@
+import mmap
+from fractions import gcd
+
 from blaze import byteproto as proto
 from . import lldescriptors, llindexers
 
@@ -140,16 +143,18 @@ class Stream(DataDescriptor):
 #     int readonly;
 # }
 
-class SqlDataDescriptor(DataDescriptor):
+class SqlDataDescriptor(Stream):
+    """ Descriptor of the results of a SQL query, fetched in chunks.
+    Every chunk is a list of NumPy arrays, one per column in `names`.
+    """
 
-    def __init__(self, id, conn, query):
-        self.id = id
-        self.conn = conn
-        self.query = query
+    def __init__(self, id, nbytes, datashape, names, chunks):
+        super(SqlDataDescriptor, self).__init__(id, nbytes, datashape)
+        self.names = names
+        self.chunks = chunks
 
-    def asbuffer(self, copy=False):
-        self.conn.execute(self.query)
-        return self.conn.fetchone()
+    def asstream(self):
+        return iter(self.chunks)
 
 class CArrayDataDescriptor(DataDescriptor):
 
@@ -162,3 +167,46 @@ class CArrayDataDescriptor(DataDescriptor):
         """Return a ChunkIterator
         """
         return llindexers.CArrayChunkIterator(self.carray, self.datashape)
+
+class MmapDataDescriptor(DataDescriptor):
+    """ Descriptor of a contiguous array in memory, like the mapping of a
+    file.  Chunks are views into the array, aligned to pages of memory
+    and made of whole elements.
+    """
+
+    def __init__(self, id, nbytes, datashape, array, chunksize=2**20):
+        super(MmapDataDescriptor, self).__init__(id, nbytes, datashape)
+        self.array = array
+        self.itemsize = array.itemsize
+        # The smallest chunk of whole elements spanning whole pages
+        unit = mmap.PAGESIZE * self.itemsize // gcd(mmap.PAGESIZE,
+                                                     self.itemsize)
+        self.chunklen = max(chunksize // unit, 1) * unit // self.itemsize
+
+    def asstrided(self, copy=False):
+        if copy:
+            return memoryview(self.array.copy())
+        return memoryview(self.array)
+
+    def asstream(self):
+        """ Returns the chunks as memoryviews, in order """
+        for start in xrange(0, len(self.array), self.chunklen):
+            yield memoryview(self.array[start:start+self.chunklen])
+
+    def as_chunked_iterator(self, copy=False):
+        """Return a ChunkIterator
+        """
+        return llindexers.ArrayChunkIterator((self.array, self.chunklen),
+                                             self.datashape)
+
+class StreamDataDescriptor(Stream):
+    """ Descriptor of data that is received (or computed) in batches,
+    which are NumPy arrays of records.
+    """
+
+    def __init__(self, id, nbytes, datashape, batches):
+        super(StreamDataDescriptor, self).__init__(id, nbytes, datashape)
+        self.batches = batches
+
+    def asstream(self):
+        return iter(self.batches)
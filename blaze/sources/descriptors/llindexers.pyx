@@ -64,4 +64,47 @@ cdef int carray_chunk_dispose(CChunkIterator *info, CChunk *chunk) except -1:
     # Decref previously set live object
     Py_XDECREF(chunk.obj)
     chunk.obj = NULL
-    return 0
\ No newline at end of file
+    return 0
+#------------------------------------------------------------------------
+# Contiguous array (and memory mapped file) chunk iterators
+#------------------------------------------------------------------------
+
+cdef class ArrayChunkIterator(ChunkIterator):
+    """
+    Iterate over chunks of a contiguous NumPy array without copying them.
+    The data object is an (array, chunklen) tuple.
+    """
+
+    def __cinit__(self, data_obj, datashape, *args, **kwargs):
+        super(ArrayChunkIterator, self).__init__(data_obj, datashape)
+        self.iterator.next = array_chunk_next
+        self.iterator.commit = array_chunk_commit
+        self.iterator.dispose = carray_chunk_dispose
+
+
+cdef int array_chunk_next(CChunkIterator *info, CChunk *chunk) except -1:
+    array, chunklen = <object> <PyObject *> info.meta.source
+    start = info.cur_chunk_idx * chunklen
+    if start >= len(array):
+        chunk.data = NULL
+        return 0
+
+    # a view of the chunk
+    arr = array[start:start + chunklen]
+    chunk.data = <void *> <Py_uintptr_t> arr.ctypes.data
+    chunk.size = arr.shape[0]
+    chunk.stride = arr.strides[0]
+    chunk.chunk_index = info.cur_chunk_idx
+
+    # Keep the view alive
+    Py_INCREF(arr)
+    chunk.obj = <PyObject *> arr
+
+    info.cur_chunk_idx += 1
+
+    return 0
+
+cdef int array_chunk_commit(CChunkIterator *info, CChunk *chunk) except -1:
+    # the chunk was written in place
+    carray_chunk_dispose(info, chunk)
+    return 0
@@ -1,12 +1,199 @@
+"""
+SQLite data sources.
+
+Query results are fetched in chunks of rows with ``fetchmany`` and
+copied into preallocated NumPy buffers, one per result column, so only
+the rows of one chunk are Python tuples at any time.
+
+Blaze expressions over a table (column selections, filters and
+reductions) are translated into SQL and run by SQLite, so only their
+result is loaded.
+"""
+
 import sqlite3
 
+from blaze import carray
+from blaze.carray.ctable import ctable
 from blaze.sources.descriptors.byteprovider import ByteProvider
+from blaze.sources.descriptors.datadescriptor import SqlDataDescriptor
+from blaze.sources.csvfile import rows_dtype
 from blaze.byteproto import CONTIGUOUS, CHUNKED, STREAM, ACCESS_READ
-#from blaze.datadescriptor import SqlDataDescriptor
+from blaze.datashape import dshape as _dshape
+from blaze.expr.paterm import ATerm
+from blaze.expr.visitor import MroVisitor
 
 from blaze.layouts.categorical import Simple
 
+import numpy as np
+
+# The number of rows fetched at once
+CHUNKLEN = 2**14
+
+def collect(chunks, names, types):
+    """
+    Load chunks of columns (see `fetch_columns`) into a carray, for a
+    single column, or into a ctable.
+
+    Columns of strings (objects) are kept in memory until the longest
+    string is known, since carrays have fixed-size elements.  They
+    become unicode strings, or byte strings for BLOBs, and ValueError
+    is raised for their NULLs, which strings can not hold.
+    """
+    columns = [[] if t.kind == 'O' else carray.carray(np.empty(0, dtype=t))
+               for t in types]
+    for chunk in chunks:
+        for column, values in zip(columns, chunk):
+            if isinstance(column, list):
+                column.append(values.copy())
+            else:
+                column.append(values)
+    for i, column in enumerate(columns):
+        if isinstance(column, list):
+            values = np.concatenate(column) if column else np.empty(0)
+            columns[i] = carray.carray(_strings(values, names[i]))
+        columns[i].flush()
+    if len(columns) == 1:
+        return columns[0]
+    return ctable(columns, names)
+
+def _strings(values, name):
+    """ The values of an object column as unicode strings, or as byte
+    strings if they are all BLOBs. """
+    kinds = set(map(type, values))
+    if type(None) in kinds:
+        raise ValueError("column %s has NULLs, which strings can not hold"
+                         % name)
+    if kinds and kinds <= set([buffer, str]):
+        return np.array([str(value) for value in values], dtype=str)
+    elif buffer in kinds:
+        raise ValueError("column %s mixes BLOBs with other values" % name)
+    return values.astype(unicode)
+
+_INTEGERS = frozenset([int, long, bool])
+_NUMBERS = _INTEGERS | frozenset([float, type(None)])
+
+def values_type(values):
+    """
+    The NumPy type of a list of values.
+
+    Integers are int64, numbers (or NULLs only) are float64, with NULLs
+    as NaN, and the rest are objects.
+    """
+    kinds = set(map(type, values))
+    if kinds and kinds <= _INTEGERS:
+        return np.dtype(np.int64)
+    elif kinds <= _NUMBERS:
+        return np.dtype(np.float64)
+    return np.dtype(object)
+
+def infer_types(rows, ncols):
+    """
+    The NumPy types of the `ncols` columns of a list of rows (see
+    `values_type`).
+    """
+    return [values_type([row[i] for row in rows]) for i in xrange(ncols)]
+
+def _rank(dtype):
+    """ The position of a type in the order in which types are widened:
+    integers, then floats, then objects. """
+    return {'b': 0, 'i': 0, 'u': 0, 'f': 1}.get(dtype.kind, 2)
+
+def column_types(dshape, names):
+    """
+    The NumPy types of the `names` columns out of a datashape (see
+    `rows_dtype`).  Strings without a length are objects.
+    """
+    dtype = rows_dtype(dshape, names)
+    types = [dtype.fields[name][0] for name in dtype.names]
+    return [np.dtype(object) if t.kind in 'SU' and t.itemsize == 0 else t
+            for t in types]
+
+def quote(name):
+    """ Quote the name of a table or column. """
+    return '"%s"' % name.replace('"', '""')
+
+def table_dshape(conn, table):
+    """
+    The datashape of the rows of a table, out of the declared types of
+    its columns (following the type affinity rules of SQLite).
+
+    Integer columns that can hold NULLs are float64, with NULLs as NaN.
+    """
+    fields = []
+    for column in conn.execute('PRAGMA table_info(%s)' % quote(table)):
+        name, decl = str(column[1]), (column[2] or '').upper()
+        notnull, pk = column[3], column[5]
+        if 'INT' in decl and (notnull or pk):
+            fields.append('%s=int64' % name)
+        elif any(t in decl for t in ('CHAR', 'CLOB', 'TEXT', 'BLOB')) \
+                or not decl:
+            fields.append('%s=string' % name)
+        else:
+            fields.append('%s=float64' % name)
+    if not fields:
+        raise ValueError("no table %s in the database" % quote(table))
+    return _dshape('x, Record(%s)' % ', '.join(fields))
+
+def fetch_columns(cursor, dshape=None, chunklen=CHUNKLEN):
+    """
+    Iterate over the rows of an executed query as lists of NumPy
+    arrays, one per result column, of up to `chunklen` rows.
+
+    The arrays are views into buffers allocated once and reused for
+    every chunk, so they are only valid until the next chunk is
+    requested.  The types of the columns are looked up by name in the
+    datashape `dshape` (see `column_types`), and ValueError is raised
+    for values that do not fit them (e.g. NULLs or reals in integer
+    columns).  Otherwise, the types are inferred from the first chunk,
+    and widened (from int64 to float64 to object) when a later chunk
+    does not fit them, so later chunks can have wider types.
+    """
+    if cursor.description is None:
+        raise ValueError("the query does not return rows")
+    names = [column[0] for column in cursor.description]
+    rows = cursor.fetchmany(chunklen)
+    if dshape is not None:
+        types = column_types(dshape, names)
+    else:
+        types = infer_types(rows, len(names))
+    buffers = [np.empty(chunklen, dtype=t) for t in types]
+    while rows:
+        nrows = len(rows)
+        for i, buf in enumerate(buffers):
+            values = [row[i] for row in rows]
+            if buf.dtype.kind in 'biuf':
+                needed = values_type(values)
+                if _rank(needed) > _rank(buf.dtype):
+                    if dshape is not None:
+                        raise ValueError(
+                            "the values of column %s do not fit its type "
+                            "%s, they need %s" % (names[i], buf.dtype,
+                                                  needed))
+                    buf = buffers[i] = np.empty(chunklen, dtype=needed)
+            buf[:nrows] = values
+        # Drop the tuples before handing the chunk over
+        rows = None
+        yield [buf[:nrows] for buf in buffers]
+        rows = cursor.fetchmany(chunklen)
+
 class SqliteSource(ByteProvider):
+    """
+    A SQLite database, in memory or in the file given by the `storage`
+    parameter.  The `table` parameter names the table that the
+    expressions over the source refer to.
+
+    Parameters
+    ----------
+    data : object (optional)
+    dshape : dshape
+        The datashape of the rows of the queries, a Record with the
+        types of the result columns (looked up by name) or a type for
+        all of them.  If not given, the types are inferred from the first
+        rows of every query, or from the declared types of the columns
+        of `table`.
+    params : params
+        Specifies the parameters of the source (`storage`, `table`).
+    """
 
     read_capabilities  = STREAM
     write_capabilities = STREAM
@@ -16,17 +203,57 @@ class SqliteSource(ByteProvider):
         #assert (data is not None) or (dshape is not None) or \
                #(params.get('storage'))
 
-        if 'storage' in params and params.storage:
+        if params and params.get('storage'):
             self.conn = sqlite3.connect(params.storage)
         else:
             self.conn = sqlite3.connect(':memory:')
+        self.table = params.get('table') if params else None
+        if dshape is None and self.table is not None:
+            dshape = table_dshape(self.conn, self.table)
+        elif isinstance(dshape, basestring):
+            dshape = _dshape(dshape)
+        self.dshape = dshape
+
+    def pushdown(self, term, operands):
+        """ Run an expression over `table` in SQLite (see `pushdown`). """
+        if self.table is None:
+            return NotImplemented
+        try:
+            return pushdown(term, operands)
+        except NotPushable:
+            return NotImplemented
 
     def register_custom_types(self, name, ty, con, decon):
         sqlite3.register_adapter(ty, con)
         sqlite3.register_converter(name, decon)
 
-    def read_desc(self, query):
-        return SqlDataDescriptor('sqlite_dd', None, self.conn)
+    def read(self, query, args=(), dshape=None, chunklen=CHUNKLEN):
+        """ Iterate over the results of a query in chunks of columns
+        (see `fetch_columns`) """
+        cursor = self.conn.execute(query, args)
+        return fetch_columns(cursor, dshape or self.dshape, chunklen)
+
+    def read_desc(self, query, args=(), dshape=None, chunklen=CHUNKLEN):
+        cursor = self.conn.execute(query, args)
+        names = [column[0] for column in cursor.description or ()]
+        dshape = dshape or self.dshape
+        return SqlDataDescriptor('sqlite_dd', None, dshape, names,
+                                 fetch_columns(cursor, dshape, chunklen))
+
+    def append_to(self, target, query, args=(), dshape=None,
+                  chunklen=CHUNKLEN):
+        """ Append the results of a query to a ctable, or to a carray
+        for queries of a single column.  Returns the number of rows
+        appended. """
+        nrows = 0
+        for columns in self.read(query, args, dshape, chunklen):
+            if hasattr(target, 'names'):
+                target.append(columns)
+            else:
+                target.append(columns[0])
+            nrows += len(columns[0])
+        target.flush()
+        return nrows
 
     def repr_data(self):
         return '<Deferred>'
@@ -35,3 +262,177 @@ class SqliteSource(ByteProvider):
     def default_layout(self):
         return Simple()
         #return Simple(self.conn.read_schema())
+
+#------------------------------------------------------------------------
+# Pushdown
+#------------------------------------------------------------------------
+
+class NotPushable(Exception):
+    """ The expression can not be run by SQLite. """
+
+# SQL for the operators of blaze expressions
+COMPARISONS = {'Eq': '=', 'Ne': '!=', 'Lt': '<', 'Le': '<=', 'Gt': '>',
+               'Ge': '>='}
+CONNECTIVES = {'And': 'AND', 'Or': 'OR'}
+ARITHMETIC  = {'Add': '+', 'Mul': '*'}
+AGGREGATES  = {'Sum': 'sum', 'Min': 'min', 'Max': 'max', 'Count': 'count'}
+
+# The reductions without an identity (as named by NumPy)
+NO_IDENTITY = {'Min': 'minimum', 'Max': 'maximum'}
+
+def _label(term):
+    return term.spine.label if hasattr(term, 'spine') else None
+
+class SqlTranslator(MroVisitor):
+    """
+    Translate an ATerm expression over a SQLite table (the output of
+    BlazeVisitor) into a SELECT statement.
+
+    ::
+
+        Array()                 the rows of the table
+        Index(rel, name)        the column of the rows
+        Index(rel, predicate)   the rows where the predicate holds
+        Sum(rel), Min(rel), Max(rel), Count(rel)
+
+    Predicates are comparisons of columns, constants and their sums and
+    products, combined with And, Or and Invert.  The constants become
+    parameters of the query.  NULLs compare like NaN in NumPy: they
+    are different from anything, and not equal, less or greater than
+    anything.
+
+    Reductions also select the number of values and of rows: a
+    reduction of a column with NULLs is NaN (like NumPy with NaN), and
+    the ones of no rows are 0 (sums) or have no value (minima and
+    maxima).
+    """
+
+    def __init__(self, operands):
+        # The blaze objects of the Array terms, by id
+        self.operands = operands
+        self.source = None
+        self.args = []
+
+    def translate(self, term):
+        """ Returns the query and its parameters. """
+        label = _label(term)
+        if label in AGGREGATES:
+            columns, where = self.relation(term.args[0])
+            if label == 'Count':
+                select = 'count(*)'
+            elif columns is None or len(columns) != 1:
+                raise NotPushable("can only reduce a single column")
+            else:
+                column = quote(columns[0])
+                select = '%s(%s), count(%s), count(*)' % (
+                    AGGREGATES[label], column, column)
+        else:
+            columns, where = self.relation(term)
+            select = ', '.join(map(quote, columns)) if columns else '*'
+        query = 'SELECT %s FROM %s' % (select, quote(self.source.table))
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        return query, tuple(self.args)
+
+    def relation(self, term):
+        """ The columns (None for all of them) and the conditions of the
+        rows of a relation term. """
+        label = _label(term)
+        if label == 'Array':
+            self.use_table(term)
+            return None, []
+        elif label == 'Index':
+            rel, key = term.args
+            columns, where = self.relation(rel)
+            if type(key) is ATerm:
+                if columns is not None and key.label not in columns:
+                    raise NotPushable("no column %s" % key.label)
+                return [key.label], where
+            return columns, where + [self.visit(key)]
+        raise NotPushable(term)
+
+    def use_table(self, term):
+        obj = self.operands.get(term.annotation.meta[0].label)
+        source = getattr(obj, 'data', None)
+        if not isinstance(source, SqliteSource) or source.table is None:
+            raise NotPushable("not a SQLite table")
+        if self.source is not None and source is not self.source:
+            raise NotPushable("more than one table")
+        self.source = source
+
+    # Predicates
+    # ----------
+
+    def AAppl(self, term):
+        label = _label(term)
+        if label == 'Index':
+            columns, where = self.relation(term)
+            if where or columns is None:
+                raise NotPushable(term)
+            return quote(columns[0])
+        elif label == 'Ne':
+            # NULL != x is NULL in SQL, but NaN != x holds
+            left, right = self.visit(term.args)
+            return 'coalesce(%s != %s, 1)' % (left, right)
+        elif label in COMPARISONS:
+            left, right = self.visit(term.args)
+            return '(%s %s %s)' % (left, COMPARISONS[label], right)
+        elif label in CONNECTIVES:
+            left, right = self.visit(term.args)
+            return '(%s %s %s)' % (left, CONNECTIVES[label], right)
+        elif label == 'Invert':
+            # A NULL predicate is false, so its negation holds
+            return '(NOT coalesce(%s, 0))' % self.visit(term.args[0])
+        elif label == 'Arithmetic' and term.args[0].label in ARITHMETIC:
+            left, right = self.visit(term.args[1:])
+            return '(%s %s %s)' % (left, ARITHMETIC[term.args[0].label],
+                                   right)
+        raise NotPushable(term)
+
+    def AInt(self, term):
+        self.args.append(term.n)
+        return '?'
+
+    AFloat = AInt
+
+    def ATerm(self, term):
+        # A string constant
+        self.args.append(term.label)
+        return '?'
+
+    def Unknown(self, term):
+        raise NotPushable(term)
+
+def pushdown(term, operands):
+    """
+    Run a blaze expression over a table of a SQLite database in SQLite,
+    out of its ATerm graph (see BlazeVisitor) and its operands by id.
+
+    Returns a scalar for reductions, a carray for a column, or a ctable
+    for rows.  Raises NotPushable if the expression can not be
+    translated into SQL (see `SqlTranslator`), and ValueError for
+    minima and maxima of no rows (like NumPy).  Reductions of columns
+    with NULLs are NaN.
+    """
+    translator = SqlTranslator(operands)
+    query, args = translator.translate(term)
+    source = translator.source
+    label = _label(term)
+    if label in AGGREGATES:
+        row = source.conn.execute(query, args).fetchone()
+        if label == 'Count':
+            return row[0]
+        value, nvalues, nrows = row
+        if nvalues < nrows:
+            # NULLs, which are NaN
+            return np.nan
+        elif nrows == 0:
+            if label in NO_IDENTITY:
+                raise ValueError("zero-size array to reduction operation "
+                                 "%s which has no identity"
+                                 % NO_IDENTITY[label])
+            return 0
+        return value
+    desc = source.read_desc(query, args)
+    return collect(desc.asstream(), desc.names,
+                   column_types(source.dshape, desc.names))
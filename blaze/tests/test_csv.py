@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from blaze.params import params
+from blaze.sources.csvfile import load_csv, infer_dtype, split_ranges, \
+    parse_block
+
+TEST_CSV = os.path.join(os.path.dirname(__file__), 'test.csv')
+
+def test_infer_dtype():
+    dtype = infer_dtype(TEST_CSV, delimiter='\t')
+    assert dtype.names == ('S', 'X', 'E', 'M')
+    assert all(dtype[name].kind == 'i' for name in dtype.names)
+
+def test_split_ranges():
+    ranges = list(split_ranges(TEST_CSV, blocksize=100))
+    assert ranges[0][0] == 0 and ranges[-1][1] == os.path.getsize(TEST_CSV)
+    with open(TEST_CSV, 'rb') as fd:
+        data = fd.read()
+    for start, stop in ranges:
+        assert data[stop - 1] == '\n'
+
+def test_load_csv():
+    expected = np.loadtxt(TEST_CSV, skiprows=1, dtype='i8')
+    tmpdir = tempfile.mkdtemp()
+    try:
+        dshape = 'x, Record(S=int32, X=int8, E=int8, M=int8)'
+        source = load_csv(TEST_CSV, dshape,
+                          params(storage=os.path.join(tmpdir, 'test')),
+                          delimiter='\t', blocksize=100, nprocs=2)
+        assert source.ca.dtype['X'] == np.int8
+        for i, name in enumerate(['S', 'X', 'E', 'M']):
+            assert (source.ca[name][:] == expected[:, i]).all()
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_parse_block_refuses_lossy_fields():
+    dtype = np.dtype([('a', 'i8'), ('b', 'f8')])
+    block = parse_block('1,2.5\n3,4\n', dtype)
+    assert block['a'].tolist() == [1, 3]
+    for text, dtype in [('1,2.5\n2.7,4\n', dtype),
+                        ('1,abc\n2,abcd\n', np.dtype([('a', 'i8'),
+                                                      ('s', 'S3')]))]:
+        try:
+            parse_block(text, dtype)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("%r was parsed" % text)
+
+def test_infer_dtype_samples_whole_file():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'wide.csv')
+        with open(filename, 'wb') as fd:
+            fd.write('a,s\n')
+            for i in xrange(10000):
+                # The strings widen after the first lines
+                fd.write('%d,%s\n' % (i, 'x' * (2 if i < 5000 else 50)))
+        dtype = infer_dtype(filename)
+        assert dtype['s'].itemsize >= 50
+        storage = os.path.join(tmpdir, 'wide')
+        source = load_csv(filename, params=params(storage=storage),
+                          blocksize=1000, nprocs=1)
+        assert len(source.ca) == 10000
+        assert source.ca['s'][9000] == 'x' * 50
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_load_csv_removes_partial_storage():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'bad.csv')
+        with open(filename, 'wb') as fd:
+            fd.write('a,s\n')
+            for i in xrange(1000):
+                fd.write('%d,%s\n' % (i, i if i < 999 else 'abc'))
+        storage = os.path.join(tmpdir, 'bad')
+        try:
+            load_csv(filename, 'x, int64', params(storage=storage),
+                     blocksize=100, nprocs=1)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("the last row was loaded")
+        assert not os.path.exists(storage)
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,29 @@
+import os
+import mmap
+import tempfile
+
+import numpy as np
+from blaze.datashape import dshape
+from blaze.sources.canonical import FileSource
+
+def test_file_source():
+    fd, fname = tempfile.mkstemp()
+    os.close(fd)
+    data = np.arange(100000.)
+    data.tofile(fname)
+    try:
+        source = FileSource(fname, 'rb+', dshape('x, float64'))
+        view = source.read(8, 16)
+        assert isinstance(view, memoryview)
+        assert (np.asarray(view).view('f8') == [1., 2.]).all()
+
+        source.write(0, np.array([42.]).tostring())
+        assert np.fromfile(fname, 'f8', 1)[0] == 42.
+
+        desc = source.read_desc()
+        assert desc.chunklen * desc.itemsize % mmap.PAGESIZE == 0
+        chunks = [np.asarray(chunk) for chunk in desc.asstream()]
+        assert sum(map(len, chunks)) == len(data)
+        assert (np.concatenate(chunks)[1:] == data[1:]).all()
+    finally:
+        os.remove(fname)
@@ -0,0 +1,83 @@
+import socket
+import threading
+import time
+
+import numpy as np
+from blaze import carray
+from blaze.carray.ctable import ctable
+from blaze.datashape import dshape
+from blaze.sources.canonical import SocketSource
+
+def serve(data, nsends=1):
+    """ Serve `data` to the first client of a local TCP server, split
+    into `nsends` sends.  Returns the port of the server. """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    def send():
+        conn, _ = server.accept()
+        try:
+            step = -(-len(data) // nsends)
+            for i in xrange(0, len(data), step):
+                conn.sendall(data[i:i+step])
+        except socket.error:
+            # The client went away
+            pass
+        finally:
+            conn.close()
+            server.close()
+    sender = threading.Thread(target=send)
+    sender.daemon = True
+    sender.start()
+    return server.getsockname()[1]
+
+def test_socket_source_carray():
+    data = np.arange(100003.)
+    port = serve(data.tostring(), nsends=7)
+    source = SocketSource('127.0.0.1', port, dshape=dshape('x, float64'),
+                          batchlen=1000, nbuffers=3)
+    target = carray.carray(np.empty(0, dtype='f8'))
+    assert source.append_to(target) == len(data)
+    assert (target[:] == data).all()
+
+def test_socket_source_ctable():
+    rows = np.array([(i, i * 2.) for i in xrange(5000)],
+                    dtype=[('a', 'i4'), ('b', 'f8')])
+    port = serve(rows.tostring())
+    ds = dshape('x, Record(a=int32, b=float64)')
+    try:
+        SocketSource('127.0.0.1', port, dshape=ds)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("the layout of a Record is unordered")
+    source = SocketSource('127.0.0.1', port, dshape=ds,
+                          dtype=[('a', 'i4'), ('b', 'f8')], batchlen=512)
+    target = ctable(np.empty(0, dtype=rows.dtype))
+    for batch in source.read_desc().asstream():
+        target.append(batch)
+    assert len(target) == len(rows)
+    assert (target['b'][:] == rows['b']).all()
+
+def test_socket_source_backpressure():
+    data = np.arange(2**20, dtype='u1')
+    port = serve(data.tostring())
+    source = SocketSource('127.0.0.1', port, batchlen=1024, nbuffers=2)
+    batches = source.read()
+    first = batches.next().copy()
+    time.sleep(0.2)
+    # while the consumer holds a buffer, the reader can only fill the other
+    assert source.full.qsize() <= 1
+    rest = np.concatenate([batch.copy() for batch in batches])
+    assert (np.concatenate([first, rest]) == data).all()
+
+def test_socket_source_early_exit():
+    port = serve(np.arange(2**20, dtype='u1').tostring())
+    source = SocketSource('127.0.0.1', port, batchlen=1024, nbuffers=2)
+    batches = source.read()
+    batches.next()
+    reader = source.reader
+    batches.close()
+    # the reader thread and the connection are released
+    assert source.socket is None
+    assert not reader.is_alive()
@@ -0,0 +1,150 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from nose.tools import assert_raises
+from blaze import carray
+from blaze.carray.ctable import ctable
+from blaze.params import params
+from blaze.sources.sql import SqliteSource
+
+def make_source(nrows, **kwargs):
+    source = SqliteSource(**kwargs)
+    source.conn.execute('CREATE TABLE t (a INTEGER, b REAL, c TEXT)')
+    source.conn.executemany('INSERT INTO t VALUES (?, ?, ?)',
+                            ((i, i / 2., 'row%d' % i)
+                             for i in xrange(nrows)))
+    return source
+
+def test_sqlite_read():
+    source = make_source(1000)
+    chunks = [[column.copy() for column in chunk]
+              for chunk in source.read('SELECT a, b FROM t', chunklen=300)]
+    assert [len(chunk[0]) for chunk in chunks] == [300, 300, 300, 100]
+    a = np.concatenate([chunk[0] for chunk in chunks])
+    b = np.concatenate([chunk[1] for chunk in chunks])
+    assert a.dtype == np.int64 and b.dtype == np.float64
+    assert (a == np.arange(1000)).all() and (b == a / 2.).all()
+
+def test_sqlite_read_desc():
+    source = make_source(10, dshape='x, Record(a=int32, c=string)')
+    desc = source.read_desc('SELECT c, a FROM t WHERE a >= ?', (5,))
+    assert desc.names == ['c', 'a']
+    chunks = list(desc.asstream())
+    assert len(chunks) == 1
+    c, a = chunks[0]
+    assert a.dtype == np.int32 and list(a) == range(5, 10)
+    assert list(c) == ['row%d' % i for i in xrange(5, 10)]
+
+def test_sqlite_append_to():
+    source = make_source(1000)
+    table = ctable(np.empty(0, dtype=[('a', 'i8'), ('b', 'f8')]))
+    assert source.append_to(table, 'SELECT a, b FROM t', chunklen=128) == 1000
+    assert (table['a'][:] == np.arange(1000)).all()
+    column = carray.carray(np.empty(0, dtype='f8'))
+    assert source.append_to(column, 'SELECT b FROM t', chunklen=128) == 1000
+    assert column.sum() == np.arange(1000).sum() / 2.
+
+def test_sqlite_pushdown():
+    from blaze.toplevel import open
+    tmpdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        os.chdir(tmpdir)
+        make_source(1000, params=params(storage='test.db')).conn.commit()
+        t = open('sqlite://test.db?table=t')
+
+        assert t['a'].sum().eval() == np.arange(1000).sum()
+        assert t[t['a'] < 10].count().eval() == 10
+        assert t[(t['a'] >= 10) & (t['b'] < 10)]['a'].max().eval() == 19
+        assert t[(t['a'] < 10) | (t['c'] == 'row999')].count().eval() == 11
+
+        a = t[~(t['a'] * 2 > 20)]['a'].eval()
+        assert list(a) == range(11)
+        rows = t[t['a'] + 1 == 3].eval()
+        assert rows.names == ['a', 'b', 'c'] and len(rows) == 1
+        assert rows['c'][0] == 'row2'
+
+        # reductions of no rows
+        assert t[t['a'] < 0]['b'].sum().eval() == 0
+        assert_raises(ValueError, t[t['a'] < 0]['b'].min().eval)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir)
+
+def test_sqlite_translate():
+    from blaze.table import NDTable
+    from blaze.plan import BlazeVisitor
+    from blaze.sources.sql import SqlTranslator, NotPushable
+    source = make_source(0)
+    source.table = 't'
+    t = NDTable(source, dshape='x, Record(a=int64, b=float64, c=string)')
+
+    def translate(expr):
+        visitor = BlazeVisitor()
+        term = visitor.visit(expr)
+        operands = dict((id(op), op) for op in visitor.operands)
+        return SqlTranslator(operands).translate(term)
+
+    assert translate(t[t['b'] > 1.5]['a'].min()) == \
+        ('SELECT min("a"), count("a"), count(*) FROM "t" WHERE ("b" > ?)',
+         (1.5,))
+    assert translate(t[~(t['a'] != 2)].count()) == \
+        ('SELECT count(*) FROM "t" '
+         'WHERE (NOT coalesce(coalesce("a" != ?, 1), 0))', (2,))
+    assert_raises(NotPushable, translate, t.sum())
+
+def test_sqlite_widen():
+    source = SqliteSource()
+    source.conn.execute('CREATE TABLE t (a INTEGER, b INTEGER)')
+    source.conn.executemany('INSERT INTO t VALUES (?, ?)',
+                            [(1, 1), (2, 2), (None, 3.5), (4, 'x')])
+    chunks = [[column.copy() for column in chunk]
+              for chunk in source.read('SELECT a, b FROM t', chunklen=2)]
+    (a0, b0), (a1, b1) = chunks
+    assert a0.dtype == b0.dtype == np.int64
+    # a NULL and a REAL widen integers to floats, a TEXT to objects
+    assert a1.dtype == np.float64 and np.isnan(a1[0]) and a1[1] == 4
+    assert b1.dtype == object and list(b1) == [3.5, 'x']
+    chunks = source.read('SELECT a FROM t', dshape='x, int64', chunklen=2)
+    assert_raises(ValueError, list, chunks)
+
+def test_sqlite_nulls():
+    from blaze.toplevel import open
+    tmpdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        os.chdir(tmpdir)
+        source = SqliteSource(params=params(storage='test.db'))
+        source.conn.execute('CREATE TABLE t (i INTEGER PRIMARY KEY, '
+                            'a INTEGER, b INTEGER NOT NULL, c TEXT, d BLOB)')
+        source.conn.executemany('INSERT INTO t VALUES (?, ?, ?, ?, ?)',
+                                [(1, 1, 1, 'x', buffer('\x01')),
+                                 (2, None, 2, None, buffer('\x02')),
+                                 (3, 3, 3, 'z', buffer('\x03'))])
+        source.conn.commit()
+        t = open('sqlite://test.db?table=t')
+
+        # nullable integer columns are floats, with NULLs as NaN
+        a = t['a'].eval()
+        assert a.dtype == np.float64 and np.isnan(a[1]) and a[2] == 3
+        assert t['b'].eval().dtype == t['i'].eval().dtype == np.int64
+
+        # NULLs compare and reduce like NaN
+        assert np.isnan(t['a'].sum().eval())
+        assert np.isnan(t['a'].max().eval())
+        assert t['b'].sum().eval() == 6
+        assert t[t['a'] != 1].count().eval() == 2
+        assert t[~(t['a'] > 1)].count().eval() == 2
+        assert t[t['a'] == 1].count().eval() == 1
+        assert list(t[t['a'] != 3]['b'].eval()) == [1, 2]
+
+        # strings can not hold NULLs, BLOBs are bytes
+        assert_raises(ValueError, t['c'].eval)
+        assert list(t[t['i'] != 2]['c'].eval()) == [u'x', u'z']
+        d = t['d'].eval()
+        assert d.dtype.kind == 'S' and list(d) == ['\x01', '\x02', '\x03']
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir)
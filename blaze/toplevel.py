@@ -1,10 +1,11 @@
 import os, os.path
 
-from urlparse import urlparse
+from urlparse import urlparse, parse_qs
 from params import params, to_cparams
 from params import params as _params
 from sources.sql import SqliteSource
 from sources.chunked import CArraySource, CTableSource
+from sources.csvfile import load_csv
 
 from table import NDArray, Array, NDTable, Table
 from blaze.datashape.coretypes import from_numpy, to_numpy, TypeVar, Fixed
@@ -19,6 +20,8 @@ def open(uri=None, mode='a'):
     ----------
     uri : str
         Specifies the URI for the Blaze object.  It can be a regular file too.
+        A table of a SQLite database is opened with
+        ``sqlite://path/to/data.db?table=name``.
 
     mode : the open mode (string)
         Specifies the mode in which the object is opened.  The supported
@@ -35,6 +38,7 @@ def open(uri=None, mode='a'):
     """
     ARRAY = 1
     TABLE = 2
+    dshape = None
 
     if uri is None:
         source = CArraySource()
@@ -54,9 +58,13 @@ def open(uri=None, mode='a'):
             structure = TABLE
 
         elif uri.scheme == 'sqlite':
-            path = os.path.join(uri.netloc, uri.path[1:])
-            parms = params(storage=path or None)
+            path = os.path.join(uri.netloc, uri.path[1:]).rstrip('/')
+            # The table the expressions refer to, as in
+            # sqlite://data.db?table=name
+            table = parse_qs(uri.query).get('table', [None])[0]
+            parms = params(storage=path or None, table=table)
             source = SqliteSource(params=parms)
+            dshape = source.dshape
             structure = TABLE
 
         else:
@@ -70,7 +78,7 @@ def open(uri=None, mode='a'):
     if structure == ARRAY:
         return Array(source)
     elif structure == TABLE:
-        return NDTable(source)
+        return NDTable(source, dshape=dshape)
 
 # These are like NumPy equivalent except that they can allocate
 # larger than memory.
@@ -173,6 +181,39 @@ def fromiter(iterable, dshape, params=None):
         source = CArraySource(ica, params=params)
         return Array(source)
 
-def loadtxt(filetxt, storage):
-    """ Convert txt file into Blaze native format """
-    Array(np.loadtxt(filetxt), params=params(storage=storage))
+def loadtxt(filetxt, storage, dshape=None, delimiter=None, header=False,
+            nprocs=None, progress=None):
+    """ Convert txt file into Blaze native format.
+
+    The file is parsed in blocks by several processes, and the blocks
+    are appended to the chunked array or table persisted in `storage`,
+    so files larger than memory can be loaded.
+
+    Parameters
+    ----------
+    filetxt : str
+        The text file, with a row per line.
+    storage : str
+        The directory where the Blaze object is persisted.
+    dshape : str, blaze.dshape instance
+        The datashape of the rows, inferred from the file if not given.
+    delimiter : str
+        The separator of the fields (None for any whitespace).
+    header : bool
+        Whether the first line has the names of the columns.
+    nprocs : int
+        The number of processes parsing the file (the number of cores by
+        default).
+    progress : callable
+        Called as ``progress(rows, seconds)`` as the rows are loaded.
+
+    Returns
+    -------
+    out : an Array (files with a single column) or Table object.
+
+    """
+    source = load_csv(filetxt, dshape, params(storage=storage), delimiter,
+                      header, nprocs=nprocs, progress=progress)
+    if isinstance(source, CArraySource):
+        return Array(source)
+    return NDTable(source)